@@ -0,0 +1,47 @@
+"""
+Run the route analysis for a folder of athlete exports.
+
+    python batch.py exports/ --output-dir runs/ --workers 4
+    python batch.py exports/ --athletes alice bob --retries 2 --offline
+
+Each subfolder of exports/ is one athlete's unzipped Strava export
+(activities.csv + activities/); see src/batch.py.
+"""
+import argparse
+import os
+import sys
+
+from src.batch import run_athletes
+from src.pipeline import CLUSTER_EPS_M
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the route analysis for many athletes.")
+    parser.add_argument("exports_dir", help="folder with one export folder per athlete")
+    parser.add_argument("--output-dir", default="runs", help="root of the per-athlete output folders")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("GPS_WORKERS", "1")),
+                        help="athletes processed in parallel")
+    parser.add_argument("--retries", type=int, default=1, help="extra attempts for a failed athlete")
+    parser.add_argument("--athletes", nargs="+", default=None, help="only these athletes (folder names)")
+    parser.add_argument("--metric", choices=sorted(CLUSTER_EPS_M), default=os.environ.get("ROUTE_METRIC", "frechet"))
+    parser.add_argument("--offline", action="store_true", default=os.environ.get("GEOCODE_OFFLINE", "0") == "1",
+                        help="name routes from the gazetteer, never the network")
+    parser.add_argument("--gazetteer", default=os.environ.get("GAZETTEER_PATH", "data/gazetteer.csv"),
+                        help="CSV with name,lat,lon for offline geocoding (shared, read-only)")
+    parser.add_argument("--plots", action="store_true", help="render each athlete's charts to <athlete>/graphs")
+    args = parser.parse_args(argv)
+
+    summary = run_athletes(
+        args.exports_dir,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        retries=args.retries,
+        athletes=args.athletes,
+        plots=args.plots,
+        route_metric=args.metric,
+        geocode_offline=args.offline,
+        gazetteer_path=args.gazetteer,
+    )
+    return 0 if (summary["Status"] == "ok").all() else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
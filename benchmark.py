@@ -0,0 +1,236 @@
+"""
+Benchmark the pipeline steps on a synthetic Strava export.
+
+    python benchmark.py --scale 1k
+    python benchmark.py --scale 10k --workers 8 --report bench_10k.json
+    python benchmark.py --scale 1k --compare bench_1k_before.json
+
+The export is generated once per scale/seed (under data/cache/bench) and
+reused, and the JSON report is written next to it unless --report says
+otherwise. Every step records wall time, CPU time, the process's peak RSS
+and the number of items processed (--trace-memory adds the peak memory
+allocated within the step, at a large cost in speed); the JSON report also scores clustering
+against the routes the data was generated from. With --compare, steps
+that got slower than --tolerance are listed.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from src.instrument import _children_cpu, _max_rss_mb
+from src.synthetic import GENERATOR_VERSION, SCALES, generate_export
+
+# Steps that can be left out with --skip (gpxpy parsing is slow at scale;
+# without filter_tracks the raw points are vectorized)
+STEPS = ("load_strava", "load_gps_from_folder", "load_tracks_from_folder", "filter_tracks", "vectorize_tracks",
+         "cluster", "get_route_centroids", "join_routes", "compute_track_metrics", "compute_route_stats")
+
+def measure(name, func, items, trace_memory=False):
+    """
+    Run func() once and record wall/CPU time (including worker processes)
+    and peak traced memory.
+
+    Args:
+        items: callable(result) -> number of items processed, for rates
+
+    Returns:
+        (result, record dict)
+    """
+    if trace_memory:
+        tracemalloc.start()
+    cpu_children = _children_cpu()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    result = func()
+
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    cpu += _children_cpu() - cpu_children
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    n_items = int(items(result))
+    record = {
+        "step": name,
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "peak_traced_mb": round(peak / 2 ** 20, 2) if peak is not None else None,
+        "max_rss_mb": _max_rss_mb(),
+        "items": n_items,
+        "items_per_s": round(n_items / wall, 1) if wall > 0 else None,
+    }
+    memory = f", peak {record['peak_traced_mb']} MB" if peak is not None else ""
+    print(f"⏱️ {name:<24} {wall:8.3f}s wall {cpu:8.3f}s cpu{memory}, {n_items} items")
+    return result, record
+
+def run_benchmarks(export, workers=1, metric="frechet", skip=(), trace_memory=False):
+    """Time every step of the pipeline on a generated export."""
+    from src.clean_data import INPUT_COLUMNS, clean
+    from src.clustering import cluster_routes, cluster_routes_by_similarity, fit_route_frame, route_descriptors
+    from src.join import join_routes
+    from src.load_gps import get_route_centroids, load_gps_from_folder, load_tracks_from_folder, vectorize_tracks
+    from src.pipeline import CLUSTER_EPS_M
+    from src.route_analysis import compute_route_stats
+    from src.store import read_activities_csv
+    from src.track_filter import filter_tracks
+    from src.track_metrics import compute_track_metrics
+
+    records = []
+
+    def step(name, func, items):
+        result, record = measure(name, func, items, trace_memory)
+        records.append(record)
+        return result
+
+    # The CSV is parsed directly: the Parquet store would only measure a cache hit
+    df = step("load_strava", lambda: read_activities_csv(export["csv_path"])[INPUT_COLUMNS], len)
+    if "load_gps_from_folder" not in skip:
+        step("load_gps_from_folder", lambda: load_gps_from_folder(export["gps_folder"]), len)
+    tracks = step("load_tracks_from_folder",
+                  lambda: load_tracks_from_folder(export["gps_folder"], workers=workers), len)
+    shapes = tracks
+    if "filter_tracks" not in skip:
+        tracks, shapes, _ = step("filter_tracks", lambda: filter_tracks(tracks),
+                                 lambda result: result[0].n_points)
+    ids, vectors = step("vectorize_tracks",
+                        lambda: vectorize_tracks(shapes, n_points=100, workers=workers, method="distance"),
+                        lambda result: len(result[0]))
+
+    eps = CLUSTER_EPS_M[metric][0]
+    def cluster():
+        frame = fit_route_frame(vectors)
+        if metric == "frechet":
+            return cluster_routes_by_similarity(vectors, frame, [eps])[eps]
+        return cluster_routes(route_descriptors(vectors, frame), [eps])[eps]
+    labels = step("cluster", cluster, len)
+    route_map = dict(zip(ids, labels))
+
+    step("get_route_centroids", lambda: get_route_centroids(tracks, ids, labels), len)
+    df_joined = step("join_routes", lambda: join_routes(clean(df), route_map), len)
+
+    df_for_stats = df_joined.dropna(subset=["GPS_RouteID"])
+    df_for_stats = df_for_stats[df_for_stats["GPS_RouteID"] != -1].copy()
+    df_for_stats["RouteID"] = df_for_stats["GPS_RouteID"].astype(int)
+    run_tracks = tracks.subset(df_for_stats["GPS_Filename"].unique())
+    metrics, _ = step("compute_track_metrics", lambda: compute_track_metrics(run_tracks),
+                      lambda result: run_tracks.n_points)
+    df_for_stats = df_for_stats.merge(metrics, on="GPS_Filename", how="left")
+    step("compute_route_stats", lambda: compute_route_stats(df_for_stats), len)
+
+    return records, score_clusters(export["truth_path"], ids, labels)
+
+def score_clusters(truth_path, ids, labels):
+    """How well the clusters recover the routes the data was generated from."""
+    from sklearn.metrics import adjusted_rand_score
+
+    truth = pd.read_csv(truth_path).set_index("filename")["route"]
+    true_routes = truth.reindex(ids).to_numpy()
+    labels = np.asarray(labels)
+    return {
+        "n_tracks": len(ids),
+        "n_true_routes": int(pd.Series(true_routes).nunique()),
+        "n_clusters": int(len(set(labels)) - (1 if -1 in labels else 0)),
+        "n_noise": int((labels == -1).sum()),
+        "adjusted_rand_index": round(float(adjusted_rand_score(true_routes, labels)), 4),
+    }
+
+def compare_reports(baseline, records, tolerance):
+    """Print per-step wall time ratios against a previous report; return the regressions."""
+    before = {r["step"]: r for r in baseline["steps"]}
+    regressions = []
+    print(f"\n{'step':<24} {'before':>9} {'after':>9} {'ratio':>7}")
+    for record in records:
+        old = before.get(record["step"])
+        if old is None or not old["wall_s"]:
+            continue
+        ratio = record["wall_s"] / old["wall_s"]
+        flag = " ⚠️" if ratio > 1 + tolerance else ""
+        print(f"{record['step']:<24} {old['wall_s']:>8.3f}s {record['wall_s']:>8.3f}s {ratio:>6.2f}x{flag}")
+        if flag:
+            regressions.append(record["step"])
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data.")
+    parser.add_argument("--scale", choices=sorted(SCALES, key=SCALES.get), default="1k")
+    parser.add_argument("--activities", type=int, default=None, help="overrides --scale")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default="data/cache/bench", help="where exports are generated")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--metric", choices=("frechet", "descriptor"), default="frechet")
+    parser.add_argument("--skip", nargs="+", choices=STEPS, default=[], help="steps to leave out")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record peak memory per step with tracemalloc (slows parsing down many times)")
+    parser.add_argument("--report", default=None,
+                        help="JSON report path (default: <data-dir>/bench_<scale>.json)")
+    parser.add_argument("--compare", default=None, help="previous report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown flagged by --compare")
+    args = parser.parse_args(argv)
+
+    n_activities = args.activities or SCALES[args.scale]
+    label = args.scale if args.activities is None else str(n_activities)
+    export_dir = os.path.join(args.data_dir, f"{label}-seed{args.seed}-v{GENERATOR_VERSION}")
+    if os.path.exists(os.path.join(export_dir, "routes_truth.csv")):
+        truth = pd.read_csv(os.path.join(export_dir, "routes_truth.csv"))
+        export = {
+            "csv_path": os.path.join(export_dir, "activities.csv"),
+            "gps_folder": os.path.join(export_dir, "activities"),
+            "truth_path": os.path.join(export_dir, "routes_truth.csv"),
+            "n_activities": n_activities, "n_routes": int(truth["route"].nunique()), "n_points": None,
+        }
+        print(f"♻️ Reusing synthetic export in {export_dir}")
+    else:
+        started = time.perf_counter()
+        export = generate_export(export_dir, n_activities, seed=args.seed, workers=args.workers)
+        print(f"   ({time.perf_counter() - started:.1f}s)")
+
+    records, quality = run_benchmarks(export, workers=args.workers, metric=args.metric, skip=set(args.skip),
+                                      trace_memory=args.trace_memory)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "scale": label,
+        "seed": args.seed,
+        "settings": {"workers": args.workers, "metric": args.metric, "trace_memory": args.trace_memory},
+        "dataset": {k: v for k, v in export.items() if k.startswith("n_")},
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "steps": records,
+        "total_wall_s": round(sum(r["wall_s"] for r in records), 4),
+        "clustering": quality,
+    }
+    print(f"\n🎯 Clustering: {quality['n_clusters']} clusters for {quality['n_true_routes']} routes, "
+          f"ARI {quality['adjusted_rand_index']}")
+
+    report_path = args.report or os.path.join(args.data_dir, f"bench_{label}.json")
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Benchmark report saved to: {report_path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare_reports(json.load(f), records, args.tolerance)
+        if regressions:
+            print(f"\n⚠️ Slower than baseline: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,229 +1,164 @@
-from src.load_data import load_strava
-from src.clean_data import clean
-from src.route_analysis import compute_route_stats
-from src.plots import plot_fastest_routes, plot_hardest_routes, plot_most_consistent_routes
-from src.load_gps import load_gps_from_folder, resample_track, vectorize_gps_track
-
-import numpy as np
-from sklearn.cluster import DBSCAN
-import pandas as pd
-
-# --------------------------------------------------------
-# 1. Load + clean the CSV data
-# --------------------------------------------------------
-df = load_strava()
-df_clean = clean(df)
-
-# --------------------------------------------------------
-# 2. Load and cluster GPS routes
-# --------------------------------------------------------
-gps_raw = load_gps_from_folder("data/activities/activities")
-print("GPS files loaded:", len(gps_raw))
-
-if len(gps_raw) == 0:
-    raise ValueError("No GPS tracks found! Check the 'data/activities' folder and GPX files.")
-
-vectors = []
-ids = []
-
-for filename, gpx in gps_raw.items():
-    try:
-        if not gpx.tracks:
+"""
+Command-line entry point for the route analysis pipeline.
+
+    python main.py                      # every stage
+    python main.py stats export         # only what these stages need
+    python main.py --workers 8 --full-recluster
+    python main.py --chunked --memory-budget 2048   # exports too large for memory
+    python main.py heatmap --heatmap-zoom 17        # only the run heatmap tiles
+    python main.py --match new_run.gpx --match-fast # which known route is this?
+
+Defaults come from the environment variables the script has always read
+(GPS_WORKERS, FULL_RECLUSTER, ROUTE_METRIC, GEOCODE_OFFLINE,
+GAZETTEER_PATH), so existing invocations keep working.
+"""
+import argparse
+import os
+
+from src import instrument
+from src.heatmap import HEATMAP_ZOOM
+from src.pipeline import Pipeline, STAGES, CLUSTER_EPS_M
+from src.route_analysis import BLOCK_WEEKS
+from src.track_filter import MAX_SPEED_MPS, SIMPLIFY_TOLERANCE_M
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cluster Strava GPS routes and compute per-route stats.")
+    parser.add_argument("stages", nargs="*", metavar="stage",
+                        help=f"stages to run (default: all): {', '.join(STAGES)}")
+    parser.add_argument("--csv", default="data/activities.csv", help="Strava activities.csv")
+    parser.add_argument("--gps-folder", default="data/activities/activities", help="folder with GPX files")
+    parser.add_argument("--output-dir", default="data", help="where exports are written")
+    parser.add_argument("--cache-dir", default="data/cache", help="caches and saved cluster state")
+    # A process pool is only used when asked for; main() is guarded, so
+    # spawn platforms (Windows, macOS) are safe too.
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("GPS_WORKERS", "1")),
+                        help="worker processes for GPX parsing / resampling")
+    parser.add_argument("--full-recluster", action="store_true",
+                        default=os.environ.get("FULL_RECLUSTER", "0") == "1",
+                        help="ignore the saved state and cluster from scratch")
+    parser.add_argument("--metric", choices=sorted(CLUSTER_EPS_M), default=os.environ.get("ROUTE_METRIC", "frechet"),
+                        help="route similarity: frechet (direction/loop-start invariant) or descriptor")
+    parser.add_argument("--eps", type=float, nargs="+", default=None,
+                        help="clustering radii in meters, tried in order (default depends on --metric)")
+    parser.add_argument("--offline", action="store_true",
+                        default=os.environ.get("GEOCODE_OFFLINE", "0") == "1",
+                        help="name routes from the gazetteer, never the network")
+    parser.add_argument("--gazetteer", default=os.environ.get("GAZETTEER_PATH", "data/gazetteer.csv"),
+                        help="CSV with name,lat,lon for offline geocoding")
+    parser.add_argument("--plot-dir", default=None,
+                        help="write charts (summary + one per route) here without a GUI instead of showing them")
+    parser.add_argument("--plot-format", nargs="+", default=["png"], help="file formats for --plot-dir")
+    parser.add_argument("--max-speed", type=float, default=MAX_SPEED_MPS,
+                        help="m/s above which a single jumped-to point is a GPS spike (0 keeps spikes)")
+    parser.add_argument("--simplify-tolerance", type=float, default=SIMPLIFY_TOLERANCE_M,
+                        help="meters route shapes are simplified to before clustering (0 = no simplification)")
+    parser.add_argument("--as-of", default=None,
+                        help="end date of the rolling form windows, e.g. 2023-06-30 (default: latest run)")
+    parser.add_argument("--block-weeks", type=int, default=BLOCK_WEEKS, help="training block length in weeks")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="only report duplicate uploads of a run instead of leaving them out")
+    parser.add_argument("--heatmap-zoom", type=int, default=HEATMAP_ZOOM,
+                        help="web-mercator zoom of the heatmap grid (16 = ~2.4 m cells at the equator)")
+    parser.add_argument("--heatmap-format", nargs="+", choices=["png", "npy"], default=["png"],
+                        help="heatmap tile formats: png images and/or npy arrays")
+    parser.add_argument("--chunked", action="store_true",
+                        help="out-of-core mode for exports that do not fit in memory (stages are ignored)")
+    parser.add_argument("--memory-budget", type=int, default=1024, metavar="MB",
+                        help="memory --chunked sizes its batches for, on top of the libraries (~200 MB)")
+    parser.add_argument("--work-dir", default=None,
+                        help="per-batch results and resume state for --chunked (default: <cache-dir>/chunked)")
+    parser.add_argument("--match", nargs="+", default=None, metavar="GPX",
+                        help="report which known route each GPX file is, instead of running stages")
+    parser.add_argument("--match-threshold", type=float, default=None,
+                        help="route distance in meters above which a file is a new route")
+    parser.add_argument("--match-fast", action="store_true",
+                        help="rank --match candidates by Hausdorff distance: ~0.7 ms instead of ~10 ms per file, "
+                             "but a file between two routes can get the neighbouring one")
+    parser.add_argument("--timings", action="store_true",
+                        help="print wall/CPU time and item counts per stage and hot function")
+    parser.add_argument("--timings-log", default=None,
+                        help="also append every timing record to this JSON lines file")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="add peak allocated memory to the timings (tracemalloc; slows parsing down)")
+    parser.add_argument("--cprofile", default=None, help="write cProfile stats for the whole run to this file")
+    args = parser.parse_args(argv)
+    unknown = [stage for stage in args.stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s) {', '.join(unknown)}; choose from {', '.join(STAGES)}")
+    args.stages = args.stages or list(STAGES)
+    return args
+
+def match_files(pipeline, paths, threshold_m=None, fast=False):
+    """Print the known route of each GPX file (RouteID -1 = new route)."""
+    from src.load_gps import parse_gpx_track
+
+    tracks = {}
+    for path in paths:
+        track = parse_gpx_track(path)
+        if len(track["lat"]) < 2:
+            print(f"⚠️ Skipping {path}: fewer than 2 track points")
             continue
-        # Combine all points from all segments of the first track
-        coords = []
-        for segment in gpx.tracks[0].segments:
-            coords.extend([(p.latitude, p.longitude) for p in segment.points])
-        
-        if len(coords) < 2:  # Skip tracks with too few points
-            continue
-            
-        r = resample_track(coords, n_points=100)
-        v = vectorize_gps_track(r)
-        vectors.append(v)
-        ids.append(filename)
-    except Exception as e:
-        print(f"⚠️ Skipping {filename} due to error: {e}")
-        continue
-
-print(f"Successfully vectorized {len(vectors)} GPS tracks")
-
-if len(vectors) == 0:
-    raise ValueError("No valid GPS tracks were vectorized!")
-
-vectors = np.array(vectors)
-
-# FIX: Adjusted DBSCAN parameters for better clustering
-# Start with more lenient parameters to capture more routes
-labels = DBSCAN(eps=0.015, min_samples=1).fit(vectors).labels_
-
-n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
-n_noise = np.sum(labels == -1)
-print(f"DBSCAN found {n_clusters} clusters")
-print(f"Noise points: {n_noise}")
-
-# If too many noise points, try different parameters
-if n_noise / len(labels) > 0.5:
-    print("⚠️ High noise ratio detected. Retrying with more lenient parameters...")
-    labels = DBSCAN(eps=0.02, min_samples=1).fit(vectors).labels_
-    n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
-    n_noise = np.sum(labels == -1)
-    print(f"Retried: {n_clusters} clusters, {n_noise} noise points")
-
-# Make a dictionary: filename → cluster ID
-route_map = dict(zip(ids, labels))
-
-# --------------------------------------------------------
-# 2.5 Calculate route centroids and get location names
-# --------------------------------------------------------
-from src.load_gps import get_route_centroids, get_location_name
-
-route_centroids = get_route_centroids(gps_raw, ids, labels)
-
-print("\n" + "=" * 70)
-print("ROUTE CLUSTERS - GENERAL LOCATIONS")
-print("=" * 70)
-
-route_locations = {}  # Store for labeling plots later
-location_list = []  # For saving to file
-
-for cluster_id in sorted(route_centroids.keys()):
-    lat, lon = route_centroids[cluster_id]
-    location_name = get_location_name(lat, lon)
-    route_locations[cluster_id] = location_name
-    
-    output_line = f"Route {cluster_id:3d} → {location_name} ({lat:.4f}, {lon:.4f})"
-    print(output_line)
-    print(f"           📍 https://maps.google.com/?q={lat},{lon}\n")
-    location_list.append(output_line)
-
-# Save to file
-with open("data/route_locations.txt", "w", encoding="utf-8") as f:
-    f.write("=" * 70 + "\n")
-    f.write("ROUTE CLUSTERS - GENERAL LOCATIONS\n")
-    f.write("=" * 70 + "\n\n")
-    for line in location_list:
-        f.write(line + "\n")
-    f.write("\n" + "=" * 70 + "\n")
-    f.write("CLUSTER IDS AND COORDINATES\n")
-    f.write("=" * 70 + "\n\n")
-    for cluster_id in sorted(route_centroids.keys()):
-        lat, lon = route_centroids[cluster_id]
-        location_name = route_locations[cluster_id]
-        f.write(f"Route {cluster_id}: {location_name}\n")
-        f.write(f"  Latitude: {lat:.6f}\n")
-        f.write(f"  Longitude: {lon:.6f}\n")
-        f.write(f"  Maps: https://maps.google.com/?q={lat},{lon}\n\n")
-
-print("\n✅ Route locations saved to: data/route_locations.txt")
-
-# --------------------------------------------------------
-# 3. Merge GPS cluster IDs into df_clean
-# --------------------------------------------------------
-# DEBUG: Check what filenames look like
-print("\n--- GPS Filename Examples (first 5) ---")
-for fname in list(route_map.keys())[:5]:
-    print(f"  GPS: {fname}")
-
-print("\n--- Activity ID/Filename Examples (first 5) ---")
-if "Activity ID" in df_clean.columns:
-    print("Using Activity ID:")
-    for aid in df_clean["Activity ID"].head().values:
-        print(f"  CSV: {aid}")
-else:
-    print("Using Filename:")
-    for fname in df_clean["Filename"].head().values:
-        print(f"  CSV: {fname}")
-
-def get_route_id(key):
-    if key is None or (isinstance(key, float) and np.isnan(key)):
-        return np.nan
-    
-    key_str = str(key).strip()
-    
-    # Strategy 1: Try exact match (e.g., "8083971283.gpx")
-    if key_str in route_map:
-        rid = route_map[key_str]
-        return int(rid) if isinstance(rid, (int, np.integer)) else int(rid[0])
-    
-    # Strategy 2: Try with .gpx extension (e.g., Activity ID "8083971283" → "8083971283.gpx")
-    key_with_gpx = f"{key_str}.gpx"
-    if key_with_gpx in route_map:
-        rid = route_map[key_with_gpx]
-        return int(rid) if isinstance(rid, (int, np.integer)) else int(rid[0])
-    
-    # Strategy 3: Try removing path if present (e.g., "activities/8083971283.gpx" → "8083971283.gpx")
-    import os
-    key_basename = os.path.basename(key_str)
-    if key_basename in route_map:
-        rid = route_map[key_basename]
-        return int(rid) if isinstance(rid, (int, np.integer)) else int(rid[0])
-    
-    # Strategy 4: Search for Activity ID as substring in route_map keys
-    for filename, rid in route_map.items():
-        if key_str in filename:
-            return int(rid) if isinstance(rid, (int, np.integer)) else int(rid[0])
-    
-    return np.nan
-
-# Prefer Activity ID for matching, fall back to Filename
-if "Activity ID" in df_clean.columns:
-    print("\n🔍 Attempting to match using Activity ID...")
-    df_clean["GPS_RouteID"] = df_clean["Activity ID"].apply(get_route_id)
-else:
-    print("\n🔍 Attempting to match using Filename...")
-    df_clean["GPS_RouteID"] = df_clean["Filename"].apply(get_route_id)
-
-# --------------------------------------------------------
-# 4. Filter activities that did not get clustered
-# --------------------------------------------------------
-matched = df_clean["GPS_RouteID"].notna().sum()
-print(f"\n✓ Matched activities: {matched} out of {len(df_clean)}")
-
-if matched == 0:
-    print("\n⚠️ WARNING: No activities matched GPS files!")
-    print("This likely means the Activity ID/Filename format doesn't match the GPX filenames.")
-    print("\nTip: Check if your CSV has 'Activity ID' or 'Filename' column")
-    print("and ensure it matches the GPX filename format exactly.")
-
-df_clustered = df_clean.dropna(subset=["GPS_RouteID"]).copy()
-df_clustered["GPS_RouteID"] = df_clustered["GPS_RouteID"].astype(int)
-# Remove noise points (label -1 from DBSCAN)
-df_clustered = df_clustered[df_clustered["GPS_RouteID"] != -1].copy()
-
-print(f"Activities with valid GPS clusters: {len(df_clustered)} out of {len(df_clean)}")
-
-# --------------------------------------------------------
-# 5. Recompute route stats using GPS_RouteID
-# --------------------------------------------------------
-if len(df_clustered) == 0:
-    print("\n❌ No clustered activities to analyze. Exiting early.")
-    print("Check the filename matching above.")
-else:
-    # Ensure RouteID is a simple integer column
-    df_for_stats = df_clustered.copy()
-    df_for_stats["RouteID"] = df_for_stats["GPS_RouteID"].astype(int)
-    
-    print(f"\nRouteID dtype: {df_for_stats['RouteID'].dtype}")
-    print(f"Unique routes: {df_for_stats['RouteID'].nunique()}")
-    print(f"DataFrame shape: {df_for_stats.shape}")
-    print(f"Sample RouteIDs: {df_for_stats['RouteID'].head().tolist()}")
-
-    route_stats = compute_route_stats(df_for_stats)
-    print(f"\n✓ Route stats computed for {len(route_stats)} routes:")
-    print(route_stats.head())
-
-    # --------------------------------------------------------
-    # 6. Plot route performance
-    # --------------------------------------------------------
-    plot_fastest_routes(route_stats)
-    plot_hardest_routes(route_stats)
-    plot_most_consistent_routes(route_stats)
-
-    # --------------------------------------------------------
-    # 7. Export cleaned + clustered data
-    # --------------------------------------------------------
-    df_clean.to_csv("data/cleaned_strava_with_gps.csv", index=False)
-    route_stats.to_csv("data/route_stats_gps.csv", index=False)
-
-    print("✅ Export complete!")
\ No newline at end of file
+        tracks[os.path.basename(path)] = track
+
+    matches = pipeline.match(tracks, threshold_m, fast)
+    print("\n" + matches.to_string(float_format=lambda x: f"{x:.2f}"))
+    return matches
+
+def main(argv=None):
+    args = parse_args(argv)
+    pipeline = Pipeline(
+        csv_path=args.csv,
+        gps_folder=args.gps_folder,
+        output_dir=args.output_dir,
+        cache_dir=args.cache_dir,
+        workers=args.workers,
+        full_recluster=args.full_recluster,
+        route_metric=args.metric,
+        cluster_eps=args.eps,
+        geocode_offline=args.offline,
+        gazetteer_path=args.gazetteer,
+        plot_dir=args.plot_dir,
+        plot_formats=args.plot_format,
+        as_of=args.as_of,
+        block_weeks=args.block_weeks,
+        max_speed_mps=args.max_speed,
+        simplify_tolerance_m=args.simplify_tolerance,
+        heatmap_zoom=args.heatmap_zoom,
+        heatmap_formats=args.heatmap_format,
+        drop_duplicates=not args.keep_duplicates,
+    )
+    instrumenting = args.timings or args.timings_log or args.trace_memory or args.cprofile
+    if instrumenting:
+        instrument.enable(log_path=args.timings_log, trace_memory=args.trace_memory,
+                          profile_path=args.cprofile)
+    try:
+        if args.match:
+            match_files(pipeline, args.match, args.match_threshold, args.match_fast)
+        elif args.chunked:
+            from src.chunked import run_chunked
+
+            run_chunked(
+                csv_path=args.csv,
+                gps_folder=args.gps_folder,
+                output_dir=args.output_dir,
+                work_dir=args.work_dir or os.path.join(args.cache_dir, "chunked"),
+                index_path=pipeline.index_path,
+                track_cache_dir=os.path.join(args.cache_dir, "tracks"),
+                memory_budget_mb=args.memory_budget,
+                workers=args.workers,
+                eps=args.eps[0] if args.eps else None,
+                max_speed_mps=args.max_speed,
+                simplify_tolerance_m=args.simplify_tolerance,
+                as_of=args.as_of,
+                block_weeks=args.block_weeks,
+            )
+        else:
+            pipeline.run_all(args.stages)
+    finally:
+        if instrumenting:
+            records = instrument.disable()
+            print("\n" + instrument.summary_table(records))
+    return pipeline
+
+if __name__ == "__main__":
+    main()
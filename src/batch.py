@@ -0,0 +1,241 @@
+"""
+Run the pipeline for many athletes at once.
+
+Every subfolder of the exports folder that holds an activities.csv is one
+athlete's unzipped Strava export (activities.csv plus the activities/
+folder of GPX files). Athletes are run in a process pool. Each gets its
+own output folder with its exports, caches, saved cluster state and a
+run.log of everything the pipeline printed:
+
+    <output_dir>/<athlete>/cleaned_strava_with_gps.csv, route_stats_gps.csv, ...
+    <output_dir>/<athlete>/cache/
+    <output_dir>/<athlete>/run.log
+
+A failed athlete is retried up to `retries` times; the others carry on.
+The combined batch_summary.csv (one row per athlete) and
+all_route_stats.csv (every athlete's route stats) are written at the end.
+All files are written to a temporary name and renamed into place, and an
+OS lock on a file per athlete keeps a second, concurrent batch from
+working on the same athlete.
+"""
+import contextlib
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+SUMMARY_COLUMNS = ["Athlete", "Status", "Attempts", "Seconds", "Activities", "Runs_Matched", "Routes",
+                   "Output_Dir", "Error"]
+
+# Stages run per athlete; "plot" is added when charts are rendered to files
+BATCH_STAGES = ("load", "validate", "filter", "clean", "vectorize", "cluster", "index", "label", "join", "stats",
+                "heatmap", "export")
+
+LOCK_NAME = ".lock"
+
+def find_athletes(exports_dir):
+    """Sorted {athlete: export folder} for every subfolder with an activities.csv."""
+    athletes = {}
+    for name in sorted(os.listdir(exports_dir)):
+        folder = os.path.join(exports_dir, name)
+        if os.path.isfile(os.path.join(folder, "activities.csv")):
+            athletes[name] = folder
+    return athletes
+
+# Lock file descriptors this process holds, by athlete folder
+_held_locks = {}
+
+def _lock_fd(fd):
+    """Non-blocking exclusive OS lock on an open file; raises OSError if another holder has it."""
+    if os.name == "nt":
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+def _unlock_fd(fd):
+    if os.name == "nt":
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+def acquire_lock(folder):
+    """
+    Take an OS lock (flock, or msvcrt.locking on Windows) on folder/.lock
+    and write this process's ID into it for anyone looking. Returns False
+    if another process holds it. The OS drops the lock when its holder
+    dies, so a lock file left by a crashed run is simply taken over.
+    """
+    os.makedirs(folder, exist_ok=True)
+    if folder in _held_locks:
+        return False
+    fd = os.open(os.path.join(folder, LOCK_NAME), os.O_RDWR | os.O_CREAT)
+    try:
+        _lock_fd(fd)
+    except OSError:
+        os.close(fd)
+        return False
+    os.ftruncate(fd, 0)
+    os.lseek(fd, 0, os.SEEK_SET)
+    os.write(fd, str(os.getpid()).encode())
+    _held_locks[folder] = fd
+    return True
+
+def release_lock(folder):
+    """
+    Drop the lock taken by acquire_lock. The file itself stays: removing
+    it would let a process that opened it just before take a lock nobody
+    else can see.
+    """
+    fd = _held_locks.pop(folder, None)
+    if fd is None:
+        return
+    try:
+        _unlock_fd(fd)
+    finally:
+        os.close(fd)
+
+def run_athlete(job):
+    """
+    Worker: run one athlete's pipeline with its output going to run.log.
+    Never raises; failures come back as a result with Status "failed".
+    """
+    from src.pipeline import Pipeline
+
+    output_dir = job["output_dir"]
+    result = {"Athlete": job["athlete"], "Status": "failed", "Seconds": 0.0, "Output_Dir": output_dir,
+              "Error": None}
+    if not acquire_lock(output_dir):
+        result.update(Status="locked", Error="another run is processing this athlete")
+        return result
+
+    started = time.perf_counter()
+    try:
+        with open(os.path.join(output_dir, "run.log"), "a", encoding="utf-8") as log, \
+                contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            print(f"===== {time.strftime('%Y-%m-%d %H:%M:%S')} attempt {job['attempt']} =====")
+            pipeline = Pipeline(
+                csv_path=os.path.join(job["export_dir"], "activities.csv"),
+                gps_folder=os.path.join(job["export_dir"], "activities"),
+                output_dir=output_dir,
+                cache_dir=os.path.join(output_dir, "cache"),
+                plot_dir=os.path.join(output_dir, "graphs") if job["plots"] else None,
+                **job["options"],
+            )
+            try:
+                stages = BATCH_STAGES + (("plot",) if job["plots"] else ())
+                pipeline.run_all(stages)
+            except Exception:
+                traceback.print_exc()
+                raise
+        stats = pipeline.results.get("stats")
+        result.update(
+            Status="ok",
+            Activities=len(pipeline.results["join"]["joined"]),
+            Runs_Matched=len(stats["activities"]) if stats else 0,
+            Routes=len(stats["route_stats"]) if stats else 0,
+        )
+    except Exception as e:
+        result["Error"] = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+    finally:
+        result["Seconds"] = round(time.perf_counter() - started, 2)
+        release_lock(output_dir)
+    return result
+
+def _combine_route_stats(results):
+    """Every successful athlete's route stats in one table with an Athlete column."""
+    tables = []
+    for result in results:
+        path = os.path.join(result["Output_Dir"], "route_stats_gps.csv")
+        if result["Status"] == "ok" and os.path.exists(path):
+            tables.append(pd.read_csv(path).assign(Athlete=result["Athlete"]))
+    if not tables:
+        return pd.DataFrame(columns=["Athlete", "RouteID"])
+    combined = pd.concat(tables, ignore_index=True)
+    return combined[["Athlete"] + [c for c in combined.columns if c != "Athlete"]]
+
+def run_athletes(exports_dir, output_dir="runs", workers=1, retries=1, athletes=None, plots=False,
+                 **options):
+    """
+    Run the pipeline for every athlete export in exports_dir.
+
+    Args:
+        exports_dir: folder of per-athlete export folders
+        output_dir: root of the per-athlete output folders
+        workers: athletes processed in parallel (each runs single-process)
+        retries: extra attempts for an athlete whose run failed
+        athletes: only these athlete folder names (default: all found)
+        plots: also render each athlete's charts to <athlete>/graphs
+        options: further Pipeline arguments (route_metric, geocode_offline, ...)
+
+    With several workers and online geocoding, every athlete gets the same
+    SharedRateLimiter, so the whole batch stays within Nominatim's one
+    request per second instead of one per worker.
+
+    Returns:
+        DataFrame: the batch summary, one row per athlete
+    """
+    from src.store import save_output
+
+    found = find_athletes(exports_dir)
+    if athletes:
+        missing = sorted(set(athletes) - set(found))
+        if missing:
+            print(f"⚠️ No export found for: {', '.join(missing)}")
+        found = {name: folder for name, folder in found.items() if name in set(athletes)}
+    print(f"👥 {len(found)} athletes, {workers} at a time, up to {retries} retries each")
+
+    jobs = {
+        name: {"athlete": name, "export_dir": folder, "output_dir": os.path.join(output_dir, name),
+               "plots": plots, "options": options, "attempt": 0}
+        for name, folder in found.items()
+    }
+    results = {}
+    pending = list(jobs)
+    with contextlib.ExitStack() as stack:
+        if workers > 1 and not options.get("geocode_offline") and "geocode_rate_limiter" not in options:
+            from multiprocessing import Manager
+
+            from src.geocode import NOMINATIM_MIN_DELAY, SharedRateLimiter
+            options["geocode_rate_limiter"] = SharedRateLimiter(NOMINATIM_MIN_DELAY,
+                                                                stack.enter_context(Manager()))
+        while pending:
+            for name in pending:
+                jobs[name]["attempt"] += 1
+            # A fresh pool per round: a worker that crashed outright (not an
+            # exception) breaks the pool, and its athlete is simply retried
+            with ProcessPoolExecutor(max_workers=max(1, min(workers, len(pending)))) as pool:
+                futures = {pool.submit(run_athlete, jobs[name]): name for name in pending}
+                pending = []
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"Athlete": name, "Status": "failed", "Output_Dir": jobs[name]["output_dir"],
+                                  "Error": f"worker crashed: {type(e).__name__}: {e}"}
+                    result["Attempts"] = jobs[name]["attempt"]
+                    if result["Status"] == "failed" and jobs[name]["attempt"] <= retries:
+                        print(f"🔁 {name} failed ({result['Error']}), retrying")
+                        pending.append(name)
+                        continue
+                    results[name] = result
+                    icon = {"ok": "✅", "locked": "🔒"}.get(result["Status"], "❌")
+                    print(f"{icon} {name}: {result['Status']} in {result.get('Seconds', 0):.1f}s"
+                          + (f" ({result['Error']})" if result["Error"] else ""))
+
+    summary = pd.DataFrame([results[name] for name in jobs], columns=SUMMARY_COLUMNS)
+    os.makedirs(output_dir, exist_ok=True)
+    save_output(summary, os.path.join(output_dir, "batch_summary.csv"))
+    save_output(_combine_route_stats(results.values()), os.path.join(output_dir, "all_route_stats.csv"))
+    n_ok = (summary["Status"] == "ok").sum()
+    print(f"📋 {n_ok} of {len(summary)} athletes succeeded; summary saved to "
+          f"{os.path.join(output_dir, 'batch_summary.csv')}")
+    return summary
@@ -0,0 +1,309 @@
+"""
+Out-of-core mode for exports that do not fit in memory (a whole team or
+club in one activities.csv and GPX folder).
+
+    python main.py --chunked --memory-budget 2048
+
+GPX files are processed in batches sized to the memory budget: parse,
+filter, resample and per-trackpoint metrics, then everything the batch
+produced is spilled to work_dir and the points are dropped. Trackpoints
+and route vectors of different batches are never in memory together.
+
+Clustering works in bounded memory with the route index: every batch is
+first matched against the routes found so far (their representative
+tracks, Fréchet within eps). The tracks that match no route are clustered among
+themselves, as DBSCAN with min_samples=1 does, and their clusters become
+new routes. Memory grows with the number of routes, not tracks. The
+result can differ slightly from clustering everything at once: a route
+is represented by the tracks of the batch that founded it, and clusters
+from different batches are never merged.
+
+After the last batch the activities CSV is streamed in chunks through
+clean and the route join. Only the per-activity rows of clustered runs
+are kept, a few hundred bytes each, for the route stats. A run that is
+interrupted resumes after the last finished batch.
+"""
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from src.instrument import span
+
+# Peak memory per byte of GPX text while a batch goes through parse,
+# filter, resampling and metrics (measured on Strava exports)
+GPX_MEMORY_FACTOR = 3
+
+# Budget share of one GPX batch; the rest is for the route index,
+# per-activity tables and the Python process itself
+BATCH_BUDGET_SHARE = 0.5
+
+# Memory per activities.csv row while a chunk is parsed and cleaned
+ACTIVITY_ROW_BYTES = 4096
+
+PART_NAME = "batch_{:05d}.{}.csv"
+
+def plan_batches(sizes, memory_budget_mb):
+    """
+    Split files (by their sizes in bytes, in order) into consecutive
+    batches whose estimated peak memory fits the batch share of the budget.
+    A batch is closed before the file that would take it over the limit,
+    and a file larger than the limit gets a batch of its own.
+
+    Returns:
+        list of (start, stop) file positions
+    """
+    limit = max(memory_budget_mb * 2 ** 20 * BATCH_BUDGET_SHARE, 1)
+    starts, total = [], 0
+    for i, size in enumerate(np.asarray(sizes, dtype=np.int64) * GPX_MEMORY_FACTOR):
+        if not starts or total + size > limit:
+            starts.append(i)
+            total = 0
+        total += int(size)
+    stops = starts[1:] + [len(sizes)]
+    return list(zip(starts, stops))
+
+def _fingerprint(filenames, settings):
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode())
+    for filename in filenames:
+        digest.update(filename.encode() + b"\0")
+    return digest.hexdigest()
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+def _write_part(df, work_dir, batch, kind):
+    path = os.path.join(work_dir, "parts", PART_NAME.format(batch, kind))
+    df.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+def _concat_parts(work_dir, kind, out_path):
+    """Stream the per-batch CSV parts of one kind into out_path (one header)."""
+    parts = sorted(glob.glob(os.path.join(work_dir, "parts", f"*.{kind}.csv")))
+    with open(out_path + ".tmp", "w", encoding="utf-8", newline="") as out:
+        for i, part in enumerate(parts):
+            with open(part, encoding="utf-8", newline="") as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out)
+    os.replace(out_path + ".tmp", out_path)
+
+def _cluster_batch(index, ids, vectors, eps):
+    """
+    Route IDs for one batch: the nearest indexed route within eps, else a
+    new route from clustering the unmatched tracks among themselves. New
+    routes are added to the index.
+    """
+    from src.clustering import _dbscan_labels, _tracks_from_vectors, route_distance_graph, to_local_meters
+    from src.route_index import _match, add_routes
+
+    local = to_local_meters(_tracks_from_vectors(vectors), index["origin"])
+    best, _ = _match(index, local, eps)
+    labels = np.full(len(ids), -1, dtype=np.int64)
+    matched = best >= 0
+    labels[matched] = index["route_ids"][best[matched]]
+    np.add.at(index["n_tracks"], best[matched], 1)
+
+    unmatched = np.flatnonzero(~matched)
+    if len(unmatched):
+        graph = route_distance_graph(vectors[unmatched], {"origin": index["origin"]}, eps)
+        new = _dbscan_labels(graph, [eps], min_samples=1)[eps]
+        next_id = int(index["route_ids"].max()) + 1 if len(index["route_ids"]) else 0
+        labels[unmatched] = new + next_id
+        add_routes(index, [ids[i] for i in unmatched], local[unmatched], labels[unmatched])
+    return labels
+
+def _process_batch(index, gps_folder, filenames, settings, workers, track_cache_dir):
+    """Parse, filter, resample, cluster and measure one batch of GPX files."""
+    from src.load_gps import load_tracks_from_folder, track_summaries, vectorize_tracks
+    from src.route_index import empty_route_index
+    from src.track_filter import filter_tracks
+    from src.track_metrics import compute_track_metrics
+
+    tracks = load_tracks_from_folder(gps_folder, workers=workers, cache_dir=track_cache_dir, filenames=filenames)
+    cleaned, shapes, report = filter_tracks(tracks, max_speed_mps=settings["max_speed_mps"],
+                                            simplify_tolerance_m=settings["simplify_tolerance_m"])
+    del tracks
+    ids, vectors = vectorize_tracks(shapes, n_points=100, workers=workers, method=settings["resample"])
+    del shapes
+    if len(ids) == 0:
+        return index, None, None, report
+    vectors = np.asarray(vectors)
+
+    if index is None:
+        # The first batch fixes the projection origin for every later one
+        origin = vectors.reshape(-1, 2).mean(axis=0)
+        index = empty_route_index(origin, settings["eps"], settings["resample"], vectors.shape[1] // 2)
+    labels = _cluster_batch(index, ids, vectors, settings["eps"])
+
+    metrics, splits = compute_track_metrics(cleaned)
+    summaries = pd.DataFrame(track_summaries(cleaned, ids))
+    summaries.insert(0, "GPS_Filename", ids)
+    summaries.insert(1, "RouteID", labels)
+    summaries = summaries.merge(metrics, on="GPS_Filename", how="left")
+    return index, summaries, splits, report
+
+def _route_summaries(tracks):
+    """Per-route centroid and bounding box from the per-track sums of all batches."""
+    grouped = tracks.groupby("RouteID")
+    sums = grouped[["n_points", "sum_lat", "sum_lon"]].sum()
+    summaries = pd.DataFrame({
+        "n_tracks": grouped.size(),
+        "n_points": sums["n_points"],
+        "centroid_lat": sums["sum_lat"] / sums["n_points"],
+        "centroid_lon": sums["sum_lon"] / sums["n_points"],
+        "min_lat": grouped["min_lat"].min(),
+        "min_lon": grouped["min_lon"].min(),
+        "max_lat": grouped["max_lat"].max(),
+        "max_lon": grouped["max_lon"].max(),
+    })
+    return summaries.reset_index()
+
+def _finish(csv_path, work_dir, output_dir, memory_budget_mb, as_of, block_weeks):
+    """Join the activities chunk by chunk and compute the route stats."""
+    from src.clean_data import INPUT_COLUMNS, clean
+    from src.join import build_route_key_index, join_routes
+    from src.route_analysis import compute_route_form, compute_route_periods, compute_route_stats
+    from src.store import iter_activities_csv, save_output
+    from src.track_metrics import METRIC_COLUMNS
+
+    track_parts = sorted(glob.glob(os.path.join(work_dir, "parts", "*.tracks.csv")))
+    tracks = pd.concat([pd.read_csv(part) for part in track_parts], ignore_index=True)
+    route_map = dict(zip(tracks["GPS_Filename"], tracks["RouteID"]))
+    key_index = build_route_key_index(route_map)
+
+    chunk_rows = max(1_000, int(memory_budget_mb * 2 ** 20 * BATCH_BUDGET_SHARE // ACTIVITY_ROW_BYTES))
+    joined_path = os.path.join(output_dir, "cleaned_strava_with_gps.csv")
+    clustered = []
+    n_activities = 0
+    with open(joined_path + ".tmp", "w", encoding="utf-8", newline="") as out:
+        for i, chunk in enumerate(iter_activities_csv(csv_path, INPUT_COLUMNS, chunk_rows)):
+            with span("chunked.join", items=len(chunk)):
+                joined = join_routes(clean(chunk), route_map, index=key_index)
+                joined.to_csv(out, index=False, header=i == 0)
+                n_activities += len(joined)
+                keep = joined["GPS_RouteID"].notna() & (joined["GPS_RouteID"] != -1)
+                clustered.append(joined[keep])
+    os.replace(joined_path + ".tmp", joined_path)
+
+    df_for_stats = pd.concat(clustered, ignore_index=True)
+    df_for_stats["RouteID"] = df_for_stats["GPS_RouteID"].astype(int)
+    df_for_stats = df_for_stats.merge(tracks[METRIC_COLUMNS], on="GPS_Filename", how="left")
+    print(f"✓ Matched {len(df_for_stats)} of {n_activities} activities to "
+          f"{df_for_stats['RouteID'].nunique()} routes")
+
+    outputs = {
+        "route_stats_gps.csv": compute_route_stats(df_for_stats),
+        "route_form_gps.csv": compute_route_form(df_for_stats, as_of=as_of).reset_index(),
+        "route_periods_gps.csv": pd.concat([
+            compute_route_periods(df_for_stats, "season"),
+            compute_route_periods(df_for_stats, "block", block_weeks=block_weeks),
+        ], ignore_index=True),
+        "route_summaries_gps.csv": _route_summaries(tracks),
+    }
+    for filename, df in outputs.items():
+        save_output(df, os.path.join(output_dir, filename))
+    return [joined_path] + [os.path.join(output_dir, filename) for filename in outputs]
+
+def run_chunked(csv_path="data/activities.csv", gps_folder="data/activities/activities", output_dir="data",
+                work_dir="data/cache/chunked", index_path=None, track_cache_dir=None, memory_budget_mb=1024, workers=1,
+                resample_method="distance", eps=None, max_speed_mps=None, simplify_tolerance_m=None,
+                as_of=None, block_weeks=None):
+    """
+    Run the pipeline on a large export within a memory budget.
+
+    Args:
+        csv_path: Strava activities.csv (may hold many athletes)
+        gps_folder: folder with the GPX files
+        output_dir: where the exports are written (same files as the
+                    in-memory pipeline, plus route_summaries_gps.csv)
+        work_dir: per-batch results and resume state
+        index_path: also save the final route index here (for --match)
+        track_cache_dir: per-file parsed track cache (see
+                         load_tracks_from_folder), None to always parse
+        memory_budget_mb: memory to size batches and CSV chunks by, on top
+                          of the interpreter and libraries (~200 MB)
+        workers: worker processes for parsing / resampling a batch
+        eps: route distance in meters within which tracks share a route
+        max_speed_mps, simplify_tolerance_m: see filter_tracks
+        as_of, block_weeks: see compute_route_form / compute_route_periods
+
+    Returns:
+        list of the files written
+    """
+    from src.load_gps import list_gpx_files
+    from src.pipeline import CLUSTER_EPS_M
+    from src.route_analysis import BLOCK_WEEKS
+    from src.route_index import load_route_index, save_route_index
+    from src.track_filter import MAX_SPEED_MPS, SIMPLIFY_TOLERANCE_M
+
+    settings = {
+        "resample": resample_method,
+        "eps": float(eps if eps is not None else CLUSTER_EPS_M["frechet"][0]),
+        "max_speed_mps": MAX_SPEED_MPS if max_speed_mps is None else max_speed_mps,
+        "simplify_tolerance_m": SIMPLIFY_TOLERANCE_M if simplify_tolerance_m is None else simplify_tolerance_m,
+        "memory_budget_mb": memory_budget_mb,
+    }
+    filenames = list_gpx_files(gps_folder)
+    batches = plan_batches([os.path.getsize(os.path.join(gps_folder, f)) for f in filenames], memory_budget_mb)
+    fingerprint = _fingerprint(filenames, settings)
+    print(f"📦 {len(filenames)} GPX files in {len(batches)} batches (memory budget {memory_budget_mb} MB)")
+
+    # Resume after the last finished batch of an identical run. A batch's
+    # parts are written before the route index and progress.json, so the
+    # larger of their batch counts is done. Batches without tracks leave
+    # the index alone and are only counted in progress.json.
+    progress_path = os.path.join(work_dir, "progress.json")
+    state_index_path = os.path.join(work_dir, "route_index.npz")
+    done, index = 0, None
+    if os.path.exists(progress_path):
+        with open(progress_path, encoding="utf-8") as f:
+            progress = json.load(f)
+        if progress["fingerprint"] == fingerprint:
+            index = load_route_index(state_index_path)
+            indexed = int(index["batches_done"]) if index is not None and "batches_done" in index else 0
+            done = max(int(progress.get("batches_done", 0)), indexed)
+            if done:
+                print(f"♻️ Resuming after batch {done} of {len(batches)}")
+    if done == 0:
+        index = None
+        shutil.rmtree(os.path.join(work_dir, "parts"), ignore_errors=True)
+        if os.path.exists(state_index_path):
+            os.remove(state_index_path)
+    os.makedirs(os.path.join(work_dir, "parts"), exist_ok=True)
+    _write_json(progress_path, {"fingerprint": fingerprint, "batches": len(batches), "batches_done": done})
+
+    for batch, (start, stop) in enumerate(batches[done:], start=done):
+        with span("chunked.batch", items=stop - start):
+            index, summaries, splits, report = _process_batch(index, gps_folder, filenames[start:stop],
+                                                              settings, workers, track_cache_dir)
+            if summaries is not None:
+                _write_part(summaries, work_dir, batch, "tracks")
+                _write_part(splits, work_dir, batch, "splits")
+            _write_part(report, work_dir, batch, "filter")
+            if index is not None:
+                index["batches_done"] = np.array(batch + 1)
+                save_route_index(state_index_path, index)
+            _write_json(progress_path, {"fingerprint": fingerprint, "batches": len(batches), "batches_done": batch + 1})
+        n_routes = len(index["route_ids"]) if index is not None else 0
+        print(f"✅ Batch {batch + 1}/{len(batches)}: {stop - start} files, {n_routes} routes so far")
+
+    if index is None:
+        raise ValueError(f"No GPS tracks found! Check the '{gps_folder}' folder and GPX files.")
+    if index_path is not None:
+        save_route_index(index_path, index)
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = _finish(csv_path, work_dir, output_dir, memory_budget_mb, as_of, block_weeks or BLOCK_WEEKS)
+    for kind, filename in (("splits", "track_splits.csv"), ("filter", "track_filter_gps.csv")):
+        _concat_parts(work_dir, kind, os.path.join(output_dir, filename))
+        paths.append(os.path.join(output_dir, filename))
+    print("✅ Export complete!")
+    return paths
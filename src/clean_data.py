@@ -1,5 +1,22 @@
 import pandas as pd
 
+# Columns kept for GPS matching + analysis
+CLEAN_COLUMNS = [
+    "Activity ID",
+    "Filename",
+    "Activity Name",
+    "Activity Date",
+    "Distance",
+    "Moving Time",
+    "Average Speed",
+    "Elevation Gain",
+    "Average Grade Adjusted Pace",
+    "Relative Effort"
+]
+
+# Everything clean() reads from the raw activities
+INPUT_COLUMNS = ["Activity Type"] + CLEAN_COLUMNS
+
 def clean(df):
     # Keep only running activities
     df = df[df["Activity Type"] == "Run"].copy()
@@ -8,18 +25,7 @@ def clean(df):
     df["Activity Date"] = pd.to_datetime(df["Activity Date"], errors="coerce")
 
     # Keep all needed columns for GPS matching + analysis
-    df_clean = df[[
-        "Activity ID",
-        "Filename",
-        "Activity Name",
-        "Activity Date",
-        "Distance",
-        "Moving Time",
-        "Average Speed",
-        "Elevation Gain",
-        "Average Grade Adjusted Pace",
-        "Relative Effort"
-    ]].copy()
+    df_clean = df[CLEAN_COLUMNS].copy()
 
     # Remove entries missing core metrics
     df_clean = df_clean.dropna(subset=["Distance", "Average Speed"])
@@ -0,0 +1,361 @@
+import numpy as np
+
+from src.instrument import instrumented, span
+from src.load_gps import EARTH_RADIUS_M
+
+def to_local_meters(coords, origin):
+    """
+    Project (lat, lon) degrees to a flat (x, y) frame in meters around
+    origin = (lat, lon), using an equirectangular approximation. Accurate
+    to well under a percent over the size of a city.
+    """
+    coords = np.asarray(coords, dtype=float)
+    lat0 = np.radians(origin[0])
+    x = np.radians(coords[..., 1] - origin[1]) * np.cos(lat0) * EARTH_RADIUS_M
+    y = np.radians(coords[..., 0] - origin[0]) * EARTH_RADIUS_M
+    return np.stack((x, y), axis=-1)
+
+def _tracks_from_vectors(vectors):
+    """Reshape flattened route vectors back into (n_tracks, n_points, 2)."""
+    vectors = np.asarray(vectors, dtype=float)
+    return vectors.reshape(len(vectors), -1, 2)
+
+def _shape_matrix(local):
+    """Tracks centered on their own centroid, flattened, as RMS meters."""
+    n_points = local.shape[1]
+    centered = local - local.mean(axis=1, keepdims=True)
+    return centered.reshape(len(local), -1) / np.sqrt(n_points)
+
+def fit_route_frame(vectors, n_components=8):
+    """
+    Fit the local metric frame used by route_descriptors: a projection
+    origin at the mean of all points and a PCA basis for track shapes.
+
+    Args:
+        vectors: flattened resampled tracks from vectorize_tracks
+        n_components: number of PCA components kept for the shape
+
+    Returns:
+        dict: {"origin", "shape_mean", "components"} arrays
+    """
+    tracks = _tracks_from_vectors(vectors)
+    origin = tracks.reshape(-1, 2).mean(axis=0)
+    shapes = _shape_matrix(to_local_meters(tracks, origin))
+
+    shape_mean = shapes.mean(axis=0)
+    _, _, vt = np.linalg.svd(shapes - shape_mean, full_matrices=False)
+    return {
+        "origin": origin,
+        "shape_mean": shape_mean,
+        "components": vt[:n_components],
+    }
+
+def route_descriptors(vectors, frame):
+    """
+    Compress flattened route vectors into low-dimensional descriptors,
+    all in meters so Euclidean distance is meaningful:
+    start point, end point, centroid, bounding box and PCA-compressed shape.
+
+    Returns:
+        np.ndarray of shape (n_tracks, 10 + n_components)
+    """
+    local = to_local_meters(_tracks_from_vectors(vectors), frame["origin"])
+    shape = (_shape_matrix(local) - frame["shape_mean"]) @ frame["components"].T
+
+    return np.hstack([
+        local[:, 0],
+        local[:, -1],
+        local.mean(axis=1),
+        local.min(axis=1),
+        local.max(axis=1),
+        shape,
+    ])
+
+def _dbscan_labels(graph, eps_values, min_samples):
+    """DBSCAN labels for every eps on one precomputed sparse distance graph."""
+    from sklearn.cluster import DBSCAN
+
+    labels = {}
+    for eps in eps_values:
+        with span("cluster.dbscan_fit", items=graph.shape[0]):
+            labels[eps] = DBSCAN(eps=eps, min_samples=min_samples, metric="precomputed").fit(graph).labels_
+    return labels
+
+def cluster_routes(descriptors, eps_values, min_samples=1):
+    """
+    DBSCAN over route descriptors for several eps values at once.
+
+    The radius-neighbour graph is built a single time with a KD-tree at the
+    largest eps; every DBSCAN run then works on that precomputed sparse
+    graph instead of searching neighbours again.
+
+    Args:
+        descriptors: output of route_descriptors
+        eps_values: iterable of neighbourhood radii in meters
+        min_samples: DBSCAN min_samples
+
+    Returns:
+        dict: {eps: labels array}
+    """
+    from sklearn.neighbors import NearestNeighbors
+
+    eps_values = sorted(eps_values)
+    with span("cluster.neighbors_graph", items=len(descriptors)):
+        nn = NearestNeighbors(radius=eps_values[-1], algorithm="kd_tree").fit(descriptors)
+        graph = nn.radius_neighbors_graph(descriptors, mode="distance")
+
+    return _dbscan_labels(graph, eps_values, min_samples)
+
+def frechet_distances(a, b, max_distance=np.inf):
+    """
+    Discrete Fréchet distance for a batch of track pairs.
+
+    The dynamic program is filled one anti-diagonal at a time, vectorized
+    over all pairs in the batch. Every coupling path crosses one of any two
+    consecutive anti-diagonals, so once both are above max_distance the
+    pair is abandoned early.
+
+    Args:
+        a, b: arrays of shape (batch, n_points, 2) in meters
+        max_distance: pairs farther apart than this come back as inf; a
+                      scalar or one threshold per pair
+
+    Returns:
+        np.ndarray of shape (batch,)
+    """
+    batch, n, _ = a.shape
+    max_distance = np.broadcast_to(np.asarray(max_distance, dtype=float), (batch,))
+    m = b.shape[1]
+    cost = np.linalg.norm(a[:, :, None, :] - b[:, None, :, :], axis=-1)
+
+    ca = np.full((batch, n, m), np.inf)
+    ca[:, :, 0] = np.maximum.accumulate(cost[:, :, 0], axis=1)
+    ca[:, 0, :] = np.maximum.accumulate(cost[:, 0, :], axis=1)
+
+    active = np.arange(batch)
+    prev_front = np.minimum(cost[:, 0, 1], cost[:, 1, 0]) if n > 1 and m > 1 else cost[:, 0, 0]
+    for d in range(2, n + m - 1):
+        i = np.arange(max(1, d - m + 1), min(n - 1, d - 1) + 1)
+        j = d - i
+        rows = active[:, None]
+        if len(i):
+            reach = np.minimum(np.minimum(ca[rows, i - 1, j], ca[rows, i, j - 1]), ca[rows, i - 1, j - 1])
+            ca[rows, i, j] = np.maximum(cost[rows, i, j], reach)
+
+        # Minimum over the whole anti-diagonal, border cells included
+        diag_i = np.arange(max(0, d - m + 1), min(n - 1, d) + 1)
+        front = ca[rows, diag_i, d - diag_i].min(axis=1)
+        keep = np.minimum(front, prev_front) <= max_distance[active]
+        if not keep.all():
+            ca[active[~keep], n - 1, m - 1] = np.inf
+            active, front = active[keep], front[keep]
+            if len(active) == 0:
+                break
+        prev_front = front
+
+    result = ca[:, n - 1, m - 1]
+    result[result > max_distance] = np.inf
+    return result
+
+def _align_loop_starts(a, b, loop_tolerance):
+    """
+    For pairs where both tracks are closed loops, roll b so that it starts
+    at the point nearest to a's start. Other pairs are returned unchanged.
+    """
+    is_loop = lambda t: np.linalg.norm(t[:, 0] - t[:, -1], axis=1) <= loop_tolerance
+    both_loops = is_loop(a) & is_loop(b)
+    if not both_loops.any():
+        return b
+
+    m = b.shape[1]
+    shift = np.linalg.norm(b - a[:, :1], axis=-1).argmin(axis=1)
+    shift[~both_loops] = 0
+    idx = (np.arange(m)[None, :] + shift[:, None]) % m
+    return np.take_along_axis(b, idx[:, :, None], axis=1)
+
+def route_distances(a, b, max_distance=np.inf, loop_tolerance=100.0):
+    """
+    Direction- and start-point-invariant route distance for a batch of
+    pairs: the smaller Fréchet distance of b and reversed b against a, with
+    loops rotated to a common start first.
+
+    Args:
+        a, b: arrays of shape (batch, n_points, 2) in meters
+        max_distance: early-abandoning threshold(s) passed to frechet_distances
+        loop_tolerance: start-to-finish gap (meters) below which a track
+                        counts as a loop
+
+    Returns:
+        np.ndarray of shape (batch,), inf for pairs above max_distance
+    """
+    forward = frechet_distances(a, _align_loop_starts(a, b, loop_tolerance), max_distance)
+    backward = frechet_distances(a, _align_loop_starts(a, b[:, ::-1], loop_tolerance), max_distance)
+    return np.minimum(forward, backward)
+
+@instrumented("cluster.frechet_graph", items=lambda graph: graph.nnz)
+def route_distance_graph(vectors, frame, max_distance, rows=None, batch_size=256):
+    """
+    Sparse matrix of route_distances between tracks, keeping only pairs
+    within max_distance.
+
+    Candidate pairs come from a Chebyshev KD-tree over bounding boxes: the
+    Fréchet distance is never smaller than the largest bounding-box edge
+    offset, so pairs whose boxes differ by more than max_distance are
+    pruned without computing anything.
+
+    Args:
+        vectors: flattened resampled tracks from vectorize_tracks
+        frame: route frame from fit_route_frame (for the projection origin)
+        max_distance: distance threshold in meters
+        rows: indices of the tracks to compute rows for (default: all)
+        batch_size: number of pairs per vectorized Fréchet batch
+
+    Returns:
+        scipy.sparse.csr_matrix of shape (len(rows), n_tracks)
+    """
+    from scipy.sparse import csr_matrix
+    from sklearn.neighbors import NearestNeighbors
+
+    local = to_local_meters(_tracks_from_vectors(vectors), frame["origin"])
+    boxes = np.hstack([local.min(axis=1), local.max(axis=1)])
+    rows = np.arange(len(local)) if rows is None else np.asarray(rows, dtype=int)
+    if len(rows) == 0:
+        return csr_matrix((0, len(local)))
+
+    nn = NearestNeighbors(radius=max_distance, metric="chebyshev").fit(boxes)
+    candidates = nn.radius_neighbors(boxes[rows], return_distance=False)
+    row_idx = np.repeat(np.arange(len(rows)), [len(c) for c in candidates])
+    col_idx = np.concatenate(candidates) if len(candidates) else np.array([], dtype=int)
+
+    # Each unordered pair only needs computing once
+    src, dst = rows[row_idx], col_idx
+    lo, hi = np.minimum(src, dst), np.maximum(src, dst)
+    pairs, inverse = np.unique(np.column_stack((lo, hi)), axis=0, return_inverse=True)
+
+    pair_dist = np.zeros(len(pairs))
+    off_diagonal = np.flatnonzero(pairs[:, 0] != pairs[:, 1])
+    for start in range(0, len(off_diagonal), batch_size):
+        chunk = off_diagonal[start:start + batch_size]
+        pair_dist[chunk] = route_distances(local[pairs[chunk, 0]], local[pairs[chunk, 1]], max_distance)
+
+    dist = pair_dist[inverse.ravel()]
+    keep = np.isfinite(dist)
+    return csr_matrix((dist[keep], (row_idx[keep], col_idx[keep])), shape=(len(rows), len(local)))
+
+def _find(parent, i):
+    """Root of i in a union-find parent list, halving the path on the way."""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def _first_seen_labels(roots):
+    """Number components in order of their lowest member, as DBSCAN does."""
+    _, first, inverse = np.unique(roots, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=int)
+    rank[np.argsort(first)] = np.arange(len(first))
+    return rank[inverse.ravel()]
+
+def route_components(vectors, frame, eps_values, batch_size=256):
+    """
+    Connected components of the route_distances graph for several eps
+    values: the same labels as DBSCAN with min_samples=1 on
+    route_distance_graph, without computing every edge.
+
+    Candidate pairs from the bounding-box KD-tree are visited nearest box
+    first. A pair whose tracks are already connected at the smallest eps
+    is skipped, since one more edge inside a component changes nothing;
+    within a route that is almost every pair. Each batch is picked so its
+    pairs cannot close a cycle among themselves, and every pair is
+    abandoned early above the largest eps at which its tracks are still
+    apart.
+
+    Args:
+        vectors: flattened resampled tracks from vectorize_tracks
+        frame: route frame from fit_route_frame (for the projection origin)
+        eps_values: iterable of distance thresholds in meters
+        batch_size: number of pairs per vectorized Fréchet batch
+
+    Returns:
+        dict: {eps: labels array}
+    """
+    from sklearn.neighbors import NearestNeighbors
+
+    eps_values = sorted(eps_values)
+    local = to_local_meters(_tracks_from_vectors(vectors), frame["origin"])
+    n = len(local)
+    if n == 0:
+        return {eps: np.full(0, -1, dtype=int) for eps in eps_values}
+    boxes = np.hstack([local.min(axis=1), local.max(axis=1)])
+
+    nn = NearestNeighbors(radius=eps_values[-1], metric="chebyshev").fit(boxes)
+    gaps, candidates = nn.radius_neighbors(boxes, return_distance=True)
+    src = np.repeat(np.arange(n), [len(c) for c in candidates])
+    dst, gap = np.concatenate(candidates), np.concatenate(gaps)
+    once = src < dst
+    order = np.argsort(gap[once], kind="stable")
+    pairs = np.column_stack((src[once], dst[once]))[order].tolist()
+    gap = gap[once][order].tolist()
+
+    # One union-find per eps; components at a smaller eps nest in the larger
+    parents = [list(range(n)) for _ in eps_values]
+    pending, computed = list(range(len(pairs))), 0
+    with span("cluster.frechet_components", items=len(pairs)):
+        while pending:
+            batch, limits, deferred, tentative = [], [], [], {}
+            for position, k in enumerate(pending):
+                i, j = pairs[k]
+                # Largest eps at which i and j are still apart
+                apart = 0
+                while apart < len(eps_values) and _find(parents[apart], i) != _find(parents[apart], j):
+                    apart += 1
+                if apart == 0 or gap[k] > eps_values[apart - 1]:
+                    continue
+                # Roots at the smallest eps, linked tentatively for this batch
+                a, b = _find(parents[0], i), _find(parents[0], j)
+                while a in tentative:
+                    a = tentative[a]
+                while b in tentative:
+                    b = tentative[b]
+                if a == b:
+                    deferred.append(k)
+                    continue
+                tentative[a] = b
+                batch.append(k)
+                limits.append(eps_values[apart - 1])
+                if len(batch) == batch_size:
+                    deferred.extend(pending[position + 1:])
+                    break
+            if not batch:
+                break
+
+            idx = np.array([pairs[k] for k in batch])
+            dist = route_distances(local[idx[:, 0]], local[idx[:, 1]], np.array(limits))
+            computed += len(batch)
+            for (i, j), d in zip(idx.tolist(), dist.tolist()):
+                for level, eps in enumerate(eps_values):
+                    if d <= eps:
+                        parent = parents[level]
+                        parent[_find(parent, i)] = _find(parent, j)
+            pending = deferred
+
+    print(f"📏 Computed {computed} of {len(pairs)} candidate route distances")
+    return {eps: _first_seen_labels([_find(parent, i) for i in range(n)])
+            for eps, parent in zip(eps_values, parents)}
+
+def cluster_routes_by_similarity(vectors, frame, eps_values, min_samples=1):
+    """
+    DBSCAN on route_distances for several eps values. With min_samples=1
+    the clusters are the connected components from route_components;
+    otherwise DBSCAN runs on one sparse distance graph built at the
+    largest eps.
+
+    Returns:
+        dict: {eps: labels array}
+    """
+    eps_values = sorted(eps_values)
+    if min_samples == 1:
+        return route_components(vectors, frame, eps_values)
+    graph = route_distance_graph(vectors, frame, eps_values[-1])
+
+    return _dbscan_labels(graph, eps_values, min_samples)
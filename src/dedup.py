@@ -0,0 +1,291 @@
+"""
+Export validation: duplicate uploads, orphan GPX files and files without
+a track, found before anything is clustered.
+
+Every GPX file is fingerprinted once and the fingerprints are kept in a
+file index (Parquet, keyed by filename, mtime and size like the track
+cache), so later runs only hash new or changed files:
+
+    Content_Hash - hash of the file's bytes: the same file uploaded twice
+    Point_Hash   - hash of the points rounded to COORD_DECIMALS (~1 m) and
+                   whole seconds: the same recording exported twice
+
+Near-duplicates (a watch and a phone recording the same run) share no
+hash. They are tracks whose time spans overlap by at least
+NEAR_DUPLICATE_OVERLAP of the shorter one and that are within
+NEAR_DUPLICATE_DISTANCE_M of each other at several times in the overlap.
+Tracks are sorted by start time and each is only compared with the
+tracks that start before it ends, so this is O(N log N + K) for K such
+candidate pairs, not O(N^2).
+
+Duplicates are grouped with connected components; each group keeps the
+file the CSV refers to, then the one with the most points.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.instrument import instrumented
+from src.load_gps import haversine_m, list_gpx_files
+from src.tracks import TrackCollection
+
+FILE_INDEX_COLUMNS = ["GPS_Filename", "Mtime_ns", "Size", "Content_Hash", "Point_Hash"]
+REPORT_COLUMNS = ["GPS_Filename", "Issue", "Duplicate_Of"]
+
+# Issues, most to least certain; duplicates of a kept file are dropped
+DUPLICATE_ISSUES = ("duplicate", "same_track", "near_duplicate")
+ISSUES = DUPLICATE_ISSUES + ("orphan", "no_track")
+
+# 5 decimals of a degree is ~1.1 m of latitude
+COORD_DECIMALS = 5
+
+NEAR_DUPLICATE_OVERLAP = 0.5
+NEAR_DUPLICATE_DISTANCE_M = 100.0
+# Fractions of the overlap where the two tracks' positions are compared
+PROBE_FRACTIONS = (0.25, 0.5, 0.75)
+
+HASH_CHUNK_BYTES = 1 << 20
+
+def file_hash(path):
+    """BLAKE2b hash of a file's bytes (hex), read in chunks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def point_hash(track):
+    """Hash of a track's points rounded to COORD_DECIMALS and whole seconds."""
+    scale = 10 ** COORD_DECIMALS
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.round(np.asarray(track["lat"]) * scale).astype(np.int64).tobytes())
+    digest.update(np.round(np.asarray(track["lon"]) * scale).astype(np.int64).tobytes())
+    digest.update(np.asarray(track["time"]).astype("datetime64[s]").astype(np.int64).tobytes())
+    return digest.hexdigest()
+
+def load_file_index(path):
+    """The saved file index, or an empty one (also without pyarrow)."""
+    from src.store import has_pyarrow, read_table
+
+    if path is None or not has_pyarrow() or not os.path.exists(path):
+        return pd.DataFrame(columns=FILE_INDEX_COLUMNS)
+    return read_table(path)
+
+@instrumented("validate.index", items=len)
+def update_file_index(folder_path, tracks, index=None, filenames=None):
+    """
+    Fingerprints of every GPX file in folder_path, reusing the rows of
+    index for files whose mtime and size have not changed.
+
+    Args:
+        folder_path: folder with the GPX files
+        tracks: the parsed tracks (TrackCollection or {filename: track})
+        index: previous file index, optional
+        filenames: the GPX files (default: every one in folder_path)
+
+    Returns:
+        DataFrame: FILE_INDEX_COLUMNS, one row per file; Point_Hash is
+        missing for files without a track
+    """
+    filenames = list_gpx_files(folder_path) if filenames is None else list(filenames)
+    stats = [os.stat(os.path.join(folder_path, f)) for f in filenames]
+    current = pd.DataFrame({
+        "GPS_Filename": filenames,
+        "Mtime_ns": np.array([s.st_mtime_ns for s in stats], dtype=np.int64),
+        "Size": np.array([s.st_size for s in stats], dtype=np.int64),
+    })
+    if index is not None and len(index):
+        known = index.astype({"Mtime_ns": np.int64, "Size": np.int64})
+        current = current.merge(known, on=["GPS_Filename", "Mtime_ns", "Size"], how="left")
+    else:
+        current = current.assign(Content_Hash=pd.NA, Point_Hash=pd.NA)
+
+    # A file that gained a track since (e.g. a parse fix) needs its point hash
+    todo = current["Content_Hash"].isna() | (current["Point_Hash"].isna()
+                                             & current["GPS_Filename"].isin(list(tracks.keys())))
+    for row in np.flatnonzero(todo.to_numpy()):
+        filename = current.at[row, "GPS_Filename"]
+        current.at[row, "Content_Hash"] = file_hash(os.path.join(folder_path, filename))
+        current.at[row, "Point_Hash"] = point_hash(tracks[filename]) if filename in tracks else pd.NA
+    print(f"🔑 Fingerprinted {int(todo.sum())} new or changed GPX files, reused {int((~todo).sum())}")
+    return current[FILE_INDEX_COLUMNS].astype({"Content_Hash": "string", "Point_Hash": "string"})
+
+def save_file_index(path, index):
+    from src.store import has_pyarrow, write_table
+
+    if has_pyarrow():
+        write_table(index, path)
+
+def _time_spans(tracks):
+    """First and last time of every track in seconds (NaN without times)."""
+    time = tracks.columns["time"]
+    seconds = time.astype("datetime64[s]").astype(np.int64).astype(float)
+    seconds[np.isnat(time)] = np.nan
+    start = np.full(len(tracks), np.nan)
+    end = np.full(len(tracks), np.nan)
+    nonempty = tracks.lengths > 0
+    if nonempty.any():
+        starts = tracks.offsets[:-1][nonempty]
+        start[nonempty] = np.fmin.reduceat(seconds, starts)
+        end[nonempty] = np.fmax.reduceat(seconds, starts)
+    return seconds, start, end
+
+def _time_order(tracks, seconds):
+    """
+    Points sorted by one global (track, time) key, for _positions_at. GPS
+    clocks can jump back, so a track's times are not assumed to be sorted.
+
+    Returns:
+        (order, key, base, span): point indices in key order, the sorted
+        keys, and the offset and per-track width of the key
+    """
+    base = np.nanmin(seconds)
+    span = np.nanmax(seconds) - base + 1
+    track_idx = np.repeat(np.arange(len(tracks)), tracks.lengths)
+    # Points without a time sort to their track's start
+    key = track_idx * span + np.nan_to_num(seconds - base, nan=0.0)
+    order = np.argsort(key, kind="stable")
+    return order, key[order], base, span
+
+def _positions_at(tracks, time_order, track, when):
+    """
+    Index of each track's latest point at or before `when` (its earliest
+    point if `when` is earlier), searched in the _time_order keys.
+    """
+    order, key, base, span = time_order
+    found = np.searchsorted(key, track * span + (when - base), side="right") - 1
+    # Keys of one track stay within its offsets, so clipping keeps the search in the track
+    return order[np.clip(found, tracks.offsets[track], tracks.offsets[track + 1] - 1)]
+
+def near_duplicate_pairs(tracks, overlap=NEAR_DUPLICATE_OVERLAP, distance_m=NEAR_DUPLICATE_DISTANCE_M):
+    """
+    Pairs of tracks recorded at the same time in the same place, in
+    O(N log N + K) for N tracks and K pairs that overlap in time.
+
+    Args:
+        tracks: TrackCollection
+        overlap: minimum shared time as a fraction of the shorter track
+        distance_m: largest distance between the two at every probe time
+
+    Returns:
+        (a, b): arrays of track positions, one entry per pair
+    """
+    seconds, start, end = _time_spans(tracks)
+    timed = np.flatnonzero(np.isfinite(start))
+    if len(timed) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Candidates: every later-starting track that starts before this one ends
+    order = timed[np.argsort(start[timed], kind="stable")]
+    sorted_start = start[order]
+    stop = np.searchsorted(sorted_start, end[order], side="right")
+    counts = np.maximum(stop - np.arange(len(order)) - 1, 0)
+    first = np.repeat(np.arange(len(order)), counts)
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    second = first + 1 + np.arange(bounds[-1]) - bounds[first]
+    a, b = order[first], order[second]
+
+    shared_start = np.maximum(start[a], start[b])
+    shared = np.minimum(end[a], end[b]) - shared_start
+    shorter = np.minimum(end[a] - start[a], end[b] - start[b])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        close_in_time = (shared > 0) & (shared >= overlap * shorter)
+    a, b, shared_start, shared = a[close_in_time], b[close_in_time], shared_start[close_in_time], shared[close_in_time]
+
+    lat, lon = tracks.columns["lat"], tracks.columns["lon"]
+    time_order = _time_order(tracks, seconds)
+    close = np.ones(len(a), dtype=bool)
+    for fraction in PROBE_FRACTIONS:
+        when = shared_start + fraction * shared
+        i, j = _positions_at(tracks, time_order, a, when), _positions_at(tracks, time_order, b, when)
+        close &= haversine_m(lat[i], lon[i], lat[j], lon[j]) <= distance_m
+    return a[close], b[close]
+
+def duplicate_groups(n, pairs, rank):
+    """
+    Group items connected by pairs; each group keeps its lowest-rank item.
+
+    Returns:
+        int array: the kept item of every item (itself if kept)
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    a, b = pairs
+    graph = coo_matrix((np.ones(len(a)), (a, b)), shape=(n, n))
+    _, component = connected_components(graph, directed=False)
+    # Sort by (component, rank): the first item of each component is kept
+    order = np.lexsort((rank, component))
+    first = np.r_[True, component[order][1:] != component[order][:-1]]
+    keeper = np.empty(n, dtype=np.int64)
+    keeper[order] = np.repeat(order[first], np.diff(np.append(np.flatnonzero(first), n)))
+    return keeper
+
+def _hash_pairs(hashes):
+    """(a, b) pairs linking every item to the first item with the same hash."""
+    codes, _ = pd.factorize(pd.Series(hashes, dtype="string"))  # missing -> -1
+    valid = np.flatnonzero(codes >= 0)
+    # factorize numbers hashes 0..k-1 in order of appearance
+    _, first_of_code = np.unique(codes[valid], return_index=True)
+    first = valid[first_of_code][codes[valid]]
+    linked = first != valid
+    return valid[linked], first[linked]
+
+@instrumented("validate.export", items=lambda result: len(result[0]))
+def validate_export(activities, folder_path, tracks, index_path=None):
+    """
+    Find duplicate and near-duplicate tracks, GPX files no CSV row refers
+    to and GPX files without a track.
+
+    Args:
+        activities: activities DataFrame (Activity ID / Filename columns)
+        folder_path: folder with the GPX files
+        tracks: the parsed tracks
+        index_path: file index to reuse and update (None: hash everything)
+
+    Returns:
+        (report, keep): report DataFrame (REPORT_COLUMNS, one row per
+        flagged file and issue) and the track names to keep, i.e. every
+        track that is not a duplicate of another
+    """
+    from src.join import join_routes
+
+    tracks = TrackCollection.from_tracks(tracks)
+    filenames = list_gpx_files(folder_path)
+    index = update_file_index(folder_path, tracks, load_file_index(index_path), filenames)
+    if index_path is not None:
+        save_file_index(index_path, index)
+
+    # One hash join of the CSV keys against every file (see join_routes)
+    referenced = join_routes(activities, dict.fromkeys(filenames, 0))["GPS_Filename"].dropna()
+    orphan = ~index["GPS_Filename"].isin(set(referenced))
+
+    # Duplicates among the tracks: the same bytes, the same points, or the
+    # same time and place. Kept: referenced by the CSV, then most points.
+    names = tracks.names
+    by_name = index.set_index("GPS_Filename")
+    content = by_name["Content_Hash"].reindex(names).to_numpy(dtype=object)
+    points = by_name["Point_Hash"].reindex(names).to_numpy(dtype=object)
+    is_orphan = orphan.set_axis(index["GPS_Filename"]).reindex(names).to_numpy(dtype=bool)
+    rank = np.lexsort((np.arange(len(names)), -tracks.lengths, is_orphan))
+    rank = np.argsort(rank)
+    pairs = [_hash_pairs(content), _hash_pairs(points), near_duplicate_pairs(tracks)]
+    keeper = duplicate_groups(len(names), tuple(np.concatenate(p) for p in zip(*pairs)), rank)
+
+    rows = []
+    for i in np.flatnonzero(keeper != np.arange(len(names))):
+        k = keeper[i]
+        issue = ("duplicate" if content[i] == content[k] else
+                 "same_track" if points[i] is not pd.NA and points[i] == points[k] else "near_duplicate")
+        rows.append((names[i], issue, names[k]))
+    rows += [(f, "orphan", pd.NA) for f in index.loc[orphan, "GPS_Filename"]]
+    rows += [(f, "no_track", pd.NA) for f in filenames if f not in tracks]
+    report = pd.DataFrame(rows, columns=REPORT_COLUMNS)
+
+    counts = report["Issue"].value_counts()
+    print(f"🔎 Validated {len(filenames)} GPX files: "
+          + ", ".join(f"{counts.get(issue, 0)} {issue.replace('_', ' ')}" for issue in ISSUES))
+    keep = [name for name, k in zip(names, keeper) if names[k] == name]
+    return report, keep
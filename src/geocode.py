@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.instrument import instrumented
+
+UNKNOWN_LOCATION = "Unknown Location"
+
+# Nominatim's usage policy allows at most one request per second
+NOMINATIM_MIN_DELAY = 1.0
+
+_shared_geolocator = None
+
+def get_geolocator():
+    """
+    Return the process-wide Nominatim client, creating it on first use.
+    """
+    global _shared_geolocator
+    if _shared_geolocator is None:
+        from geopy.geocoders import Nominatim
+        _shared_geolocator = Nominatim(user_agent="strava_analyzer")
+    return _shared_geolocator
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces calls at least min_delay seconds apart,
+    however many threads are calling.
+    """
+
+    def __init__(self, min_delay):
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.min_delay
+        if delay > 0:
+            time.sleep(delay)
+
+class SharedRateLimiter(RateLimiter):
+    """
+    RateLimiter whose spacing holds across processes. The lock and the
+    next allowed call time live in a multiprocessing Manager, so the
+    limiter can be passed to pool workers and they all share one budget.
+    Wall-clock time is used, as it is the same in every process.
+    """
+
+    def __init__(self, min_delay, manager):
+        self.min_delay = min_delay
+        self._lock = manager.Lock()
+        self._next_call = manager.Value("d", 0.0)
+
+    def wait(self):
+        with self._lock:
+            now = time.time()
+            delay = self._next_call.value - now
+            self._next_call.value = max(now, self._next_call.value) + self.min_delay
+        if delay > 0:
+            time.sleep(delay)
+
+class StubGeocoder:
+    """
+    Offline stand-in for a geopy geocoder, for tests and dry runs.
+    reverse() answers from a {(lat, lon): address} dict (rounded to the
+    same precision as the cache) or with a fixed default address.
+    """
+
+    class _Location:
+        def __init__(self, address):
+            self.address = address
+
+    def __init__(self, addresses=None, default="Stub Road, Stub Area, Stub City", precision=3):
+        self.precision = precision
+        self.addresses = {
+            (round(lat, precision), round(lon, precision)): address
+            for (lat, lon), address in (addresses or {}).items()
+        }
+        self.default = default
+        self.calls = 0
+
+    def reverse(self, query, **kwargs):
+        self.calls += 1
+        lat, lon = (float(part) for part in query.split(","))
+        key = (round(lat, self.precision), round(lon, self.precision))
+        address = self.addresses.get(key, self.default)
+        return self._Location(address) if address else None
+
+def format_address(address):
+    """
+    Turn a full reverse-geocoded address into a short "area, city" name.
+    """
+    address_parts = address.split(', ')
+
+    # Try to get neighborhood/area name and city
+    if len(address_parts) >= 2:
+        area = address_parts[1] if len(address_parts) > 1 else address_parts[0]
+        city = address_parts[2] if len(address_parts) > 2 else ""
+        return f"{area}, {city}".strip(", ")
+    else:
+        return address_parts[0] if address_parts else UNKNOWN_LOCATION
+
+def cache_key(lat, lon, precision=3):
+    """Cache key for a coordinate: lat/lon rounded to ~100 m by default."""
+    return f"{lat:.{precision}f},{lon:.{precision}f}"
+
+def load_geocode_cache(cache_path):
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    with open(cache_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_geocode_cache(cache, cache_path):
+    """Write the cache to a temporary file first, then move it into place."""
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(cache_path + ".tmp", cache_path)
+
+def _gazetteer_tree(coords):
+    """BallTree over (lat, lon) degrees with the haversine metric (distances in radians)."""
+    from sklearn.neighbors import BallTree
+
+    return BallTree(np.radians(coords), metric="haversine")
+
+def load_gazetteer(path):
+    """
+    Load a local gazetteer CSV with "name", "lat" and "lon" columns and
+    index its places for nearest-place lookups.
+
+    Returns:
+        (names, coords, tree): list of names, an (n, 2) array of lat/lon
+        and a BallTree over them (None if there are no places)
+    """
+    import pandas as pd
+
+    places = pd.read_csv(path, usecols=["name", "lat", "lon"]).dropna()
+    coords = places[["lat", "lon"]].to_numpy(dtype=float)
+    return places["name"].tolist(), coords, _gazetteer_tree(coords) if len(coords) else None
+
+def nearest_gazetteer_names(coords, gazetteer, max_distance_m=5000):
+    """
+    Resolve each (lat, lon) to the name of the nearest gazetteer place,
+    or UNKNOWN_LOCATION if none is within max_distance_m. Queries the
+    gazetteer's BallTree, so the cost grows with log(places) per
+    coordinate rather than with every place; a (names, coords) pair
+    without a tree gets one built.
+    """
+    from src.load_gps import EARTH_RADIUS_M
+
+    names, places = gazetteer[:2]
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if len(places) == 0 or len(coords) == 0:
+        return [UNKNOWN_LOCATION] * len(coords)
+
+    tree = gazetteer[2] if len(gazetteer) > 2 and gazetteer[2] is not None else _gazetteer_tree(places)
+    dist, nearest = tree.query(np.radians(coords), k=1)
+    dist, nearest = dist[:, 0] * EARTH_RADIUS_M, nearest[:, 0]
+    return [
+        names[i] if d <= max_distance_m else UNKNOWN_LOCATION
+        for d, i in zip(dist, nearest)
+    ]
+
+@instrumented("geocode.reverse")
+def get_location_name(lat, lon, geocoder=None, rate_limiter=None):
+    """
+    Get the location name from coordinates using reverse geocoding.
+    Uses geopy with OpenStreetMap (free, no API key needed) unless another
+    geocoder (e.g. StubGeocoder) is passed. Errors are raised, not hidden.
+    """
+    geocoder = geocoder or get_geolocator()
+    if rate_limiter is not None:
+        rate_limiter.wait()
+    location = geocoder.reverse(f"{lat}, {lon}", language='en', timeout=5)
+    if location is None:
+        return UNKNOWN_LOCATION
+    return format_address(location.address)
+
+@instrumented("geocode.batch", items=len)
+def get_location_names(centroids, cache_path=None, geocoder=None, offline=False, gazetteer_path=None,
+                       workers=4, min_delay=NOMINATIM_MIN_DELAY, rate_limiter=None):
+    """
+    Resolve names for many route centroids at once.
+
+    Names are looked up in a persistent cache (keyed by rounded lat/lon)
+    first. Misses are resolved either offline from a gazetteer file or
+    online by a thread pool sharing one client and one rate limiter.
+    Failed lookups are reported and left out of the cache, so they are
+    retried on the next run.
+
+    Args:
+        centroids: {cluster_id: (lat, lon)}
+        cache_path: JSON file for the geocode cache (None = no cache)
+        geocoder: geopy-style geocoder; defaults to the shared Nominatim
+        offline: never touch the network
+        gazetteer_path: CSV used to resolve names offline
+        workers: concurrent online lookups
+        min_delay: minimum seconds between online requests
+        rate_limiter: limiter to share with other callers (e.g. a
+                      SharedRateLimiter across processes); default is
+                      a new RateLimiter(min_delay)
+
+    Returns:
+        dict: {cluster_id: location name}
+    """
+    cache = load_geocode_cache(cache_path)
+    keys = {cid: cache_key(lat, lon) for cid, (lat, lon) in centroids.items()}
+    missing = sorted({key for key in keys.values() if key not in cache})
+    resolved = {}
+
+    if missing and offline:
+        if gazetteer_path is not None and os.path.exists(gazetteer_path):
+            coords = [tuple(float(x) for x in key.split(",")) for key in missing]
+            resolved = dict(zip(missing, nearest_gazetteer_names(coords, load_gazetteer(gazetteer_path))))
+        else:
+            print("⚠️ Offline geocoding without a gazetteer: new routes stay 'Unknown Location'")
+    elif missing:
+        rate_limiter = rate_limiter or RateLimiter(min_delay)
+
+        def lookup(key):
+            lat, lon = (float(x) for x in key.split(","))
+            try:
+                return key, get_location_name(lat, lon, geocoder, rate_limiter), None
+            except Exception as e:
+                return key, None, e
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            results = list(pool.map(lookup, missing))
+
+        errors = [(key, e) for key, _, e in results if e is not None]
+        resolved = {key: name for key, name, e in results if e is None}
+        if errors:
+            print(f"⚠️ Reverse geocoding failed for {len(errors)} of {len(missing)} locations "
+                  f"(first error: {errors[0][1]!r})")
+
+    # Gazetteer names are cheap to recompute, so only online answers are kept
+    if resolved and not offline:
+        cache.update({key: name for key, name in resolved.items() if name != UNKNOWN_LOCATION})
+        if cache_path is not None:
+            save_geocode_cache(cache, cache_path)
+
+    n_locations = len(set(keys.values()))
+    print(f"📍 Geocoded {len(keys)} routes at {n_locations} locations: "
+          f"{n_locations - len(missing)} cached, {len(resolved)} looked up")
+    return {
+        cid: cache.get(key) or resolved.get(key) or UNKNOWN_LOCATION
+        for cid, key in keys.items()
+    }
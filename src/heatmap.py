@@ -0,0 +1,348 @@
+"""
+Heatmap of every trackpoint on a web-mercator pixel grid.
+
+A cell is one pixel of a 256 px slippy-map tile at a fixed zoom (about
+2.4 m at zoom 16 at the equator, less at higher latitudes). All points of
+all tracks are binned at once: each moving segment is interpolated in
+pixel steps so fast or sparse tracks still draw unbroken lines, every
+sample gets an int64 cell key, and visits / pace are summed per cell with
+np.unique + np.bincount.
+
+Per cell the heatmap keeps:
+    visits     - activities that passed through it (segment frequency)
+    points     - samples that fell in it (each about one pixel of track)
+    pace_sum   - sum of the samples' pace in min/mile, so the mean pace is
+    pace_count   pace_sum / pace_count (distance-weighted, i.e. time in
+                 the cell over distance covered in it)
+
+The heatmap remembers which tracks it holds (by filename, mtime and
+size), so add_tracks() only rasterizes new activities and a daily refresh
+re-renders only the tiles they touched. When a track it holds is gone or
+changed, it is rebuilt.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.instrument import instrumented
+from src.load_gps import haversine_m
+from src.track_filter import MAX_SPEED_MPS
+from src.track_metrics import MAX_SEGMENT_SECONDS, METERS_PER_MILE, MOVING_SPEED_MPS, _concat_tracks
+
+TILE_SIZE = 256
+HEATMAP_ZOOM = 16
+
+# Web-mercator latitude limit
+MAX_LATITUDE = 85.05112878
+
+# Fixed color scales, so tiles rendered on different days match
+VISITS_FULL_SCALE = 100
+PACE_RANGE_MIN_PER_MILE = (6.0, 14.0)
+
+HEATMAP_VALUES = ("visits", "pace")
+CELL_COLUMNS = ["Tile_X", "Tile_Y", "Lat", "Lon", "Visits", "Points", "Mean_Pace_min_per_mile"]
+
+_COUNTS = ("visits", "points", "pace_count")
+_SUMS = ("pace_sum",)
+
+def lonlat_to_pixels(lat, lon, zoom):
+    """Global web-mercator pixel coordinates (float) at zoom."""
+    scale = TILE_SIZE * 2.0 ** zoom
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lon) + 180.0) / 360.0 * scale
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0 * scale
+    return x, y
+
+def pixels_to_lonlat(x, y, zoom):
+    """Latitude and longitude of global pixel coordinates at zoom."""
+    scale = TILE_SIZE * 2.0 ** zoom
+    lon = np.asarray(x) / scale * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * np.asarray(y) / scale))))
+    return lat, lon
+
+def empty_heatmap(zoom=HEATMAP_ZOOM, settings=None):
+    """A heatmap with no tracks; settings are the options it was built with."""
+    heatmap = {"zoom": zoom, "settings": dict(settings or {}), "cells": np.empty(0, dtype=np.int64),
+               "tracks": np.empty(0, dtype=str)}
+    heatmap.update({key: np.empty(0, dtype=np.int64) for key in _COUNTS})
+    heatmap.update({key: np.empty(0) for key in _SUMS})
+    return heatmap
+
+def _samples(tracks, zoom):
+    """
+    Pixel samples of every track: each point, plus points every pixel
+    along moving segments. Returns (x, y, track index, pace) per sample,
+    pace NaN where the track was not moving.
+    """
+    _, lengths, track_idx, cols = _concat_tracks(tracks)
+    lat, lon = cols["lat"], cols["lon"]
+    x, y = lonlat_to_pixels(lat, lon, zoom)
+    n = len(lat)
+    first = np.zeros(n, dtype=bool)
+    first[np.concatenate(([0], np.cumsum(lengths)[:-1]))] = True
+
+    # Segment i runs from point i-1 to point i (as in track_metrics)
+    seg_dist = np.zeros(n)
+    seg_dist[1:] = haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    seconds = cols["time"].astype("datetime64[s]").astype(np.int64).astype(float)
+    seconds[np.isnat(cols["time"])] = np.nan
+    seg_time = np.zeros(n)
+    seg_time[1:] = np.diff(seconds)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = seg_dist / seg_time
+    moving = ~first & (seg_time > 0) & (seg_time <= MAX_SEGMENT_SECONDS) & (speed >= MOVING_SPEED_MPS)
+    pace = np.full(n, np.nan)
+    pace[moving] = METERS_PER_MILE / speed[moving] / 60.0
+
+    # Moving segments get one sample per pixel stepped; everything else
+    # (first points, pauses, gaps, jumps faster than a spike) only its end point
+    prev = np.maximum(np.arange(n) - 1, 0)
+    dx, dy = x - x[prev], y - y[prev]
+    pixels = np.ceil(np.maximum(np.abs(dx), np.abs(dy)))
+    steps = np.where(moving & (speed <= MAX_SPEED_MPS), np.maximum(pixels, 1), 1).astype(np.int64)
+    owner = np.repeat(np.arange(n), steps)
+    bounds = np.concatenate(([0], np.cumsum(steps)))
+    # Fraction of the way along the segment: 1/steps, 2/steps, ..., 1
+    frac = (np.arange(bounds[-1]) - bounds[owner] + 1) / steps[owner]
+    sample_x = x[prev][owner] + frac * dx[owner]
+    sample_y = y[prev][owner] + frac * dy[owner]
+    return sample_x, sample_y, track_idx[owner], pace[owner]
+
+def rasterize_tracks(tracks, zoom=HEATMAP_ZOOM):
+    """
+    Bin every point of tracks into the zoom's pixel grid.
+
+    Args:
+        tracks: TrackCollection or {filename: track dict}
+        zoom: web-mercator zoom of the grid
+
+    Returns:
+        dict: cells (sorted int64 keys y * width + x) with visits, points,
+        pace_sum and pace_count per cell
+    """
+    width = TILE_SIZE * 2 ** zoom
+    heatmap = empty_heatmap(zoom)
+    if not any(len(track["lat"]) for track in tracks.values()):
+        return heatmap
+
+    x, y, track_idx, pace = _samples(tracks, zoom)
+    px = np.clip(x.astype(np.int64), 0, width - 1)
+    py = np.clip(y.astype(np.int64), 0, width - 1)
+    cells, cell_idx = np.unique(py * width + px, return_inverse=True)
+    n_cells = len(cells)
+
+    # Visits: distinct (cell, track) pairs per cell
+    n_tracks = int(track_idx.max()) + 1
+    pairs = np.unique(cell_idx * n_tracks + track_idx)
+    timed = np.isfinite(pace)
+    heatmap.update(
+        cells=cells,
+        visits=np.bincount(pairs // n_tracks, minlength=n_cells),
+        points=np.bincount(cell_idx, minlength=n_cells),
+        pace_sum=np.bincount(cell_idx[timed], pace[timed], minlength=n_cells),
+        pace_count=np.bincount(cell_idx[timed], minlength=n_cells),
+    )
+    return heatmap
+
+def merge_heatmaps(heatmap, other):
+    """Cell-wise sum of two heatmaps at the same zoom (tracks are combined)."""
+    if heatmap["zoom"] != other["zoom"]:
+        raise ValueError(f"Cannot merge heatmaps at zoom {heatmap['zoom']} and {other['zoom']}")
+    cells, cell_idx = np.unique(np.concatenate((heatmap["cells"], other["cells"])), return_inverse=True)
+    merged = {"zoom": heatmap["zoom"], "settings": heatmap["settings"], "cells": cells,
+              "tracks": np.concatenate((heatmap["tracks"], other["tracks"]))}
+    for key in _COUNTS + _SUMS:
+        total = np.bincount(cell_idx, np.concatenate((heatmap[key], other[key])), minlength=len(cells))
+        merged[key] = total.astype(np.int64) if key in _COUNTS else total
+    return merged
+
+def track_keys(folder_path, names):
+    """
+    "name|mtime_ns|size" of every GPX file, the same key the track cache
+    uses, so an edited or replaced file counts as a different track.
+    Files that are gone are keyed by name only.
+    """
+    keys = []
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(folder_path, name))
+        except OSError:
+            keys.append(name)
+            continue
+        keys.append(f"{name}|{stat.st_mtime_ns}|{stat.st_size}")
+    return keys
+
+@instrumented("heatmap.add", items=lambda result: len(result[0]["tracks"]))
+def add_tracks(heatmap, tracks, keys=None):
+    """
+    Rasterize the tracks the heatmap does not hold yet and add them.
+
+    A heatmap holding tracks that are no longer among `tracks` (deleted,
+    edited, or dropped as duplicates) cannot be brought up to date by
+    adding, so it is rebuilt from all of `tracks` instead.
+
+    Args:
+        heatmap: from empty_heatmap / load_heatmap
+        tracks: TrackCollection or {filename: track dict}
+        keys: key of every track in `tracks` order, e.g. from track_keys
+              (default: the track names)
+
+    Returns:
+        (heatmap, tiles): the updated heatmap and the sorted (tile_x,
+        tile_y) tiles the new tracks touched, or None if it was rebuilt
+    """
+    names = list(tracks)
+    keys = names if keys is None else list(keys)
+    known = set(heatmap["tracks"].tolist())
+    current = set(keys)
+    if not known <= current:
+        print(f"🗺️ {len(known - current)} activities in the saved heatmap are gone or changed; rebuilding it")
+        rebuilt = rasterize_tracks(tracks, heatmap["zoom"])
+        rebuilt.update(settings=heatmap["settings"], tracks=np.array(keys, dtype=str))
+        return rebuilt, None
+
+    new = [name for name, key in zip(names, keys) if key not in known]
+    if not new:
+        print(f"🗺️ Heatmap up to date ({len(known)} activities, {len(heatmap['cells'])} cells)")
+        return heatmap, []
+
+    subset = tracks.subset(new) if hasattr(tracks, "subset") else {name: tracks[name] for name in new}
+    added = rasterize_tracks(subset, heatmap["zoom"])
+    added["tracks"] = np.array([key for key in keys if key not in known], dtype=str)
+    merged = merge_heatmaps(heatmap, added)
+    tiles = sorted(set(zip(*(t.tolist() for t in _tile_of(added["cells"], heatmap["zoom"])))))
+    print(f"🗺️ Added {len(new)} activities to the heatmap: {len(merged['cells'])} cells "
+          f"({len(added['cells'])} touched) over {len(tiles)} tiles")
+    return merged, tiles
+
+def _tile_of(cells, zoom):
+    """Tile x, y of cell keys."""
+    width = TILE_SIZE * 2 ** zoom
+    return (cells % width) // TILE_SIZE, (cells // width) // TILE_SIZE
+
+def mean_pace(heatmap):
+    """Mean pace in min/mile per cell (NaN where no moving samples)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return heatmap["pace_sum"] / heatmap["pace_count"]
+
+def heatmap_cells(heatmap):
+    """One row per cell: its tile, center lat/lon, visits, points and mean pace."""
+    width = TILE_SIZE * 2 ** heatmap["zoom"]
+    x, y = heatmap["cells"] % width, heatmap["cells"] // width
+    lat, lon = pixels_to_lonlat(x + 0.5, y + 0.5, heatmap["zoom"])
+    return pd.DataFrame({
+        "Tile_X": x // TILE_SIZE, "Tile_Y": y // TILE_SIZE, "Lat": lat, "Lon": lon,
+        "Visits": heatmap["visits"], "Points": heatmap["points"], "Mean_Pace_min_per_mile": mean_pace(heatmap),
+    }, columns=CELL_COLUMNS)
+
+def tile_arrays(heatmap, value="visits", tiles=None):
+    """
+    Dense TILE_SIZE x TILE_SIZE arrays per tile, built with one bincount
+    over the in-tile pixel index of each tile's cells.
+
+    Args:
+        heatmap: heatmap dict
+        value: "visits" (counts, 0 where never run) or "pace" (mean
+               min/mile, NaN where no moving samples)
+        tiles: only these (tile_x, tile_y) tiles (default: every tile)
+
+    Returns:
+        dict: {(tile_x, tile_y): 2D array indexed [row, column]}
+    """
+    if value not in HEATMAP_VALUES:
+        raise ValueError(f"Unknown heatmap value {value!r}; expected one of {', '.join(HEATMAP_VALUES)}")
+    width = TILE_SIZE * 2 ** heatmap["zoom"]
+    cells = heatmap["cells"]
+    x, y = cells % width, cells // width
+    tile_key = (y // TILE_SIZE) * (width // TILE_SIZE) + x // TILE_SIZE
+    pixel = (y % TILE_SIZE) * TILE_SIZE + x % TILE_SIZE
+
+    # Cells are sorted by row, not by tile, so group them by tile first
+    order = np.argsort(tile_key, kind="stable")
+    keys, starts = np.unique(tile_key[order], return_index=True)
+    stops = np.append(starts[1:], len(order))
+    wanted = None if tiles is None else set(map(tuple, tiles))
+    values = heatmap["visits"] if value == "visits" else mean_pace(heatmap)
+
+    arrays = {}
+    for key, start, stop in zip(keys.tolist(), starts, stops):
+        tile = (key % (width // TILE_SIZE), key // (width // TILE_SIZE))
+        if wanted is not None and tile not in wanted:
+            continue
+        rows = order[start:stop]
+        if value == "visits":
+            grid = np.bincount(pixel[rows], values[rows], minlength=TILE_SIZE ** 2).astype(np.int64)
+        else:
+            grid = np.full(TILE_SIZE ** 2, np.nan)
+            grid[pixel[rows]] = values[rows]
+        arrays[tile] = grid.reshape(TILE_SIZE, TILE_SIZE)
+    return arrays
+
+def _colorize(array, value):
+    """RGBA image of a tile array; cells never run are transparent."""
+    from matplotlib import colormaps
+
+    if value == "visits":
+        shade = np.log1p(array) / np.log1p(VISITS_FULL_SCALE)
+        rgba = colormaps["inferno"](np.clip(shade, 0, 1))
+        rgba[..., 3] = array > 0
+    else:
+        fast, slow = PACE_RANGE_MIN_PER_MILE
+        # Fast is red, slow is blue
+        rgba = colormaps["RdYlBu"](np.clip((np.nan_to_num(array, nan=slow) - fast) / (slow - fast), 0, 1))
+        rgba[..., 3] = np.isfinite(array)
+    return rgba
+
+def export_heatmap(heatmap, output_dir, values=HEATMAP_VALUES, formats=("png",), tiles=None):
+    """
+    Write heatmap tiles in the slippy-map layout
+    <output_dir>/<value>/<zoom>/<x>/<y>.<format>.
+
+    Args:
+        heatmap: heatmap dict
+        output_dir: root folder of the tiles
+        values: "visits" and/or "pace"
+        formats: "png" (transparent RGBA image) and/or "npy" (the raw
+                 tile array from tile_arrays)
+        tiles: only re-write these (tile_x, tile_y) tiles (default: all)
+
+    Returns:
+        list: paths written
+    """
+    from matplotlib.image import imsave
+
+    paths = []
+    for value in values:
+        for (tile_x, tile_y), array in tile_arrays(heatmap, value, tiles).items():
+            folder = os.path.join(output_dir, value, str(heatmap["zoom"]), str(tile_x))
+            os.makedirs(folder, exist_ok=True)
+            for fmt in formats:
+                path = os.path.join(folder, f"{tile_y}.{fmt}")
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                if fmt == "npy":
+                    with open(tmp_path, "wb") as f:
+                        np.save(f, array)
+                else:
+                    imsave(tmp_path, _colorize(array, value), format=fmt)
+                os.replace(tmp_path, path)
+                paths.append(path)
+    return paths
+
+def save_heatmap(path, heatmap):
+    """Write the heatmap as .npz (temporary file first, then moved into place)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    arrays = {key: value for key, value in heatmap.items() if isinstance(value, np.ndarray)}
+    meta = {"zoom": heatmap["zoom"], "settings": heatmap["settings"]}
+    np.savez(path + ".tmp.npz", meta=json.dumps(meta), **arrays)
+    os.replace(path + ".tmp.npz", path)
+
+def load_heatmap(path):
+    """Load a heatmap saved by save_heatmap, or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as saved:
+        heatmap = {key: saved[key] for key in saved.files if key != "meta"}
+        heatmap.update(json.loads(str(saved["meta"])))
+    return heatmap
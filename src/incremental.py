@@ -0,0 +1,220 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.instrument import instrumented
+from src.route_analysis import compute_route_stats
+
+def load_state(state_dir):
+    """
+    Load the pipeline state saved by save_state.
+
+    Returns:
+        dict with "ids", "vectors", "labels", "eps", "frame", "settings",
+        "keys" (file key of every id, None if not saved), "route_stats"
+        and "stats_routes" ({activity ID: route ID} the stats were
+        computed from, None if not saved), or None if no state has been
+        saved yet (or it was saved without a route frame).
+    """
+    state_file = os.path.join(state_dir, "state.npz")
+    if not os.path.exists(state_file):
+        return None
+
+    with np.load(state_file) as saved:
+        if "components" not in saved:
+            return None
+        state = {
+            "ids": saved["ids"].tolist(),
+            "vectors": saved["vectors"],
+            "labels": saved["labels"],
+            "eps": float(saved["eps"]),
+            "frame": {key: saved[key] for key in ("origin", "shape_mean", "components")},
+            "settings": json.loads(str(saved["settings"])) if "settings" in saved else {},
+            "keys": saved["keys"].tolist() if "keys" in saved else None,
+        }
+
+    stats_file = os.path.join(state_dir, "route_stats.csv")
+    state["route_stats"] = pd.read_csv(stats_file) if os.path.exists(stats_file) else None
+
+    routes_file = os.path.join(state_dir, "stats_routes.json")
+    if os.path.exists(routes_file):
+        with open(routes_file, encoding="utf-8") as f:
+            state["stats_routes"] = {int(a): int(r) for a, r in json.load(f).items()}
+    else:
+        state["stats_routes"] = None
+
+    return state
+
+def save_state(state_dir, ids, vectors, labels, eps, frame, route_stats=None, stats_routes=None,
+               settings=None, keys=None):
+    """
+    Save vectors, cluster labels, the route frame from fit_route_frame and
+    route stats so the next run only has to process new activities. Each
+    file is written to a temporary name first and then moved into place.
+
+    stats_routes: {activity ID: route ID} of the activities route_stats
+                  was computed from
+    settings: JSON-serializable dict of the options the state was built
+              with (resampling, metric, ...), returned again by load_state
+              so callers can tell when it is stale.
+    keys: file key of every id (e.g. from heatmap.track_keys), so the
+          next run can tell which files were edited or replaced
+    """
+    os.makedirs(state_dir, exist_ok=True)
+
+    state_file = os.path.join(state_dir, "state.npz")
+    np.savez(state_file + ".tmp.npz", ids=np.array(ids, dtype=str), vectors=vectors,
+             labels=np.asarray(labels), eps=eps, settings=json.dumps(settings or {}),
+             **({"keys": np.array(keys, dtype=str)} if keys is not None else {}), **frame)
+    os.replace(state_file + ".tmp.npz", state_file)
+
+    if route_stats is not None:
+        stats_file = os.path.join(state_dir, "route_stats.csv")
+        route_stats.to_csv(stats_file + ".tmp", index=False)
+        os.replace(stats_file + ".tmp", stats_file)
+
+    routes_file = os.path.join(state_dir, "stats_routes.json")
+    with open(routes_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({str(int(a)): int(r) for a, r in sorted((stats_routes or {}).items())}, f)
+    os.replace(routes_file + ".tmp", routes_file)
+
+def stale_tracks(state, keys):
+    """
+    Known tracks that have to be clustered again: those whose file key
+    changed (edited or re-exported under the same name) and every other
+    member of their clusters, which an edited track may have been holding
+    together. What is left is still exactly what DBSCAN gives on it.
+
+    Args:
+        state: from load_state, with "keys"
+        keys: {id: current file key}
+
+    Returns:
+        (changed, stale): ids whose key changed, and a boolean mask over
+        state["ids"] of the tracks to cluster again
+    """
+    changed = {i for i, key in zip(state["ids"], state["keys"]) if keys.get(i, key) != key}
+    labels = np.asarray(state["labels"])
+    edited = np.isin(np.array(state["ids"], dtype=str), list(changed))
+    routes = np.unique(labels[edited & (labels != -1)])
+    return changed, edited | np.isin(labels, routes)
+
+def assign_from_graph(graph, labels, n_known):
+    """
+    Assign new tracks to existing clusters from a sparse distance graph.
+
+    Args:
+        graph: sparse matrix of shape (n_new, n_known + n_new) holding only
+               the distances within eps; the first n_known columns are the
+               already clustered tracks, the rest are the new tracks
+        labels: cluster labels of the known tracks
+        n_known: number of known tracks
+
+    With min_samples=1 every track is a core point and DBSCAN clusters are
+    the connected components of the eps graph. So the new tracks and the
+    existing clusters (one node each) are split into connected components:
+    a component with one existing cluster joins it, one without gets a
+    fresh cluster ID after the current maximum, and existing clusters that
+    new tracks bridge are merged into the lowest of their IDs. The result
+    is what a full DBSCAN run gives, up to the numbering of the clusters.
+
+    Returns:
+        (labels, new_labels): labels of the known tracks (changed only
+        where clusters were merged) and labels of the new tracks
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    labels = np.asarray(labels)
+    graph = graph.tocoo()
+    n_new = graph.shape[0]
+    if n_new == 0:
+        return labels, np.full(0, -1, dtype=int)
+
+    # Nodes: the new tracks, then one node per existing cluster
+    cluster_ids = np.unique(labels[labels != -1])
+    to_new = graph.col >= n_known
+    known_row, known_col = graph.row[~to_new], graph.col[~to_new]
+    clustered = labels[known_col] != -1
+    row = np.concatenate((graph.row[to_new], known_row[clustered]))
+    col = np.concatenate((graph.col[to_new] - n_known,
+                          n_new + np.searchsorted(cluster_ids, labels[known_col[clustered]])))
+    n_nodes = n_new + len(cluster_ids)
+    # Zero distances are still edges
+    nodes = coo_matrix((np.ones(len(row)), (row, col)), shape=(n_nodes, n_nodes))
+    n_components, component = connected_components(nodes, directed=False)
+
+    # Each component takes the lowest existing cluster ID in it, or a fresh one
+    component_label = np.full(n_components, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(component_label, component[n_new:], cluster_ids)
+    fresh = component_label == np.iinfo(np.int64).max
+    next_id = int(cluster_ids.max()) + 1 if len(cluster_ids) else 0
+    component_label[fresh] = next_id + np.arange(fresh.sum())
+
+    merged_into = component_label[component[n_new:]]
+    merged = merged_into != cluster_ids
+    if merged.any():
+        known_labels = labels.copy()
+        clustered = labels != -1
+        known_labels[clustered] = merged_into[np.searchsorted(cluster_ids, labels[clustered])]
+        print(f"🔗 New tracks bridge existing routes: merged {merged.sum()} routes into "
+              f"{len(np.unique(merged_into[merged]))} others "
+              f"({', '.join(f'{a}→{b}' for a, b in zip(cluster_ids[merged][:5], merged_into[merged][:5]))}"
+              f"{', ...' if merged.sum() > 5 else ''})")
+        labels = known_labels
+
+    return labels, component_label[component[:n_new]].astype(int)
+
+def assign_to_clusters(new_vectors, vectors, labels, eps):
+    """
+    Assign new route vectors (or route descriptors) to existing clusters
+    without re-running DBSCAN, using Euclidean distance within eps.
+
+    Returns:
+        (labels, new_labels): as assign_from_graph
+    """
+    from sklearn.neighbors import NearestNeighbors
+
+    new_vectors = np.asarray(new_vectors)
+    if len(new_vectors) == 0:
+        return np.asarray(labels), np.full(0, -1, dtype=int)
+
+    nn = NearestNeighbors(radius=eps).fit(np.vstack([vectors, new_vectors]))
+    graph = nn.radius_neighbors_graph(new_vectors, mode="distance")
+    return assign_from_graph(graph, labels, len(vectors))
+
+def changed_routes(previous, current):
+    """
+    Routes whose activities differ between two {activity ID: route ID}
+    mappings: new activities, activities that are gone (deleted, edited
+    away or dropped as duplicates) and activities whose route changed
+    count against both their old and new route.
+    """
+    both = pd.concat([pd.Series(previous, dtype="Int64"), pd.Series(current, dtype="Int64")],
+                     axis=1, keys=["old", "new"])
+    moved = both["old"].fillna(-2) != both["new"].fillna(-2)
+    return set(both.loc[moved, "old"].dropna().astype(int)) | set(both.loc[moved, "new"].dropna().astype(int))
+
+@instrumented("stats.update_groupby", items=len)
+def update_route_stats(route_stats, df_for_stats, route_ids):
+    """
+    Recompute compute_route_stats only for the routes in route_ids and
+    splice them into the previous route_stats. Other routes are kept as
+    they were, except routes with no activities left, which are dropped.
+    """
+    route_ids = set(int(r) for r in route_ids)
+    if route_stats is None:
+        return compute_route_stats(df_for_stats)
+
+    changed = df_for_stats[df_for_stats["RouteID"].isin(route_ids)]
+    kept = route_stats[~route_stats["RouteID"].isin(route_ids)
+                       & route_stats["RouteID"].isin(df_for_stats["RouteID"])]
+    if len(changed) == 0:
+        return kept.reset_index(drop=True)
+    updated = compute_route_stats(changed)
+
+    return (pd.concat([kept, updated], ignore_index=True)
+            .sort_values("RouteID")
+            .reset_index(drop=True))
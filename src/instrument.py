@@ -0,0 +1,253 @@
+"""
+Opt-in timing and memory instrumentation for the pipeline stages and the
+hot functions underneath them.
+
+    from src import instrument
+
+    instrument.enable(log_path="data/cache/timings.jsonl", trace_memory=True)
+    ... run the pipeline ...
+    instrument.disable()
+    print(instrument.summary_table())
+
+While disabled (the default) spans and instrumented functions cost one
+attribute check. Every finished span is one record: name, parent, wall
+and CPU time, peak memory allocated within the span (with trace_memory),
+the process's peak RSS and an item count. Records are kept in memory and,
+with log_path, appended to a JSON lines file as they finish.
+"""
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_recorder = None
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(rss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+def _children_cpu():
+    """CPU seconds of reaped worker processes (e.g. a finished process pool)."""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+class Span:
+    """One timed region; set .items inside the with-block to record a count."""
+
+    def __init__(self, recorder, name, items=None):
+        self.recorder = recorder
+        self.name = name
+        self.items = items
+        self.parent = None
+        self.depth = 0
+        self._child_peak = 0
+
+    def __enter__(self):
+        stack = self.recorder.stack()
+        if stack:
+            self.parent = stack[-1].name
+            self.depth = len(stack)
+        self._traced = self.recorder.trace_memory and threading.current_thread() is threading.main_thread()
+        if self._traced:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]._child_peak = max(stack[-1]._child_peak, peak)
+            self._start_traced = current
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self._start = time.time()
+        self._cpu = time.process_time() + _children_cpu()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() + _children_cpu() - self._cpu
+        stack = self.recorder.stack()
+        stack.pop()
+
+        peak_alloc = None
+        if self._traced:
+            peak = max(tracemalloc.get_traced_memory()[1], self._child_peak)
+            peak_alloc = round(max(peak - self._start_traced, 0) / 2 ** 20, 2)
+            if stack:
+                stack[-1]._child_peak = max(stack[-1]._child_peak, peak)
+            tracemalloc.reset_peak()
+
+        self.recorder.add({
+            "name": self.name,
+            "parent": self.parent,
+            "depth": self.depth,
+            "start": round(self._start, 3),
+            "wall_s": round(wall, 4),
+            "cpu_s": round(cpu, 4),
+            "peak_alloc_mb": peak_alloc,
+            "max_rss_mb": _max_rss_mb(),
+            "items": self.items,
+            "error": exc_type.__name__ if exc_type is not None else None,
+        })
+        return False
+
+class _NoSpan:
+    """Stand-in returned by span() while instrumentation is disabled."""
+    items = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+class Recorder:
+    """Collects span records; see enable()."""
+
+    def __init__(self, log_path=None, trace_memory=False, profile_path=None):
+        self.records = []
+        self.log_path = log_path
+        self.trace_memory = trace_memory
+        self.profile_path = profile_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._log = None
+        self._profile = None
+
+    def stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def start(self):
+        if self.log_path is not None:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            self._log = open(self.log_path, "a", encoding="utf-8")
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.profile_path is not None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self):
+        if self._profile is not None:
+            self._profile.disable()
+            os.makedirs(os.path.dirname(self.profile_path) or ".", exist_ok=True)
+            self._profile.dump_stats(self.profile_path)
+            print(f"🔬 cProfile stats saved to: {self.profile_path} (python -m pstats {self.profile_path})")
+        if self.trace_memory:
+            tracemalloc.stop()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def add(self, record):
+        record["pid"] = os.getpid()
+        with self._lock:
+            self.records.append(record)
+            if self._log is not None:
+                self._log.write(json.dumps(record) + "\n")
+                self._log.flush()
+
+def enable(log_path=None, trace_memory=False, profile_path=None):
+    """
+    Start recording spans.
+
+    Args:
+        log_path: append each record to this JSON lines file
+        trace_memory: measure peak allocations per span with tracemalloc
+                      (makes allocation-heavy code such as GPX parsing
+                      several times slower)
+        profile_path: run cProfile until disable() and dump the stats here
+    """
+    global _recorder
+    if _recorder is not None:
+        disable()
+    _recorder = Recorder(log_path, trace_memory, profile_path)
+    _recorder.start()
+    return _recorder
+
+def disable():
+    """Stop recording; returns the records collected since enable()."""
+    global _recorder
+    if _recorder is None:
+        return []
+    recorder, _recorder = _recorder, None
+    recorder.stop()
+    return recorder.records
+
+def is_enabled():
+    return _recorder is not None
+
+def records():
+    return list(_recorder.records) if _recorder is not None else []
+
+def span(name, items=None):
+    """Context manager timing a region (a no-op while disabled)."""
+    if _recorder is None:
+        return _NO_SPAN
+    return Span(_recorder, name, items)
+
+def instrumented(name, items=None):
+    """
+    Decorator recording a span for every call of the function.
+
+    Args:
+        name: span name, e.g. "gps.parse"
+        items: optional callable(result) -> number of items processed
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            with Span(_recorder, name) as s:
+                result = func(*args, **kwargs)
+                if items is not None:
+                    s.items = items(result)
+            return result
+        return wrapper
+    return decorate
+
+def summary_table(records=None):
+    """
+    Aggregate records per span name (calls, total wall/CPU, largest peak
+    allocation, items) as a text table, slowest first.
+    """
+    if records is None:
+        records = list(_recorder.records) if _recorder is not None else []
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record["name"], {
+            "calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_alloc_mb": None, "items": None, "depth": record["depth"],
+        })
+        total["calls"] += 1
+        total["wall_s"] += record["wall_s"]
+        total["cpu_s"] += record["cpu_s"]
+        total["depth"] = min(total["depth"], record["depth"])
+        if record["peak_alloc_mb"] is not None:
+            total["peak_alloc_mb"] = max(total["peak_alloc_mb"] or 0, record["peak_alloc_mb"])
+        if record["items"] is not None:
+            total["items"] = (total["items"] or 0) + record["items"]
+
+    lines = [f"{'span':<32} {'calls':>6} {'wall s':>9} {'cpu s':>9} {'peak MB':>9} {'items':>10}"]
+    for name, total in sorted(totals.items(), key=lambda kv: -kv[1]["wall_s"]):
+        peak = f"{total['peak_alloc_mb']:.1f}" if total["peak_alloc_mb"] is not None else "-"
+        items = str(total["items"]) if total["items"] is not None else "-"
+        label = "  " * total["depth"] + name
+        lines.append(f"{label:<32} {total['calls']:>6} {total['wall_s']:>9.3f} {total['cpu_s']:>9.3f} "
+                     f"{peak:>9} {items:>10}")
+    return "\n".join(lines)
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+from src.instrument import instrumented
+
+# Tried in this order; the first strategy that finds a route wins
+MATCH_STRATEGIES = ("exact", "gpx_extension", "basename", "stem", "activity_id")
+
+def _key_strings(keys):
+    """
+    Activity IDs / filenames as clean strings. Integer-valued floats
+    (Activity ID columns with NaNs) lose their ".0"; missing stays missing.
+    """
+    keys = pd.Series(keys)
+    if pd.api.types.is_numeric_dtype(keys):
+        keys = keys.astype("Int64")
+    return keys.astype("string").str.strip()
+
+def _basename(keys):
+    return keys.str.replace(r"^.*[\\/]", "", regex=True)
+
+def _stem(keys):
+    """Basename without any extensions: 'a/123.gpx.gz' -> '123'."""
+    return _basename(keys).str.replace(r"\..*$", "", regex=True)
+
+def _activity_id(keys):
+    """Longest run of digits in the stem, e.g. 'run_8083971283' -> '8083971283'."""
+    digits = _stem(keys).str.extractall(r"(\d+)")[0]
+    if digits.empty:
+        return pd.Series(pd.NA, index=keys.index, dtype="string")
+    longest = digits.loc[digits.str.len().groupby(level=0).idxmax()]
+    return longest.droplevel(1).reindex(keys.index).astype("string")
+
+def build_route_key_index(route_map):
+    """
+    Build lookup tables to the GPS filename, once, for every normalized
+    form a CSV key may take.
+
+    Returns:
+        dict: {strategy: pd.Series mapping normalized key -> GPS filename}
+    """
+    filenames = _key_strings(list(route_map.keys()))
+
+    def index_by(keys):
+        table = pd.Series(list(route_map.keys()), index=keys.values)
+        table = table[table.index.notna()]
+        return table[~table.index.duplicated(keep="first")]
+
+    return {
+        "exact": index_by(filenames),
+        "gpx_extension": index_by(filenames),
+        "basename": index_by(_basename(filenames)),
+        "stem": index_by(_stem(filenames)),
+        "activity_id": index_by(_activity_id(filenames)),
+    }
+
+def match_routes(keys, route_map, index=None):
+    """
+    Resolve every activity key (Activity ID or Filename) to a GPS file and
+    its route ID with one hash lookup per strategy over the whole column.
+
+    Args:
+        keys: Series of Activity IDs or Filenames
+        route_map: {gps filename: cluster label}
+        index: prebuilt build_route_key_index(route_map), optional
+
+    Returns:
+        DataFrame aligned with keys: "GPS_Filename", "GPS_RouteID" (float,
+        NaN when unmatched) and "RouteMatch" (strategy that matched, or NaN).
+    """
+    index = index if index is not None else build_route_key_index(route_map)
+    keys = _key_strings(keys)
+
+    candidates = {
+        "exact": keys,
+        "gpx_extension": keys + ".gpx",
+        "basename": _basename(keys),
+        "stem": _stem(keys),
+        "activity_id": _activity_id(keys),
+    }
+
+    filename = pd.Series(pd.NA, index=keys.index, dtype="object")
+    strategy = pd.Series(pd.NA, index=keys.index, dtype="object")
+    for name in MATCH_STRATEGIES:
+        todo = filename.isna() & candidates[name].notna()
+        if not todo.any():
+            continue
+        found = candidates[name][todo].map(index[name]).dropna()
+        filename.loc[found.index] = found
+        strategy.loc[found.index] = name
+
+    route_id = filename.map(pd.Series(route_map, dtype=float)).astype(float)
+    return pd.DataFrame({"GPS_Filename": filename, "GPS_RouteID": route_id, "RouteMatch": strategy})
+
+@instrumented("join.routes", items=len)
+def join_routes(df_clean, route_map, index=None):
+    """
+    Add GPS_Filename, GPS_RouteID and RouteMatch columns to df_clean.
+
+    Activity ID is preferred. Rows it cannot resolve fall back to the
+    Filename column when present. index: prebuilt
+    build_route_key_index(route_map), to reuse it across chunks.
+    """
+    index = index if index is not None else build_route_key_index(route_map)
+    key_columns = [c for c in ("Activity ID", "Filename") if c in df_clean.columns]
+
+    result = pd.DataFrame({"GPS_Filename": pd.NA, "GPS_RouteID": np.nan, "RouteMatch": pd.NA},
+                          index=df_clean.index)
+    for column in key_columns:
+        todo = result["GPS_RouteID"].isna()
+        if not todo.any():
+            break
+        matched = match_routes(df_clean.loc[todo, column], route_map, index)
+        matched["RouteMatch"] = matched["RouteMatch"].map(lambda s: f"{column}:{s}", na_action="ignore")
+        result.loc[todo] = matched
+
+    df_joined = df_clean.copy()
+    df_joined["GPS_Filename"] = result["GPS_Filename"]
+    df_joined["GPS_RouteID"] = result["GPS_RouteID"].astype(float)
+    df_joined["RouteMatch"] = result["RouteMatch"]
+    return df_joined
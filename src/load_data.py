@@ -1,4 +1,8 @@
-import pandas as pd
+from src.store import load_activities
 
-def load_strava(path="data/activities.csv"):
-    return pd.read_csv(path)
\ No newline at end of file
+def load_strava(path="data/activities.csv", columns=None):
+    """
+    Load Strava activities. Reads through the columnar store, so only the
+    requested columns are loaded and dtypes (dates, IDs) are already set.
+    """
+    return load_activities(path, columns=columns)
\ No newline at end of file
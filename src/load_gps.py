@@ -1,6 +1,14 @@
 import os
-import gpxpy
+import xml.etree.ElementTree as ET
+import zipfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import pandas as pd
+
+from src.instrument import instrumented
+from src.tracks import TRACK_FIELDS, TrackCollection
 
 def load_gps_from_folder(folder_path):
     """
@@ -8,6 +16,8 @@ def load_gps_from_folder(folder_path):
     {filename: gpxpy object}
     Skips files that fail to parse.
     """
+    import gpxpy
+
     gps_data = {}
 
     for filename in os.listdir(folder_path):
@@ -23,11 +33,170 @@ def load_gps_from_folder(folder_path):
     print(f"✅ Loaded {len(gps_data)} GPX files from {folder_path}")
     return gps_data
 
+def parse_gpx_track(file_path):
+    """
+    Stream a GPX file and pull out the first track's points as NumPy arrays.
+
+    Unlike gpxpy.parse, the XML tree is never kept in memory: each <trkpt>
+    element is cleared as soon as its values have been read.
+
+    Returns:
+        dict: {"lat", "lon", "ele", "time", "hr"} arrays of equal length.
+              Missing elevation / heart rate are NaN, missing times are NaT.
+    """
+    lat, lon = array("d"), array("d")
+    ele, hr = array("f"), array("f")
+    times = []
+
+    tracks_done = 0
+    for _, elem in ET.iterparse(file_path, events=("end",)):
+        tag = elem.tag
+
+        if tag.endswith("trkpt"):
+            if tracks_done == 0:
+                point_ele = point_time = point_hr = None
+                for child in elem:
+                    child_tag = child.tag
+                    if child_tag.endswith("ele"):
+                        point_ele = child.text
+                    elif child_tag.endswith("time"):
+                        point_time = child.text
+                    elif child_tag.endswith("extensions"):
+                        for ext in child.iter():
+                            if ext.tag.endswith("hr"):
+                                point_hr = ext.text
+                lat.append(float(elem.get("lat")))
+                lon.append(float(elem.get("lon")))
+                ele.append(float(point_ele) if point_ele else np.nan)
+                hr.append(float(point_hr) if point_hr else np.nan)
+                times.append(point_time.strip().rstrip("Z") if point_time else "NaT")
+            elem.clear()
+        elif tag.endswith("trkseg"):
+            elem.clear()  # drop the emptied points of a finished segment
+        elif tag.endswith("trk"):
+            tracks_done += 1
+            elem.clear()
+
+    return {
+        "lat": np.frombuffer(lat, dtype=np.float64),
+        "lon": np.frombuffer(lon, dtype=np.float64),
+        "ele": np.frombuffer(ele, dtype=np.float32),
+        "time": np.array(times, dtype="datetime64[s]"),
+        "hr": np.frombuffer(hr, dtype=np.float32),
+    }
+
+def _parse_track_file(file_path):
+    """
+    Worker for load_tracks_from_folder: parse one file and, instead of
+    raising, return the error message so the caller can report it.
+    """
+    try:
+        return parse_gpx_track(file_path), None
+    except Exception as e:
+        return None, str(e)
+
+def _map_in_pool(func, items, workers):
+    """
+    Apply func to every item, in a process pool when workers > 1.
+    Results always come back in the same order as items.
+    """
+    if workers is None or workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    chunksize = max(1, len(items) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, items, chunksize=chunksize))
+
+def _cache_path(cache_dir, filename):
+    return os.path.join(cache_dir, filename + ".npz")
+
+def _read_cached_track(cache_path, stat):
+    """
+    Return the cached track dict if the cache entry exists and was written
+    for a file with the same mtime and size, otherwise None (also for a
+    truncated or corrupt entry, so the file is parsed again).
+    """
+    try:
+        with np.load(cache_path) as cached:
+            if int(cached["mtime_ns"]) != stat.st_mtime_ns or int(cached["size"]) != stat.st_size:
+                return None
+            return {field: cached[field] for field in TRACK_FIELDS}
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        return None
+
+def _write_cached_track(cache_path, track, stat):
+    """
+    Save a parsed track as .npz next to the file's mtime and size.
+    Written to a temporary file first so a crash never leaves a torn entry.
+    """
+    tmp_path = cache_path + ".tmp.npz"
+    np.savez(tmp_path, mtime_ns=stat.st_mtime_ns, size=stat.st_size, **track)
+    os.replace(tmp_path, cache_path)
+
+def list_gpx_files(folder_path):
+    """Sorted names of the GPX files in folder_path."""
+    return sorted(f for f in os.listdir(folder_path) if f.lower().endswith(".gpx"))
+
+@instrumented("gps.parse", items=len)
+def load_tracks_from_folder(folder_path, workers=1, cache_dir=None, filenames=None):
+    """
+    Streaming alternative to load_gps_from_folder.
+    Returns a TrackCollection, which reads like {filename: track dict from
+    parse_gpx_track} but keeps all points in contiguous arrays.
+    Files without a track are skipped; so are files that fail to parse.
+
+    With workers > 1 the files are parsed in a process pool. The result is
+    ordered by filename either way, so runs are reproducible.
+
+    With cache_dir set, parsed tracks are stored there as .npz files keyed by
+    filename, mtime and size, and later runs only parse new or changed files.
+
+    filenames limits loading to these GPX files of the folder (e.g. one
+    batch of a large export).
+    """
+    if filenames is None:
+        filenames = list_gpx_files(folder_path)
+    paths = {f: os.path.join(folder_path, f) for f in filenames}
+
+    parsed = {}
+    stats = {}
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for filename in filenames:
+            stats[filename] = os.stat(paths[filename])
+            track = _read_cached_track(_cache_path(cache_dir, filename), stats[filename])
+            if track is not None:
+                parsed[filename] = (track, None)
+
+    to_parse = [f for f in filenames if f not in parsed]
+    results = _map_in_pool(_parse_track_file, [paths[f] for f in to_parse], workers)
+    for filename, (track, error) in zip(to_parse, results):
+        parsed[filename] = (track, error)
+        if cache_dir is not None and error is None:
+            _write_cached_track(_cache_path(cache_dir, filename), track, stats[filename])
+
+    tracks = {}
+    for filename in filenames:
+        track, error = parsed[filename]
+        if error is not None:
+            print(f"⚠️ Skipping file {filename} due to parse error: {error}")
+        elif len(track["lat"]) > 0:
+            tracks[filename] = track
+
+    if cache_dir is not None:
+        print(f"♻️ Reused {len(filenames) - len(to_parse)} cached tracks, parsed {len(to_parse)} files")
+    print(f"✅ Loaded {len(tracks)} GPX tracks from {folder_path}")
+    return TrackCollection.from_tracks(tracks)
+
 def extract_coordinates(gpx):
     """
     Extract all coordinates from a GPX file.
-    Returns list of (lat, lon) tuples.
+    Accepts a gpxpy object or a track dict from parse_gpx_track.
+    Returns list of (lat, lon) tuples for gpxpy objects, and an (n, 2)
+    array for track dicts (no per-point Python objects).
     """
+    if isinstance(gpx, dict):
+        return np.column_stack((gpx["lat"], gpx["lon"]))
+
     coords = []
     if gpx.tracks:
         for segment in gpx.tracks[0].segments:
@@ -45,70 +214,220 @@ def resample_track(coords, n_points=100):
     idx = np.linspace(0, len(coords) - 1, n_points).astype(int)
     return coords[idx]
 
+EARTH_RADIUS_M = 6371000.0
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in meters between (lat1, lon1) and (lat2, lon2).
+    Works element-wise on NumPy arrays.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def resample_track_by_distance(coords, n_points=100):
+    """
+    Resample a GPS track to n_points spaced evenly along its length.
+
+    Unlike resample_track (evenly spaced by point index), the result does
+    not depend on the recording rate or on pauses, so the i-th point of two
+    runs of the same route lands at the same place.
+    coords: list of (lat, lon) tuples or an (n, 2) array
+    """
+    coords = np.asarray(coords, dtype=float)
+    if len(coords) < 2:
+        return coords
+
+    steps = haversine_m(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+    cumulative = np.concatenate(([0.0], np.cumsum(steps)))
+    if cumulative[-1] == 0:  # never moved
+        return np.repeat(coords[:1], n_points, axis=0)
+
+    targets = np.linspace(0, cumulative[-1], n_points)
+    return np.column_stack((
+        np.interp(targets, cumulative, coords[:, 0]),
+        np.interp(targets, cumulative, coords[:, 1]),
+    ))
+
+RESAMPLERS = {
+    "index": resample_track,
+    "distance": resample_track_by_distance,
+}
+
 def vectorize_gps_track(coords):
     """
     Flatten the resampled coordinates to a vector for clustering.
     """
     return np.array(coords).flatten()
 
+def _vectorize_track(args):
+    """
+    Worker for vectorize_tracks: resample one track and flatten it.
+    Returns (vector, error); vector is None for tracks with < 2 points.
+    """
+    track, n_points, method = args
+    try:
+        coords = np.column_stack((track["lat"], track["lon"]))
+        if len(coords) < 2:  # Skip tracks with too few points
+            return None, None
+        return vectorize_gps_track(RESAMPLERS[method](coords, n_points=n_points)), None
+    except Exception as e:
+        return None, str(e)
+
+@instrumented("gps.resample", items=lambda result: len(result[0]))
+def vectorize_tracks(tracks, n_points=100, workers=1, method="index"):
+    """
+    Resample and vectorize every track in {filename: track dict}.
+    method: "index" (resample_track) or "distance" (resample_track_by_distance)
+
+    Returns:
+        (ids, vectors): filenames that were vectorized, in input order,
+                        and a 2-D array with one row per filename.
+    """
+    filenames = list(tracks.keys())
+    results = _map_in_pool(_vectorize_track, [(tracks[f], n_points, method) for f in filenames], workers)
+
+    ids = []
+    vectors = []
+    for filename, (vector, error) in zip(filenames, results):
+        if error is not None:
+            print(f"⚠️ Skipping {filename} due to error: {error}")
+        elif vector is not None:
+            ids.append(filename)
+            vectors.append(vector)
+
+    return ids, np.array(vectors)
+
+SUMMARY_COLUMNS = ["n_tracks", "n_points", "centroid_lat", "centroid_lon", "min_lat", "min_lon",
+                   "max_lat", "max_lon", "start_lat", "start_lon", "finish_lat", "finish_lon"]
+
+def track_summaries(gps_data, filenames):
+    """
+    Per-track point count, lat/lon sums, bounding box and start/finish
+    point, reduced straight from the parsed arrays (no points are copied).
+
+    Returns:
+        dict of arrays aligned with filenames; missing or empty tracks have
+        n_points 0 and NaN coordinates
+    """
+    if isinstance(gps_data, TrackCollection):
+        return _collection_summaries(gps_data, filenames)
+
+    n = len(filenames)
+    out = {"n_points": np.zeros(n, dtype=np.int64)}
+    for key in ("sum_lat", "sum_lon", "min_lat", "min_lon", "max_lat", "max_lon",
+                "start_lat", "start_lon", "finish_lat", "finish_lon"):
+        out[key] = np.full(n, np.nan)
+
+    for i, filename in enumerate(filenames):
+        track = gps_data.get(filename)
+        if track is None:
+            continue
+        if isinstance(track, dict):
+            lat, lon = track["lat"], track["lon"]
+        else:
+            coords = np.array(extract_coordinates(track)).reshape(-1, 2)
+            lat, lon = coords[:, 0], coords[:, 1]
+        if len(lat) == 0:
+            continue
+        out["n_points"][i] = len(lat)
+        out["sum_lat"][i], out["sum_lon"][i] = lat.sum(), lon.sum()
+        out["min_lat"][i], out["max_lat"][i] = lat.min(), lat.max()
+        out["min_lon"][i], out["max_lon"][i] = lon.min(), lon.max()
+        out["start_lat"][i], out["start_lon"][i] = lat[0], lon[0]
+        out["finish_lat"][i], out["finish_lon"][i] = lat[-1], lon[-1]
+    return out
+
+def _collection_summaries(collection, filenames):
+    """track_summaries for a TrackCollection: reduceat over whole columns."""
+    n = len(filenames)
+    known = np.array([f in collection for f in filenames], dtype=bool)
+    positions = collection.positions([f for f, k in zip(filenames, known) if k])
+    out = {"n_points": np.zeros(n, dtype=np.int64)}
+    out["n_points"][known] = collection.lengths[positions]
+
+    starts = collection.offsets[:-1]
+    has_points = collection.lengths > 0
+    for key in ("sum_lat", "sum_lon", "min_lat", "min_lon", "max_lat", "max_lon",
+                "start_lat", "start_lon", "finish_lat", "finish_lon"):
+        out[key] = np.full(n, np.nan)
+    for field in ("lat", "lon"):
+        column = np.asarray(collection.columns[field])
+        per_track = {
+            # reduceat needs in-range, non-repeating starts: reduce only
+            # over tracks that have points
+            "sum": np.add.reduceat(column, starts[has_points]) if len(column) else np.array([]),
+            "min": np.minimum.reduceat(column, starts[has_points]) if len(column) else np.array([]),
+            "max": np.maximum.reduceat(column, starts[has_points]) if len(column) else np.array([]),
+            "start": column[starts[has_points]],
+            "finish": column[collection.offsets[1:][has_points] - 1],
+        }
+        for stat, values in per_track.items():
+            full = np.full(len(collection), np.nan)
+            full[has_points] = values
+            out[f"{stat}_{field}"][known] = full[positions]
+    return out
+
+@instrumented("gps.route_summaries", items=len)
+def route_summaries(gps_data, route_ids, labels):
+    """
+    Summarize every route cluster in one vectorized pass: the per-track
+    summaries are sorted by label and reduced per cluster with
+    np.add/minimum/maximum.reduceat.
+
+    Args:
+        gps_data: dict of {filename: track dict or gpx object}
+        route_ids: list of filenames that were vectorized
+        labels: cluster labels from DBSCAN (-1 = noise, skipped)
+
+    Returns:
+        DataFrame indexed by cluster ID with SUMMARY_COLUMNS: number of
+        tracks and points, centroid of all points, bounding box, and the
+        mean start and finish points of the tracks (as recorded, so runs
+        in the other direction swap them)
+    """
+    labels = np.asarray(labels)
+    per_track = track_summaries(gps_data, route_ids)
+    keep = (labels != -1) & (per_track["n_points"] > 0)
+    if not keep.any():
+        return pd.DataFrame(columns=SUMMARY_COLUMNS).rename_axis("RouteID")
+
+    order = np.flatnonzero(keep)[np.argsort(labels[keep], kind="stable")]
+    sorted_labels = labels[order]
+    cluster_ids, starts = np.unique(sorted_labels, return_index=True)
+    tracks = {key: values[order] for key, values in per_track.items()}
+
+    n_tracks = np.diff(np.append(starts, len(order)))
+    n_points = np.add.reduceat(tracks["n_points"], starts)
+    summary = pd.DataFrame({
+        "n_tracks": n_tracks,
+        "n_points": n_points,
+        "centroid_lat": np.add.reduceat(tracks["sum_lat"], starts) / n_points,
+        "centroid_lon": np.add.reduceat(tracks["sum_lon"], starts) / n_points,
+        "min_lat": np.minimum.reduceat(tracks["min_lat"], starts),
+        "min_lon": np.minimum.reduceat(tracks["min_lon"], starts),
+        "max_lat": np.maximum.reduceat(tracks["max_lat"], starts),
+        "max_lon": np.maximum.reduceat(tracks["max_lon"], starts),
+    }, index=pd.Index(cluster_ids, name="RouteID"))
+    for key in ("start_lat", "start_lon", "finish_lat", "finish_lon"):
+        summary[key] = np.add.reduceat(tracks[key], starts) / n_tracks
+    return summary
+
 def get_route_centroids(gps_data, route_ids, labels):
     """
     Calculate the center point (centroid) for each route cluster.
     
     Args:
-        gps_data: dict of {filename: gpx object}
+        gps_data: dict of {filename: gpx object or track dict}
         route_ids: list of filenames that were vectorized
         labels: cluster labels from DBSCAN
     
     Returns:
         dict: {cluster_id: (center_lat, center_lon)}
     """
-    route_centroids = {}
-    
-    # Group filenames by cluster label
-    cluster_map = {}
-    for filename, label in zip(route_ids, labels):
-        if label == -1:  # Skip noise
-            continue
-        if label not in cluster_map:
-            cluster_map[label] = []
-        cluster_map[label].append(filename)
-    
-    # Calculate centroid for each cluster
-    for cluster_id, filenames in cluster_map.items():
-        all_coords = []
-        for filename in filenames:
-            if filename in gps_data:
-                coords = extract_coordinates(gps_data[filename])
-                all_coords.extend(coords)
-        
-        if all_coords:
-            coords_array = np.array(all_coords)
-            center_lat = coords_array[:, 0].mean()
-            center_lon = coords_array[:, 1].mean()
-            route_centroids[cluster_id] = (center_lat, center_lon)
-    
-    return route_centroids
-
-def get_location_name(lat, lon):
-    """
-    Get the location name from coordinates using reverse geocoding.
-    Uses geopy with OpenStreetMap (free, no API key needed).
-    """
-    try:
-        from geopy.geocoders import Nominatim
-        geolocator = Nominatim(user_agent="strava_analyzer")
-        location = geolocator.reverse(f"{lat}, {lon}", language='en', timeout=5)
-        
-        # Extract useful parts of the address
-        address_parts = location.address.split(', ')
-        
-        # Try to get neighborhood/area name and city
-        if len(address_parts) >= 2:
-            area = address_parts[1] if len(address_parts) > 1 else address_parts[0]
-            city = address_parts[2] if len(address_parts) > 2 else ""
-            return f"{area}, {city}".strip(", ")
-        else:
-            return address_parts[0] if address_parts else "Unknown Location"
-    except Exception as e:
-        return "Unknown Location"
\ No newline at end of file
+    summary = route_summaries(gps_data, route_ids, labels)
+    return {
+        cluster_id: (lat, lon)
+        for cluster_id, lat, lon in zip(summary.index, summary["centroid_lat"], summary["centroid_lon"])
+    }
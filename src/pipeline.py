@@ -0,0 +1,617 @@
+"""
+Staged route-analysis pipeline.
+
+Each stage caches its result on the Pipeline object, and asking for a
+stage runs whatever it depends on first:
+
+    pipeline = Pipeline(workers=8)
+    route_stats = pipeline.run("stats")   # load → clean/vectorize → ... → stats
+
+Heavy libraries (sklearn, matplotlib, geopy, pyarrow, gpxpy) are only
+imported by the stages that use them.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.instrument import span
+from src.heatmap import HEATMAP_ZOOM
+from src.route_analysis import BLOCK_WEEKS, FORM_WINDOWS_WEEKS
+from src.track_filter import MAX_SPEED_MPS, SIMPLIFY_TOLERANCE_M
+
+STAGES = ("load", "validate", "filter", "clean", "vectorize", "cluster", "index", "label", "join", "stats",
+          "heatmap", "plot", "export")
+
+DEPENDENCIES = {
+    "load": (),
+    "validate": ("load",),
+    "filter": ("load", "validate"),
+    "clean": ("load",),
+    "vectorize": ("filter",),
+    "cluster": ("vectorize",),
+    "index": ("cluster",),
+    "label": ("cluster",),
+    "join": ("clean", "cluster"),
+    "stats": ("join",),
+    "heatmap": ("filter",),
+    "plot": ("stats",),
+    "export": ("stats",),
+}
+
+# Items each stage processed, for the instrumentation records
+STAGE_ITEMS = {
+    "load": lambda result: len(result["tracks"]),
+    "validate": lambda result: len(result["keep"]),
+    "filter": lambda result: result["tracks"].n_points,
+    "clean": len,
+    "vectorize": lambda result: len(result["ids"]),
+    "cluster": lambda result: len(result["labels"]),
+    "index": lambda result: len(result["route_ids"]),
+    "label": lambda result: len(result["names"]),
+    "join": lambda result: len(result["joined"]),
+    "stats": lambda result: len(result["route_stats"]) if result is not None else 0,
+    "heatmap": lambda result: len(result["heatmap"]["cells"]),
+    "plot": lambda result: len(result) if isinstance(result, list) else 0,
+    "export": lambda result: len(result) if result is not None else 0,
+}
+
+# Clustering radii in meters per route metric, tried in order until the
+# noise ratio is <= 50%
+CLUSTER_EPS_M = {"frechet": (200, 300), "descriptor": (150, 200)}
+
+class Pipeline:
+    """
+    Route analysis for one athlete's Strava export.
+
+    Args:
+        csv_path: Strava activities.csv
+        gps_folder: folder with the GPX files
+        output_dir: where route_locations.txt and the exports are written
+        cache_dir: track cache, activity store, geocode cache and saved
+                   cluster state
+        workers: worker processes for GPX parsing / resampling
+        full_recluster: ignore the saved state and cluster from scratch
+        resample_method: "distance" or "index" (see vectorize_tracks)
+        route_metric: "frechet" (direction/loop-start invariant) or
+                      "descriptor" (compact route descriptors)
+        cluster_eps: clustering radii in meters; default per route_metric
+        geocode_offline: name routes from the gazetteer, never the network
+        gazetteer_path: CSV with name,lat,lon for offline geocoding
+        geocode_rate_limiter: limiter for online geocoding, to share the
+                              Nominatim rate with other processes (default:
+                              one per label stage)
+        plot_dir: render charts headlessly into this folder instead of
+                  showing them in windows
+        plot_formats: file formats for plot_dir, e.g. ("png", "svg")
+        as_of: end date of the rolling form windows (default: latest run)
+        block_weeks: training block length for the per-block stats
+        max_speed_mps: GPS spike threshold (None keeps spikes)
+        simplify_tolerance_m: RDP tolerance for the route shapes (None or
+                              0 clusters the unsimplified points)
+        heatmap_zoom: web-mercator zoom of the heatmap grid
+        heatmap_formats: heatmap tile formats, "png" and/or "npy"
+        drop_duplicates: leave duplicate uploads of a run out of every
+                         stage after validate (otherwise only report them)
+    """
+
+    def __init__(self, csv_path="data/activities.csv", gps_folder="data/activities/activities",
+                 output_dir="data", cache_dir="data/cache", workers=1, full_recluster=False,
+                 resample_method="distance", route_metric="frechet", cluster_eps=None,
+                 geocode_offline=False, gazetteer_path="data/gazetteer.csv", geocode_rate_limiter=None,
+                 plot_dir=None, plot_formats=("png",), as_of=None, block_weeks=BLOCK_WEEKS,
+                 max_speed_mps=MAX_SPEED_MPS, simplify_tolerance_m=SIMPLIFY_TOLERANCE_M, heatmap_zoom=HEATMAP_ZOOM,
+                 heatmap_formats=("png",), drop_duplicates=True):
+        self.csv_path = csv_path
+        self.gps_folder = gps_folder
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.full_recluster = full_recluster
+        self.resample_method = resample_method
+        self.route_metric = route_metric
+        self.cluster_eps = tuple(cluster_eps or CLUSTER_EPS_M[route_metric])
+        self.geocode_offline = geocode_offline
+        self.gazetteer_path = gazetteer_path
+        self.geocode_rate_limiter = geocode_rate_limiter
+        self.plot_dir = plot_dir
+        self.plot_formats = tuple(plot_formats)
+        self.as_of = as_of
+        self.block_weeks = block_weeks
+        self.max_speed_mps = max_speed_mps
+        self.simplify_tolerance_m = simplify_tolerance_m
+        self.heatmap_zoom = heatmap_zoom
+        self.heatmap_formats = tuple(heatmap_formats)
+        self.drop_duplicates = drop_duplicates
+        self.results = {}
+
+    @property
+    def settings(self):
+        """Options the saved cluster state depends on."""
+        return {"resample": self.resample_method, "metric": self.route_metric, "track_metrics": True,
+                "max_speed_mps": self.max_speed_mps, "simplify_tolerance_m": self.simplify_tolerance_m,
+                "cluster_eps": [float(eps) for eps in self.cluster_eps]}
+
+    @property
+    def state_dir(self):
+        return os.path.join(self.cache_dir, "pipeline")
+
+    @property
+    def index_path(self):
+        return os.path.join(self.cache_dir, "route_index.npz")
+
+    @property
+    def file_index_path(self):
+        return os.path.join(self.cache_dir, "gps_files.parquet")
+
+    @property
+    def heatmap_path(self):
+        return os.path.join(self.cache_dir, "heatmap.npz")
+
+    def output_path(self, filename):
+        return os.path.join(self.output_dir, filename)
+
+    def run(self, stage):
+        """
+        Run one stage (and, first, any stage it depends on that has not
+        run yet). Results are cached, so running a stage twice is free.
+        """
+        if stage not in DEPENDENCIES:
+            raise ValueError(f"Unknown stage {stage!r}; expected one of {', '.join(STAGES)}")
+        if stage not in self.results:
+            for dependency in DEPENDENCIES[stage]:
+                self.run(dependency)
+            with span(f"stage.{stage}") as s:
+                self.results[stage] = getattr(self, f"_run_{stage}")()
+                s.items = STAGE_ITEMS[stage](self.results[stage])
+        return self.results[stage]
+
+    def run_all(self, stages=STAGES):
+        for stage in stages:
+            self.run(stage)
+        return self.results
+
+    def invalidate(self, stage):
+        """Drop a cached stage result and every result that depends on it."""
+        self.results.pop(stage, None)
+        for other, dependencies in DEPENDENCIES.items():
+            if stage in dependencies:
+                self.invalidate(other)
+
+    # --------------------------------------------------------
+    # Stages
+    # --------------------------------------------------------
+    def _run_load(self):
+        """Load the activities CSV (projected columns) and the GPS tracks."""
+        from src.clean_data import INPUT_COLUMNS
+        from src.load_gps import load_tracks_from_folder
+        from src.store import load_activities
+
+        df = load_activities(self.csv_path, columns=INPUT_COLUMNS,
+                             store_path=os.path.join(self.cache_dir, "activities.parquet"))
+        gps_raw = load_tracks_from_folder(self.gps_folder, workers=self.workers,
+                                          cache_dir=os.path.join(self.cache_dir, "tracks"))
+        print("GPS files loaded:", len(gps_raw))
+
+        if len(gps_raw) == 0:
+            raise ValueError(f"No GPS tracks found! Check the '{self.gps_folder}' folder and GPX files.")
+        return {"activities": df, "tracks": gps_raw}
+
+    def _run_validate(self):
+        """
+        Fingerprint the GPX files and flag duplicate uploads, orphan files
+        (no CSV row) and files without a track, before anything is
+        filtered or clustered.
+        """
+        from src.dedup import validate_export
+
+        loaded = self.results["load"]
+        report, keep = validate_export(loaded["activities"], self.gps_folder, loaded["tracks"],
+                                       index_path=self.file_index_path)
+        return {"report": report, "keep": keep}
+
+    def _run_filter(self):
+        """
+        Drop duplicate timestamps and GPS spikes (the tracks the metrics
+        use), then stationary points and RDP-simplify (the shapes that are
+        vectorized and clustered).
+        """
+        from src.track_filter import filter_tracks
+
+        tracks = self.results["load"]["tracks"]
+        keep = self.results["validate"]["keep"]
+        if self.drop_duplicates and len(keep) < len(tracks):
+            print(f"🚫 Leaving out {len(tracks) - len(keep)} duplicate tracks")
+            tracks = tracks.subset(keep)
+        cleaned, shapes, report = filter_tracks(tracks, max_speed_mps=self.max_speed_mps,
+                                                simplify_tolerance_m=self.simplify_tolerance_m)
+        return {"tracks": cleaned, "shapes": shapes, "report": report}
+
+    def _run_clean(self):
+        from src.clean_data import clean
+
+        return clean(self.results["load"]["activities"])
+
+    def _run_vectorize(self):
+        """
+        Resample tracks into vectors. With a usable saved state only the
+        tracks it has not seen are vectorized, plus those whose file was
+        edited since; they and the rest of their routes are clustered again.
+        """
+        from src.heatmap import track_keys
+        from src.incremental import load_state, stale_tracks
+        from src.load_gps import vectorize_tracks
+
+        gps_raw = self.results["filter"]["shapes"]
+        keys = dict(zip(gps_raw, track_keys(self.gps_folder, list(gps_raw))))
+
+        state = None if self.full_recluster else load_state(self.state_dir)
+        if state is not None and not set(state["ids"]) <= set(gps_raw):
+            print("⚠️ Saved state refers to GPS files that are gone. Running a full recluster...")
+            state = None
+        if state is not None and state["settings"] != self.settings:
+            print("⚠️ Saved state was built with different settings. Running a full recluster...")
+            state = None
+        if state is not None and state["keys"] is None:
+            print("⚠️ Saved state has no file keys to spot edited GPS files. Running a full recluster...")
+            state = None
+
+        changed = set()
+        if state is not None:
+            changed, stale = stale_tracks(state, keys)
+            if changed:
+                print(f"✏️ {len(changed)} GPS files changed since the saved state; re-clustering them "
+                      f"and the {stale.sum() - len(changed)} other tracks of their routes")
+            # Unchanged tracks of the affected routes keep their vectors
+            saved_ids = np.array(state["ids"], dtype=str)
+            reuse = stale & ~np.isin(saved_ids, list(changed))
+            kept, kept_vectors = saved_ids[reuse].tolist(), state["vectors"][reuse]
+            state = dict(state, ids=saved_ids[~stale].tolist(), vectors=state["vectors"][~stale],
+                         labels=np.asarray(state["labels"])[~stale])
+
+            known = set(state["ids"]) | set(kept)
+            new_tracks = {f: t for f, t in gps_raw.items() if f not in known}
+            new_ids, new_vectors = vectorize_tracks(new_tracks, n_points=100, workers=self.workers,
+                                                    method=self.resample_method)
+            print(f"♻️ Loaded saved state with {len(saved_ids)} tracks, {len(new_ids) - len(changed)} new")
+            ids = state["ids"] + kept + new_ids
+            vectors = np.vstack([state["vectors"], kept_vectors]
+                                + ([np.asarray(new_vectors)] if len(new_ids) else []))
+        else:
+            ids, vectors = vectorize_tracks(gps_raw, n_points=100, workers=self.workers,
+                                            method=self.resample_method)
+            print(f"Successfully vectorized {len(vectors)} GPS tracks")
+
+            if len(vectors) == 0:
+                raise ValueError("No valid GPS tracks were vectorized!")
+
+        return {"ids": ids, "vectors": vectors, "state": state, "keys": [keys[i] for i in ids],
+                "changed": changed}
+
+    def _run_cluster(self):
+        """
+        Cluster the route vectors, or assign only the new ones to the
+        clusters of the saved state.
+        """
+        from src.clustering import (fit_route_frame, route_descriptors, cluster_routes,
+                                    route_distance_graph, cluster_routes_by_similarity)
+        from src.incremental import assign_to_clusters, assign_from_graph
+
+        ids = self.results["vectorize"]["ids"]
+        vectors = self.results["vectorize"]["vectors"]
+        state = self.results["vectorize"]["state"]
+
+        if state is not None:
+            eps = state["eps"]
+            frame = state["frame"]
+            n_known = len(state["ids"])
+            if self.route_metric == "frechet":
+                graph = route_distance_graph(vectors, frame, eps, rows=np.arange(n_known, len(ids)))
+                known_labels, new_labels = assign_from_graph(graph, state["labels"], n_known)
+            else:
+                descriptors = route_descriptors(vectors, frame)
+                known_labels, new_labels = assign_to_clusters(descriptors[n_known:], descriptors[:n_known],
+                                                              state["labels"], eps)
+            labels = np.concatenate([known_labels, new_labels])
+
+            n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
+            print(f"Assigned new tracks: {n_clusters} clusters in total")
+        else:
+            # Both metrics work in a local frame in meters and build one sparse
+            # neighbour graph at the largest eps, so every eps comes from one fit.
+            frame = fit_route_frame(vectors)
+            if self.route_metric == "frechet":
+                labels_by_eps = cluster_routes_by_similarity(vectors, frame, self.cluster_eps, min_samples=1)
+            else:
+                descriptors = route_descriptors(vectors, frame)
+                labels_by_eps = cluster_routes(descriptors, self.cluster_eps, min_samples=1)
+
+            for eps in self.cluster_eps:
+                labels = labels_by_eps[eps]
+                n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
+                n_noise = np.sum(labels == -1)
+                print(f"DBSCAN (eps={eps}m) found {n_clusters} clusters, {n_noise} noise points")
+                # If too many noise points, fall back to the next, more lenient eps
+                if n_noise / len(labels) <= 0.5:
+                    break
+                print("⚠️ High noise ratio detected. Using more lenient parameters...")
+
+        return {
+            "labels": labels,
+            "eps": eps,
+            "frame": frame,
+            "route_map": dict(zip(ids, labels)),  # filename → cluster ID
+        }
+
+    def _run_index(self):
+        """Build and save the route index used by match_tracks lookups."""
+        from src.route_index import build_route_index, save_route_index
+
+        vectorized = self.results["vectorize"]
+        clustered = self.results["cluster"]
+        # Descriptor eps is not a route distance; use the Fréchet radius there
+        threshold = clustered["eps"] if self.route_metric == "frechet" else CLUSTER_EPS_M["frechet"][0]
+        index = build_route_index(vectorized["ids"], vectorized["vectors"], clustered["labels"],
+                                  clustered["frame"], threshold, resample=self.resample_method)
+        save_route_index(self.index_path, index)
+        return index
+
+    def match(self, tracks, threshold_m=None, fast=False):
+        """
+        Which known route is each of these tracks? Uses the saved route
+        index, building it (and running what it needs) if there is none.
+
+        Args:
+            tracks: {name: track dict from parse_gpx_track}
+            threshold_m: route distance above which a track is a new route
+            fast: Hausdorff ranking for sub-millisecond lookups (see
+                  match_tracks)
+
+        Returns:
+            DataFrame from match_tracks
+        """
+        from src.route_index import load_route_index, match_tracks
+        from src.track_filter import filter_tracks
+
+        if "index" not in self.results:
+            index = load_route_index(self.index_path)
+            if index is not None and index["resample"] == self.resample_method:
+                self.results["index"] = index
+        # Same cleanup and simplification as the indexed routes had
+        _, shapes, _ = filter_tracks(tracks, max_speed_mps=self.max_speed_mps,
+                                     simplify_tolerance_m=self.simplify_tolerance_m)
+        return match_tracks(self.run("index"), shapes, threshold_m, fast)
+
+    def _run_label(self):
+        """
+        Summary (centroid, bounding box, start/finish) and location name for
+        every route; writes route_locations.txt.
+        """
+        from src.geocode import get_location_names
+        from src.load_gps import route_summaries
+
+        ids = self.results["vectorize"]["ids"]
+        labels = self.results["cluster"]["labels"]
+
+        summaries = route_summaries(self.results["filter"]["tracks"], ids, labels)
+        route_centroids = dict(zip(summaries.index, zip(summaries["centroid_lat"], summaries["centroid_lon"])))
+        route_names = get_location_names(
+            route_centroids,
+            cache_path=os.path.join(self.cache_dir, "geocode.json"),
+            offline=self.geocode_offline,
+            gazetteer_path=self.gazetteer_path,
+            rate_limiter=self.geocode_rate_limiter,
+        )
+
+        print("\n" + "=" * 70)
+        print("ROUTE CLUSTERS - GENERAL LOCATIONS")
+        print("=" * 70)
+
+        location_list = []  # For saving to file
+        for cluster_id in sorted(route_centroids.keys()):
+            lat, lon = route_centroids[cluster_id]
+            output_line = f"Route {cluster_id:3d} → {route_names[cluster_id]} ({lat:.4f}, {lon:.4f})"
+            print(output_line)
+            print(f"           📍 https://maps.google.com/?q={lat},{lon}\n")
+            location_list.append(output_line)
+
+        locations_path = self.output_path("route_locations.txt")
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = f"{locations_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("=" * 70 + "\n")
+            f.write("ROUTE CLUSTERS - GENERAL LOCATIONS\n")
+            f.write("=" * 70 + "\n\n")
+            for line in location_list:
+                f.write(line + "\n")
+            f.write("\n" + "=" * 70 + "\n")
+            f.write("CLUSTER IDS AND COORDINATES\n")
+            f.write("=" * 70 + "\n\n")
+            for cluster_id in sorted(route_centroids.keys()):
+                lat, lon = route_centroids[cluster_id]
+                f.write(f"Route {cluster_id}: {route_names[cluster_id]}\n")
+                f.write(f"  Latitude: {lat:.6f}\n")
+                f.write(f"  Longitude: {lon:.6f}\n")
+                f.write(f"  Maps: https://maps.google.com/?q={lat},{lon}\n\n")
+        os.replace(tmp_path, locations_path)
+
+        print(f"\n✅ Route locations saved to: {locations_path}")
+        return {"centroids": route_centroids, "names": route_names, "summaries": summaries}
+
+    def _run_join(self):
+        """Attach GPS_Filename / GPS_RouteID to the cleaned activities."""
+        from src.join import join_routes
+
+        df_clean = self.results["clean"]
+        route_map = self.results["cluster"]["route_map"]
+
+        # Resolve every row at once through a normalized key index (exact name,
+        # + ".gpx", basename, stem, activity ID); Filename is the fallback column.
+        print("\n🔍 Matching activities to GPS routes...")
+        df_joined = join_routes(df_clean, route_map)
+        print(df_joined["RouteMatch"].value_counts().to_string())
+
+        matched = df_joined["GPS_RouteID"].notna().sum()
+        print(f"\n✓ Matched activities: {matched} out of {len(df_joined)}")
+
+        if matched == 0:
+            print("\n⚠️ WARNING: No activities matched GPS files!")
+            print("This likely means the Activity ID/Filename format doesn't match the GPX filenames.")
+            print("\nTip: Check if your CSV has 'Activity ID' or 'Filename' column")
+            print("and ensure it matches the GPX filename format exactly.")
+
+        df_clustered = df_joined.dropna(subset=["GPS_RouteID"]).copy()
+        df_clustered["GPS_RouteID"] = df_clustered["GPS_RouteID"].astype(int)
+        # Remove noise points (label -1 from DBSCAN)
+        df_clustered = df_clustered[df_clustered["GPS_RouteID"] != -1].copy()
+
+        print(f"Activities with valid GPS clusters: {len(df_clustered)} out of {len(df_joined)}")
+        return {"joined": df_joined, "clustered": df_clustered}
+
+    def _run_stats(self):
+        """
+        Per-trackpoint metrics, per-route stats, rolling form and per
+        season / training block stats; saves the cluster state for the next
+        incremental run. Returns None if nothing clustered.
+        """
+        from src.incremental import changed_routes, save_state, update_route_stats
+        from src.route_analysis import compute_route_form, compute_route_periods, compute_route_stats
+        from src.track_metrics import compute_track_metrics
+
+        df_clustered = self.results["join"]["clustered"]
+        if len(df_clustered) == 0:
+            print("\n❌ No clustered activities to analyze.")
+            print("Check the filename matching above.")
+            return None
+
+        gps_raw = self.results["filter"]["tracks"]
+        vectorized = self.results["vectorize"]
+        clustered = self.results["cluster"]
+        state = vectorized["state"]
+
+        # Ensure RouteID is a simple integer column
+        df_for_stats = df_clustered.copy()
+        df_for_stats["RouteID"] = df_for_stats["GPS_RouteID"].astype(int)
+
+        # Per-trackpoint metrics (GAP, pace variability, HR zones) per activity
+        track_metrics, track_splits = compute_track_metrics(
+            gps_raw.subset(df_for_stats["GPS_Filename"].dropna().unique())
+        )
+        df_for_stats = df_for_stats.merge(track_metrics, on="GPS_Filename", how="left")
+        print(f"\nUnique routes: {df_for_stats['RouteID'].nunique()}")
+
+        stats_routes = dict(zip(df_for_stats["Activity ID"], df_for_stats["RouteID"]))
+        if state is not None and state["route_stats"] is not None and state["stats_routes"] is not None:
+            # Only regroup the routes whose activities were added, removed or moved
+            routes = changed_routes(state["stats_routes"], stats_routes)
+            # Activities whose GPX file was edited have new metrics
+            routes |= set(df_for_stats.loc[df_for_stats["GPS_Filename"].isin(vectorized["changed"]), "RouteID"])
+            print(f"♻️ Updating stats for {len(routes)} routes with changed activities")
+            route_stats = update_route_stats(state["route_stats"], df_for_stats, routes)
+        else:
+            route_stats = compute_route_stats(df_for_stats)
+
+        save_state(self.state_dir, vectorized["ids"], vectorized["vectors"], clustered["labels"],
+                   clustered["eps"], clustered["frame"], route_stats, stats_routes, settings=self.settings,
+                   keys=vectorized["keys"])
+        print(f"\n✓ Route stats computed for {len(route_stats)} routes:")
+        print(route_stats.head())
+
+        # Windows end at the latest run, so form is recomputed for every
+        # route each time (it is one vectorized pass)
+        route_form = compute_route_form(df_for_stats, as_of=self.as_of)
+        route_periods = pd.concat([
+            compute_route_periods(df_for_stats, "season"),
+            compute_route_periods(df_for_stats, "block", block_weeks=self.block_weeks),
+        ], ignore_index=True)
+        print(f"📈 Rolling form ({', '.join(f'{w} weeks' for w in FORM_WINDOWS_WEEKS)}) "
+              f"and {len(route_periods)} season / block rows computed")
+
+        return {"route_stats": route_stats, "activities": df_for_stats, "splits": track_splits,
+                "route_form": route_form, "route_periods": route_periods}
+
+    def _run_heatmap(self):
+        """
+        Add the activities the saved heatmap has not seen yet and re-render
+        the tiles they touched into output_dir/heatmap. The heatmap is
+        rebuilt from scratch if its zoom, the GPS filter or duplicate
+        handling changed, or if activities it holds are gone or changed.
+        """
+        import shutil
+
+        from src.heatmap import add_tracks, empty_heatmap, export_heatmap, load_heatmap, save_heatmap, track_keys
+
+        settings = {"zoom": self.heatmap_zoom, "max_speed_mps": self.max_speed_mps,
+                    "drop_duplicates": self.drop_duplicates}
+        tile_dir = self.output_path("heatmap")
+        heatmap = None if self.full_recluster else load_heatmap(self.heatmap_path)
+        rebuild = heatmap is None or heatmap.get("settings") != settings or not os.path.isdir(tile_dir)
+        if rebuild:
+            heatmap = empty_heatmap(self.heatmap_zoom, settings)
+
+        tracks = self.results["filter"]["tracks"]
+        heatmap, tiles = add_tracks(heatmap, tracks, track_keys(self.gps_folder, tracks.names))
+        rebuild = rebuild or tiles is None
+        if tiles or rebuild:
+            save_heatmap(self.heatmap_path, heatmap)
+        if rebuild and os.path.isdir(tile_dir):
+            shutil.rmtree(tile_dir)  # tiles of activities that are gone
+        paths = export_heatmap(heatmap, tile_dir, formats=self.heatmap_formats, tiles=None if rebuild else tiles)
+        print(f"🗺️ Wrote {len(paths)} heatmap tiles to {tile_dir}")
+        return {"heatmap": heatmap, "tiles": paths}
+
+    def _run_plot(self):
+        """
+        Show the summary charts, or with plot_dir write them plus one
+        dashboard per route to files (returns their paths).
+        """
+        from src.plots import (plot_fastest_routes, plot_hardest_routes, plot_most_consistent_routes,
+                               render_all_plots)
+
+        stats = self.results["stats"]
+        if stats is None:
+            return None
+        if self.plot_dir is not None:
+            label = self.results.get("label")
+            return render_all_plots(
+                stats["route_stats"], stats["activities"], stats["splits"],
+                route_names=label["names"] if label else None,
+                output_dir=self.plot_dir, formats=self.plot_formats, workers=self.workers,
+            )
+        plot_fastest_routes(stats["route_stats"])
+        plot_hardest_routes(stats["route_stats"])
+        plot_most_consistent_routes(stats["route_stats"])
+        return True
+
+    def _run_export(self):
+        """
+        Write the cleaned + clustered activities, route stats, splits, form,
+        periods, the points the GPS filter removed per track and the GPX
+        validation report.
+        """
+        from src.store import save_output
+
+        stats = self.results["stats"]
+        if stats is None:
+            return None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = [
+            self.output_path("cleaned_strava_with_gps.csv"),
+            self.output_path("route_stats_gps.csv"),
+            self.output_path("track_splits.csv"),
+            self.output_path("route_form_gps.csv"),
+            self.output_path("route_periods_gps.csv"),
+            self.output_path("track_filter_gps.csv"),
+            self.output_path("gps_validation.csv"),
+        ]
+        save_output(self.results["join"]["joined"], paths[0])
+        save_output(stats["route_stats"], paths[1])
+        save_output(stats["splits"], paths[2])
+        save_output(stats["route_form"].reset_index(), paths[3])
+        save_output(stats["route_periods"], paths[4])
+        save_output(self.results["filter"]["report"], paths[5])
+        save_output(self.results["validate"]["report"], paths[6])
+
+        print("✅ Export complete!")
+        return paths
@@ -1,80 +1,239 @@
-import matplotlib.pyplot as plt
-import pandas as pd
+import os
 
-def plot_fastest_routes(route_stats, top_n=10):
-    if len(route_stats) == 0:
-        print("⚠️ No route stats to plot!")
-        return
-    
-    # Sort by lowest pace (fastest = lowest min/mile)
-    df_plot = route_stats.sort_values("Pace_min_per_mile_mean", ascending=True).head(top_n)
-    
-    # Create meaningful labels: show distance and count
-    labels = [f"Route {int(row['RouteID'])}\n({row['Distance_mean']:.1f}mi, {int(row['Distance_count'])} runs)" 
-              for _, row in df_plot.iterrows()]
-
-    plt.figure(figsize=(12, 6))
-    plt.bar(range(len(df_plot)), df_plot["Pace_min_per_mile_mean"], color='skyblue')
-    plt.xlabel("Route")
-    plt.ylabel("Pace (min/mile)")
-    plt.title(f"Top {top_n} Fastest Routes (by GPS similarity)")
-    
-    # Scale y-axis to start near the minimum value to see differences better
-    min_pace = df_plot["Pace_min_per_mile_mean"].min()
-    max_pace = df_plot["Pace_min_per_mile_mean"].max()
-    y_margin = (max_pace - min_pace) * 0.1  # Add 10% margin
-    plt.ylim(min_pace - y_margin, max_pace + y_margin)
-    
-    # Format y-axis as MM:SS (e.g., 7:45, 9:15)
-    def pace_formatter(x, pos):
-        minutes = int(x)
-        seconds = int((x - minutes) * 60)
-        return f"{minutes}:{seconds:02d}"
-    
+import numpy as np
+
+from src.load_gps import _map_in_pool
+
+# Output formats written by the headless renderer
+PLOT_FORMATS = ("png",)
+
+# Summary charts: (file stem, column, ascending, color, y label, title)
+SUMMARY_PLOTS = {
+    "fastest": ("Fastest", "Pace_min_per_mile_mean", True, "skyblue",
+                "Pace (min/mile)", "Top {top_n} Fastest Routes (by GPS similarity)"),
+    "hardest": ("Hardest", "Elevation Gain_mean", False, "salmon",
+                "Elevation Gain (meters)", "Top {top_n} Hardest Routes (by GPS similarity)"),
+    "consistent": ("consistent", "Pace_min_per_mile_std", True, "lightgreen",
+                   "Pace Variability (std dev in min/mile)", "Top {top_n} Most Consistent Routes (by GPS similarity)"),
+}
+
+def pace_formatter(x, pos):
+    """Format min/mile as MM:SS (e.g., 7:45, 9:15)."""
+    minutes = int(x)
+    seconds = int((x - minutes) * 60)
+    return f"{minutes}:{seconds:02d}"
+
+def _route_labels(df_plot):
+    """'Route 12\\n(3.1mi, 8 runs)' for every row, built column-wise."""
+    return (
+        "Route " + df_plot["RouteID"].astype(int).astype(str)
+        + "\n(" + df_plot["Distance_mean"].map("{:.1f}".format)
+        + "mi, " + df_plot["Distance_count"].astype(int).astype(str) + " runs)"
+    ).tolist()
+
+def _draw_summary(ax, route_stats, kind, top_n=10):
+    """Draw one of the SUMMARY_PLOTS bar charts onto ax."""
     from matplotlib.ticker import FuncFormatter
-    plt.gca().yaxis.set_major_formatter(FuncFormatter(pace_formatter))
-    
-    plt.xticks(range(len(df_plot)), labels, rotation=45, ha='right')
-    plt.tight_layout()
-    plt.show()
 
-def plot_hardest_routes(route_stats, top_n=10):
+    _, column, ascending, color, ylabel, title = SUMMARY_PLOTS[kind]
+    df_plot = route_stats.sort_values(column, ascending=ascending).head(top_n)
+
+    ax.bar(range(len(df_plot)), df_plot[column], color=color)
+    ax.set_xlabel("Route")
+    ax.set_ylabel(ylabel)
+    ax.set_title(title.format(top_n=top_n))
+
+    if kind == "fastest":
+        # Scale y-axis to start near the minimum value to see differences better
+        min_pace = df_plot[column].min()
+        max_pace = df_plot[column].max()
+        y_margin = (max_pace - min_pace) * 0.1  # Add 10% margin
+        ax.set_ylim(min_pace - y_margin, max_pace + y_margin)
+        ax.yaxis.set_major_formatter(FuncFormatter(pace_formatter))
+
+    ax.set_xticks(range(len(df_plot)))
+    ax.set_xticklabels(_route_labels(df_plot), rotation=45, ha='right')
+
+def _show_summary(route_stats, kind, top_n):
+    import matplotlib.pyplot as plt
+
     if len(route_stats) == 0:
         print("⚠️ No route stats to plot!")
         return
-    
-    # Sort by elevation gain descending
-    df_plot = route_stats.sort_values("Elevation Gain_mean", ascending=False).head(top_n)
-    
-    # Create meaningful labels: show distance and count
-    labels = [f"Route {int(row['RouteID'])}\n({row['Distance_mean']:.1f}mi, {int(row['Distance_count'])} runs)" 
-              for _, row in df_plot.iterrows()]
-
-    plt.figure(figsize=(12, 6))
-    plt.bar(range(len(df_plot)), df_plot["Elevation Gain_mean"], color='salmon')
-    plt.xlabel("Route")
-    plt.ylabel("Elevation Gain (meters)")
-    plt.title(f"Top {top_n} Hardest Routes (by GPS similarity)")
-    plt.xticks(range(len(df_plot)), labels, rotation=45, ha='right')
-    plt.tight_layout()
+    fig, ax = plt.subplots(figsize=(12, 6))
+    _draw_summary(ax, route_stats, kind, top_n)
+    fig.tight_layout()
     plt.show()
 
+def plot_fastest_routes(route_stats, top_n=10):
+    _show_summary(route_stats, "fastest", top_n)
+
+def plot_hardest_routes(route_stats, top_n=10):
+    _show_summary(route_stats, "hardest", top_n)
+
 def plot_most_consistent_routes(route_stats, top_n=10):
+    _show_summary(route_stats, "consistent", top_n)
+
+# --------------------------------------------------------
+# Headless rendering
+# --------------------------------------------------------
+def _agg_figure(figsize):
+    """
+    A figure drawn by the Agg canvas directly: no pyplot, no GUI backend,
+    nothing registered globally, so it is safe in worker processes.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+def _save(fig, path_stem, formats):
+    paths = [f"{path_stem}.{fmt}" for fmt in formats]
+    for path in paths:
+        fig.savefig(path)
+    return paths
+
+def _render_summary(args):
+    route_stats, kind, top_n, path_stem, formats = args
+    fig = _agg_figure((12, 6))
+    _draw_summary(fig.add_subplot(), route_stats, kind, top_n)
+    fig.tight_layout()
+    return _save(fig, path_stem, formats)
+
+class _RouteTemplate:
+    """
+    Per-route dashboard whose axes, artists and formatters are built once
+    and re-filled for every route: top, pace of each run over time; bottom,
+    mean pace of every mile split.
+    """
+
+    def __init__(self):
+        import matplotlib.dates as mdates
+        from matplotlib.ticker import FuncFormatter
+
+        self.fig = _agg_figure((10, 7))
+        self.ax_runs, self.ax_splits = self.fig.subplots(2, 1)
+        self.title = self.fig.suptitle("")
+
+        self.runs, = self.ax_runs.plot([], [], "o-", color="skyblue", markersize=4)
+        self.ax_runs.set_ylabel("Pace (min/mile)")
+        self.ax_runs.xaxis.set_major_locator(mdates.AutoDateLocator())
+        self.ax_runs.xaxis.set_major_formatter(mdates.DateFormatter("%b %Y"))
+
+        self.splits, = self.ax_splits.plot([], [], "s-", color="salmon")
+        self.ax_splits.set_xlabel("Mile")
+        self.ax_splits.set_ylabel("Split pace (min/mile)")
+
+        for ax in (self.ax_runs, self.ax_splits):
+            ax.yaxis.set_major_formatter(FuncFormatter(pace_formatter))
+            ax.grid(alpha=0.3)
+        self.fig.tight_layout(rect=(0, 0, 1, 0.95))
+
+    def render(self, route, path_stem, formats):
+        self.title.set_text(route["title"])
+        self.runs.set_data(route["dates"], route["pace"])
+        self.splits.set_data(route["split"], route["split_pace"])
+        for ax in (self.ax_runs, self.ax_splits):
+            ax.relim()
+            ax.autoscale_view()
+        return _save(self.fig, path_stem, formats)
+
+def _render_route_chunk(args):
+    """Render a batch of route dashboards with one reused template."""
+    routes, output_dir, formats = args
+    template = _RouteTemplate()
+    paths = []
+    for route in routes:
+        paths += template.render(route, os.path.join(output_dir, f"route_{route['route_id']}"), formats)
+    return paths
+
+def _route_payloads(activities, splits=None, route_names=None):
+    """
+    Per-route plot data (run dates and paces, mean split paces), split out
+    of the activity and split tables by sorting once and slicing.
+    """
+    import matplotlib.dates as mdates
+
+    runs = activities[["RouteID", "Activity Date", "Average Speed"]].dropna()
+    runs = runs.sort_values(["RouteID", "Activity Date"], kind="stable")
+    route_ids = runs["RouteID"].to_numpy(dtype=np.int64)
+    dates = mdates.date2num(runs["Activity Date"].to_numpy(dtype="datetime64[s]"))
+    pace = 60 / (runs["Average Speed"].to_numpy(dtype=float) * 2.237)
+
+    unique_ids, run_starts = np.unique(route_ids, return_index=True)
+    run_ends = np.append(run_starts[1:], len(route_ids))
+
+    if splits is not None and len(splits) and "GPS_Filename" in activities.columns:
+        split_route = splits["GPS_Filename"].map(
+            activities.drop_duplicates("GPS_Filename").set_index("GPS_Filename")["RouteID"]
+        )
+        split_pace = (splits.assign(RouteID=split_route).dropna(subset=["RouteID"])
+                      .groupby(["RouteID", "Split"])["Split_Pace_min_per_mile"].mean())
+        split_ids = split_pace.index.get_level_values(0).to_numpy(dtype=np.int64)
+        split_nums = split_pace.index.get_level_values(1).to_numpy()
+        split_values = split_pace.to_numpy()
+    else:
+        split_ids = np.array([], dtype=np.int64)
+        split_nums = split_values = np.array([])
+    split_starts = np.searchsorted(split_ids, unique_ids, side="left")
+    split_ends = np.searchsorted(split_ids, unique_ids, side="right")
+
+    route_names = route_names or {}
+    return [
+        {
+            "route_id": int(route_id),
+            "title": (f"Route {route_id} - {route_names[route_id]}" if route_id in route_names
+                      else f"Route {route_id}") + f" ({end - start} runs)",
+            "dates": dates[start:end],
+            "pace": pace[start:end],
+            "split": split_nums[s_start:s_end],
+            "split_pace": split_values[s_start:s_end],
+        }
+        for route_id, start, end, s_start, s_end
+        in zip(unique_ids, run_starts, run_ends, split_starts, split_ends)
+    ]
+
+def render_all_plots(route_stats, activities=None, splits=None, route_names=None, output_dir="graphs",
+                     formats=PLOT_FORMATS, top_n=10, workers=1):
+    """
+    Render every chart to files without a GUI: the three summary charts
+    and, when activities are given, one dashboard per route under
+    output_dir/routes. Routes are rendered in batches by worker processes.
+
+    Args:
+        route_stats: output of compute_route_stats
+        activities: clustered activities with RouteID, Activity Date,
+                    Average Speed (and GPS_Filename to attach splits)
+        splits: per-mile splits from compute_track_metrics
+        route_names: {cluster_id: location name} for the dashboard titles
+        output_dir: folder for the files
+        formats: file formats, e.g. ("png", "svg")
+        top_n: routes per summary chart
+        workers: processes for rendering
+
+    Returns:
+        list: paths of the written files
+    """
     if len(route_stats) == 0:
         print("⚠️ No route stats to plot!")
-        return
-    
-    df_plot = route_stats.sort_values("Pace_min_per_mile_std", ascending=True).head(top_n)
-    
-    # Create meaningful labels: show distance and count
-    labels = [f"Route {int(row['RouteID'])}\n({row['Distance_mean']:.1f}mi, {int(row['Distance_count'])} runs)" 
-              for _, row in df_plot.iterrows()]
-
-    plt.figure(figsize=(12, 6))
-    plt.bar(range(len(df_plot)), df_plot["Pace_min_per_mile_std"], color='lightgreen')
-    plt.xlabel("Route")
-    plt.ylabel("Pace Variability (std dev in min/mile)")
-    plt.title(f"Top {top_n} Most Consistent Routes (by GPS similarity)")
-    plt.xticks(range(len(df_plot)), labels, rotation=45, ha='right')
-    plt.tight_layout()
-    plt.show()
\ No newline at end of file
+        return []
+
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [
+        (route_stats, kind, top_n, os.path.join(output_dir, SUMMARY_PLOTS[kind][0]), formats)
+        for kind in SUMMARY_PLOTS
+    ]
+    paths = [p for result in _map_in_pool(_render_summary, jobs, workers) for p in result]
+
+    if activities is not None and len(activities):
+        route_dir = os.path.join(output_dir, "routes")
+        os.makedirs(route_dir, exist_ok=True)
+        routes = _route_payloads(activities, splits, route_names)
+        n_chunks = max(1, min(len(routes), max(1, workers) * 4))
+        chunks = [(routes[i::n_chunks], route_dir, formats) for i in range(n_chunks)]
+        paths += [p for result in _map_in_pool(_render_route_chunk, chunks, workers) for p in result]
+
+    print(f"🖼️ Rendered {len(paths)} chart files to {output_dir}")
+    return paths
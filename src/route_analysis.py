@@ -1,24 +1,219 @@
+import numpy as np
 import pandas as pd
 
+from src.instrument import instrumented
+
+# Per-trackpoint metrics from src.track_metrics, averaged per route when
+# they have been merged into the activities
+TRACK_METRIC_COLUMNS = [
+    "Track_Pace_min_per_mile", "GAP_min_per_mile", "Pace_CV",
+    "HR_Z1_s", "HR_Z2_s", "HR_Z3_s", "HR_Z4_s", "HR_Z5_s",
+]
+
+# Rolling windows (weeks back from the latest run) for compute_route_form
+FORM_WINDOWS_WEEKS = (4, 12, 52)
+
+# Metrics compute_route_form / compute_route_periods summarize, when present
+FORM_METRICS = ("Pace_min_per_mile", "GAP_min_per_mile")
+
+# Length of a training block for compute_route_periods
+BLOCK_WEEKS = 4
+
+# Meteorological seasons by month (December counts towards next year's winter)
+SEASONS = np.array(["Winter", "Winter", "Spring", "Spring", "Spring", "Summer",
+                    "Summer", "Summer", "Autumn", "Autumn", "Autumn", "Winter"])
+
+def pace_min_per_mile(speed_mps):
+    """
+    Convert Average Speed from m/s to pace (min/mile).
+    1 m/s = 2.237 mph; pace (min/mile) = 60 / speed (mph)
+    """
+    return (60 / (speed_mps * 2.237)).round(2)
+
+def _metric_columns(df, metrics=FORM_METRICS):
+    """{name: Series} of the metrics available in df (pace is derived from speed)."""
+    columns = {}
+    for metric in metrics:
+        if metric == "Pace_min_per_mile":
+            columns[metric] = pace_min_per_mile(df["Average Speed"])
+        elif metric in df.columns:
+            columns[metric] = df[metric]
+    return columns
+
+@instrumented("stats.groupby", items=len)
 def compute_route_stats(df_clean):
     """
     Group by RouteID and compute statistics.
     Converts Average Speed (m/s) to pace (min/mile).
+    Columns from compute_track_metrics, when present, are averaged too.
     """
-    # Convert Average Speed from m/s to pace (min/mile)
-    # 1 m/s = 2.237 mph
-    # pace (min/mile) = 60 / speed (mph)
-    df_clean_copy = df_clean.copy()
-    df_clean_copy["Pace_min_per_mile"] = (60 / (df_clean_copy["Average Speed"] * 2.237)).round(2)
-    
-    route_stats = df_clean_copy.groupby("RouteID").agg({
+    aggregations = {
         "Pace_min_per_mile": ["mean", "median", "std"],
         "Average Grade Adjusted Pace": "mean",
         "Elevation Gain": "mean",
         "Relative Effort": "mean",
         "Distance": ["mean", "count"]
-    })
+    }
+    for column in TRACK_METRIC_COLUMNS:
+        if column in df_clean.columns:
+            aggregations[column] = "mean"
+
+    # Only the aggregated columns, sharing df_clean's data (no full copy)
+    columns = {"Pace_min_per_mile": pace_min_per_mile(df_clean["Average Speed"])}
+    columns.update({column: df_clean[column] for column in list(aggregations)[1:]})
+    route_stats = pd.DataFrame(columns, copy=False).groupby(df_clean["RouteID"]).agg(aggregations)
     
     # Flatten multi-level column names
     route_stats.columns = ['_'.join(col).strip() for col in route_stats.columns]
     return route_stats.reset_index()
+
+def _range_sums(values, starts, ends):
+    """Sum of values[start:end] (along axis 0) for every range, via one cumsum."""
+    total = np.zeros((len(values) + 1,) + values.shape[1:])
+    np.cumsum(values, axis=0, out=total[1:])
+    return total[ends] - total[starts]
+
+def _range_min(values, starts, ends):
+    """NaN-ignoring minimum of values[start:end] for every range (NaN if empty)."""
+    padded = np.vstack([values, np.full((1,) + values.shape[1:], np.nan)])
+    # reduceat over (start, end) pairs; the odd results span the gaps
+    bounds = np.column_stack((starts, ends)).ravel()
+    result = np.fmin.reduceat(padded, bounds, axis=0)[::2]
+    result[ends <= starts] = np.nan
+    return result
+
+@instrumented("stats.route_form", items=len)
+def compute_route_form(df_clean, as_of=None, windows_weeks=FORM_WINDOWS_WEEKS, metrics=FORM_METRICS):
+    """
+    Per-route form over rolling windows ending at as_of: run count, mean,
+    std, best and least-squares trend of each metric over the last N weeks,
+    plus the same over all runs up to as_of ("all").
+
+    Activities are sorted by (route, date) once; every window of every
+    route is then a row range found with searchsorted, and all statistics
+    come from cumulative sums over those ranges, so there is no loop over
+    routes.
+
+    Args:
+        df_clean: activities with RouteID, Activity Date and Average Speed
+                  (GAP_min_per_mile from compute_track_metrics is used too)
+        as_of: end of the windows (default: the latest activity)
+        windows_weeks: window lengths in weeks
+        metrics: metrics to summarize; pace is derived from Average Speed
+
+    Returns:
+        DataFrame indexed by RouteID with Last_Run and, per metric and
+        window, <metric>_<N>w_count / _mean / _std / _best / _trend. Trends
+        are per week (negative pace trend = getting faster); best is the
+        lowest value (fastest pace).
+    """
+    columns = _metric_columns(df_clean, metrics)
+    dates = pd.to_datetime(df_clean["Activity Date"]).to_numpy("datetime64[s]")
+    route_ids = df_clean["RouteID"].to_numpy()
+    valid = ~np.isnat(dates) & pd.notna(route_ids)
+    values = np.column_stack([np.asarray(c, dtype=float) for c in columns.values()])[valid]
+    values[~np.isfinite(values)] = np.nan
+    dates, route_ids = dates[valid], route_ids[valid]
+
+    routes, route_idx = np.unique(route_ids, return_inverse=True)
+    windows = {f"{w}w": np.timedelta64(int(w) * 7, "D") for w in windows_weeks}
+    if len(dates) == 0:
+        return pd.DataFrame(index=pd.Index(routes, name="RouteID"))
+
+    as_of = np.datetime64(pd.Timestamp(as_of), "s") if as_of is not None else dates.max()
+    # Days relative to as_of (<= 0 inside every window) keep the sums small
+    days = (dates - as_of).astype(float) / 86400
+    order = np.lexsort((days, route_idx))
+    route_idx, days, values = route_idx[order], days[order], values[order]
+
+    # One sorted key over all routes: route * span + days, shifted so that
+    # every date and window bound falls inside its route's span and
+    # searches never cross into the previous route
+    longest = max((w.astype(int) for w in windows.values()), default=0)
+    base = min(days.min(), 0) - longest - 1
+    span = max(days.max(), 0) - base + 1
+    key = route_idx * span + (days - base)
+    route_starts = np.searchsorted(route_idx, np.arange(len(routes)))
+    as_of_key = np.arange(len(routes)) * span - base
+    ends = np.searchsorted(key, as_of_key, side="right")
+
+    present = ~np.isnan(values)
+    y = np.where(present, values, 0.0)
+    x = days[:, None] * present
+    # Per-point terms of count, sum y, sum y^2, sum x, sum xy, sum x^2
+    terms = np.stack([present.astype(float), y, y * y, x, x * y, x * x], axis=-1)
+
+    # Latest run of each route up to as_of
+    last_run = dates[order][np.maximum(ends - 1, 0)]
+    last_run[ends == route_starts] = np.datetime64("NaT")
+    out = {"Last_Run": last_run}
+    for label, width in list(windows.items()) + [("all", None)]:
+        if width is None:
+            starts = route_starts
+        else:
+            starts = np.searchsorted(key, as_of_key - width.astype(int), side="right")
+        n, sy, syy, sx, sxy, sxx = np.moveaxis(_range_sums(terms, starts, ends), -1, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sy / n
+            std = np.sqrt(np.maximum(syy - sy * mean, 0) / (n - 1))
+            trend = (n * sxy - sx * sy) / (n * sxx - sx * sx) * 7
+        best = _range_min(values, starts, ends)
+        std[n < 2] = np.nan
+        trend[(n < 2) | ~np.isfinite(trend)] = np.nan
+        for k, metric in enumerate(columns):
+            out[f"{metric}_{label}_count"] = n[:, k].astype(np.int64)
+            out[f"{metric}_{label}_mean"] = mean[:, k].round(2)
+            out[f"{metric}_{label}_std"] = std[:, k].round(2)
+            out[f"{metric}_{label}_best"] = best[:, k]
+            out[f"{metric}_{label}_trend"] = trend[:, k].round(3)
+
+    return pd.DataFrame(out, index=pd.Index(routes, name="RouteID"))
+
+def _period_labels(dates, period, block_weeks):
+    """Label of each date's season ("2023 Summer") or training block (its start date)."""
+    if period == "season":
+        months = dates.dt.month.to_numpy() - 1
+        years = dates.dt.year.to_numpy() + (months == 11)
+        return pd.Series(years.astype(str), index=dates.index).str.cat(
+            pd.Series(SEASONS[months], index=dates.index), sep=" ")
+    if period == "block":
+        # Blocks of block_weeks weeks, counted from the Monday of the first run
+        first = dates.min().normalize() - pd.Timedelta(days=dates.min().weekday())
+        block = (dates - first) // pd.Timedelta(weeks=block_weeks)
+        return first + block * pd.Timedelta(weeks=block_weeks)
+    raise ValueError(f"Unknown period {period!r}; expected 'season' or 'block'")
+
+@instrumented("stats.route_periods", items=len)
+def compute_route_periods(df_clean, period="season", block_weeks=BLOCK_WEEKS, metrics=FORM_METRICS):
+    """
+    Per-route stats per season or per training block, in one groupby.
+
+    Args:
+        df_clean: activities with RouteID, Activity Date and Average Speed
+        period: "season" (meteorological, December counts towards the next
+                year's winter) or "block" (block_weeks weeks from the
+                Monday of the first run)
+        block_weeks: training block length in weeks
+
+    Returns:
+        DataFrame with RouteID, Period_Type, Period, Period_Start and per
+        metric count, mean, median, std and best (min)
+    """
+    dates = pd.to_datetime(df_clean["Activity Date"])
+    valid = dates.notna() & df_clean["RouteID"].notna()
+    dates = dates[valid]
+    labels = _period_labels(dates, period, block_weeks) if len(dates) else pd.Series(dtype=object)
+
+    columns = {metric: column[valid].replace([np.inf, -np.inf], np.nan)
+               for metric, column in _metric_columns(df_clean, metrics).items()}
+    frame = pd.DataFrame(columns, copy=False)
+    keys = [df_clean["RouteID"][valid].rename("RouteID"), labels.rename("Period")]
+    grouped = frame.groupby(keys, sort=True)
+    periods = grouped.agg(["count", "mean", "median", "std", "min"]).round(2)
+    periods.columns = [f"{metric}_{'best' if stat == 'min' else stat}" for metric, stat in periods.columns]
+    periods.insert(0, "Period_Start", dates.groupby(keys).min().dt.normalize())
+    periods = periods.reset_index()
+    periods.insert(1, "Period_Type", period)
+    if period == "block":
+        periods["Period"] = periods["Period"].dt.strftime("%Y-%m-%d")
+    return periods.sort_values(["RouteID", "Period_Start"], kind="stable", ignore_index=True)
@@ -0,0 +1,359 @@
+"""
+Persistent index of known routes for "which route is this?" lookups.
+
+Every cluster is represented by a few of its tracks in the local metric
+frame: its medoid (the member closest to all others), plus as many more
+members as it takes for every member to be within COVER_FRACTION of the
+threshold (Fréchet) of one of them. A query track is resampled the same
+way the clustered tracks were. Representatives whose bounding boxes are
+more than the threshold away are pruned with a Chebyshev KD-tree, and so
+are those whose symmetric Hausdorff distance (a lower bound of the
+Fréchet distance, ignoring direction and loop start) is above it. The
+survivors are ranked by route_distances (Fréchet), as clustering does;
+a track's distance to a route is that to its nearest representative.
+
+With the Fréchet metric and the clustering eps as threshold, a track that
+was clustered matches its own route: it is within half the threshold of
+one of its route's representatives, and DBSCAN (min_samples=1) put every
+track within eps of it in the same cluster, so no other route is that
+close. fast=True ranks by Hausdorff alone, which is quicker but can pick
+a neighbouring route.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.clustering import _tracks_from_vectors, route_distances, to_local_meters
+from src.instrument import instrumented
+from src.load_gps import RESAMPLERS
+
+# Members compared when picking a cluster's medoid; larger clusters are
+# subsampled (deterministically)
+MEDOID_SAMPLE = 50
+
+# Every member of a route is within this fraction of the threshold of one
+# of the route's representatives
+COVER_FRACTION = 0.5
+
+# Pairs per vectorized route_distances batch
+BATCH_SIZE = 256
+
+NEW_ROUTE = -1
+
+def _pairwise_route_distances(a, b, max_distance=np.inf):
+    """route_distances over many pairs, in batches of BATCH_SIZE."""
+    dist = np.empty(len(a))
+    for start in range(0, len(a), BATCH_SIZE):
+        end = start + BATCH_SIZE
+        dist[start:end] = route_distances(a[start:end], b[start:end], max_distance)
+    return dist
+
+def hausdorff_distances(a, b):
+    """
+    Symmetric Hausdorff distance for a batch of pairs of point sequences,
+    shape (batch, n_points, 2) each: the farthest any point of one track
+    is from the nearest point of the other.
+    """
+    # Squared distances as |a|^2 + |b|^2 - 2ab, one batched matmul;
+    # centering on a first keeps the expansion numerically tight
+    center = a.mean(axis=1, keepdims=True)
+    a, b = a - center, b - center
+    sq = ((a ** 2).sum(axis=-1)[:, :, None] + (b ** 2).sum(axis=-1)[:, None, :]
+          - 2 * np.matmul(a, b.transpose(0, 2, 1)))
+    farthest = np.maximum(sq.min(axis=2).max(axis=1), sq.min(axis=1).max(axis=1))
+    return np.sqrt(np.maximum(farthest, 0))
+
+def _medoids(local, labels, cluster_ids):
+    """
+    Index of the medoid track of every cluster: the member with the
+    smallest summed route distance to the other (sampled) members.
+    """
+    members = {}
+    for cluster_id in cluster_ids:
+        idx = np.flatnonzero(labels == cluster_id)
+        if len(idx) > MEDOID_SAMPLE:
+            idx = idx[np.linspace(0, len(idx) - 1, MEDOID_SAMPLE).astype(int)]
+        members[cluster_id] = idx
+
+    # All member pairs of all clusters, computed in shared batches
+    pairs = [
+        (i, j) for idx in members.values() if len(idx) > 2
+        for k, i in enumerate(idx) for j in idx[k + 1:]
+    ]
+    total = np.zeros(len(local))
+    if pairs:
+        pairs = np.array(pairs)
+        dist = _pairwise_route_distances(local[pairs[:, 0]], local[pairs[:, 1]])
+        np.add.at(total, pairs[:, 0], dist)
+        np.add.at(total, pairs[:, 1], dist)
+
+    # With one or two members either track is a medoid: take the first
+    return np.array([idx[total[idx].argmin()] for idx in members.values()], dtype=np.int64)
+
+def _representatives(local, labels, cluster_ids, medoid_idx, radius):
+    """
+    Members that cover every cluster: starting from the medoid, the first
+    member farther than radius from all representatives so far is added,
+    until none is left. All clusters take each round together, in shared
+    route_distances batches.
+
+    Returns:
+        (track index, cluster position) arrays, one entry per representative
+    """
+    members = [np.flatnonzero(labels == cluster_id) for cluster_id in cluster_ids]
+    owner = np.repeat(np.arange(len(members)), [len(m) for m in members])
+    tracks = np.concatenate(members) if members else np.zeros(0, dtype=np.int64)
+    covered = np.zeros(len(tracks), dtype=bool)
+
+    reps, rep_clusters = [], []
+    newest = np.asarray(medoid_idx, dtype=np.int64)   # latest representative per cluster
+    open_ = np.ones(len(members), dtype=bool)
+    while open_.any():
+        clusters = np.flatnonzero(open_)
+        reps.append(newest[clusters])
+        rep_clusters.append(clusters)
+        # Distance of every uncovered member of an open cluster to its newest representative
+        todo = np.flatnonzero(~covered & open_[owner])
+        dist = _pairwise_route_distances(local[tracks[todo]], local[newest[owner[todo]]], radius)
+        covered[todo[dist <= radius]] = True
+
+        # Next representative: the first member still uncovered
+        uncovered = np.flatnonzero(~covered)
+        first = uncovered[np.r_[True, owner[uncovered][1:] != owner[uncovered][:-1]]] if len(uncovered) else uncovered
+        open_[:] = False
+        open_[owner[first]] = True
+        newest[owner[first]] = tracks[first]
+    if not reps:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(reps), np.concatenate(rep_clusters)
+
+def empty_route_index(origin, threshold_m, resample, n_points):
+    """A route index without routes, to be filled by add_routes."""
+    return {
+        "route_ids": np.zeros(0, dtype=np.int64),
+        "medoid_files": np.zeros(0, dtype=str),
+        "n_tracks": np.zeros(0, dtype=np.int64),
+        "representatives": np.zeros((0, n_points, 2), dtype=np.float32),
+        "rep_routes": np.zeros(0, dtype=np.int64),
+        "rep_files": np.zeros(0, dtype=str),
+        "boxes": np.zeros((0, 4)),
+        "origin": np.asarray(origin, dtype=float),
+        "threshold_m": float(threshold_m),
+        "resample": resample,
+        "n_points": n_points,
+    }
+
+def add_routes(index, ids, local, labels):
+    """
+    Add every cluster in labels (-1 = noise, left out) to the index as a
+    new route represented by its medoid and the members covering the rest.
+
+    Args:
+        ids: filenames of the tracks
+        local: tracks in the index's frame, (tracks, points, 2) meters
+        labels: cluster label per track; must not be in the index yet
+
+    Returns:
+        the index (updated in place)
+    """
+    labels = np.asarray(labels)
+    ids = np.array(ids, dtype=str)
+    local = local.reshape(len(local), index["n_points"], 2)
+    cluster_ids, n_tracks = np.unique(labels[labels != -1], return_counts=True)
+    medoid_idx = _medoids(local, labels, cluster_ids)
+    rep_idx, rep_clusters = _representatives(local, labels, cluster_ids, medoid_idx,
+                                             COVER_FRACTION * index["threshold_m"])
+    reps = local[rep_idx]
+
+    first_route = len(index["route_ids"])
+    index["route_ids"] = np.concatenate([index["route_ids"], cluster_ids.astype(np.int64)])
+    index["medoid_files"] = np.concatenate([index["medoid_files"], ids[medoid_idx]])
+    index["n_tracks"] = np.concatenate([index["n_tracks"], n_tracks.astype(np.int64)])
+    index["representatives"] = np.concatenate([index["representatives"], reps.astype(np.float32)])
+    index["rep_routes"] = np.concatenate([index["rep_routes"], first_route + rep_clusters])
+    index["rep_files"] = np.concatenate([index["rep_files"], ids[rep_idx]])
+    index["boxes"] = np.concatenate([index["boxes"], np.hstack([reps.min(axis=1), reps.max(axis=1)])])
+    index.pop("_tree", None)  # KD-tree over the old boxes
+    return index
+
+@instrumented("index.build", items=lambda index: len(index["route_ids"]))
+def build_route_index(ids, vectors, labels, frame, threshold_m, resample="distance"):
+    """
+    Build the route index from the clustered tracks.
+
+    Args:
+        ids: filenames of the vectorized tracks
+        vectors: flattened resampled tracks from vectorize_tracks
+        labels: cluster labels (-1 = noise, left out)
+        frame: route frame from fit_route_frame (projection origin)
+        threshold_m: route distance above which a query is a new route
+        resample: resampling method the vectors were made with
+
+    Returns:
+        dict of arrays: route_ids, medoid_files and n_tracks per route;
+        representatives (tracks, points, 2) in meters with their
+        rep_routes (route position), rep_files and boxes (min x, min y,
+        max x, max y); origin, plus threshold_m, resample and n_points
+    """
+    local = to_local_meters(_tracks_from_vectors(vectors), frame["origin"])
+    index = empty_route_index(frame["origin"], threshold_m, resample, local.shape[1])
+    add_routes(index, ids, local, labels)
+
+    print(f"🗂️ Indexed {len(index['route_ids'])} routes by {len(index['rep_routes'])} representative tracks")
+    return index
+
+def save_route_index(path, index):
+    """Write the index as .npz (temporary file first, then moved into place)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    arrays = {key: value for key, value in index.items() if isinstance(value, np.ndarray)}
+    settings = {key: index[key] for key in ("threshold_m", "resample", "n_points")}
+    np.savez(path + ".tmp.npz", settings=json.dumps(settings), **arrays)
+    os.replace(path + ".tmp.npz", path)
+
+def load_route_index(path):
+    """
+    Load an index saved by save_route_index, or None if there is none (or
+    it was saved in the older medoid-only layout and must be rebuilt).
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as saved:
+        if "rep_routes" not in saved.files:
+            print(f"⚠️ Route index {path} predates route representatives; it will be rebuilt")
+            return None
+        index = {key: saved[key] for key in saved.files if key != "settings"}
+        index.update(json.loads(str(saved["settings"])))
+    return index
+
+# Above this many query x route box comparisons the KD-tree beats brute force
+BRUTE_FORCE_LIMIT = 1_000_000
+
+def _candidates(index, boxes, threshold_m):
+    """
+    (query, representative) pairs whose boxes are within threshold_m
+    (Chebyshev), as two index arrays. Small lookups compare boxes directly; large
+    batches use a KD-tree over the representative boxes, built once per index.
+    """
+    if len(boxes) * len(index["boxes"]) <= BRUTE_FORCE_LIMIT:
+        gap = np.abs(boxes[:, None, :] - index["boxes"][None, :, :]).max(axis=2)
+        return np.nonzero(gap <= threshold_m)
+
+    if "_tree" not in index:
+        from sklearn.neighbors import KDTree
+        index["_tree"] = KDTree(index["boxes"], metric="chebyshev")
+    candidates = index["_tree"].query_radius(boxes, r=threshold_m)
+    q_idx = np.repeat(np.arange(len(boxes)), [len(c) for c in candidates])
+    return q_idx, np.concatenate(candidates).astype(np.int64)
+
+def _query_tracks(index, tracks):
+    """Resample query tracks like the indexed ones, in the index's frame."""
+    resample = RESAMPLERS[index["resample"]]
+    resampled = [
+        resample(np.column_stack((track["lat"], track["lon"])), n_points=index["n_points"])
+        for track in tracks
+    ]
+    return to_local_meters(np.array(resampled), index["origin"])
+
+def _match(index, query, threshold_m, fast=False):
+    """
+    Nearest route of every query track (local meters).
+
+    Returns:
+        (route position in the index or -1, distance) arrays per query
+    """
+    best = np.full(len(query), -1, dtype=np.int64)
+    best_dist = np.full(len(query), np.inf)
+    if len(query) == 0 or len(index["route_ids"]) == 0:
+        return best, best_dist
+
+    boxes = np.hstack([query.min(axis=1), query.max(axis=1)])
+    q_idx, rep_idx = _candidates(index, boxes, threshold_m)
+    if len(q_idx) == 0:
+        return best, best_dist
+
+    reps = index["representatives"][rep_idx].astype(float)
+    dist = np.empty(len(q_idx))
+    for start in range(0, len(q_idx), BATCH_SIZE):
+        end = start + BATCH_SIZE
+        dist[start:end] = hausdorff_distances(query[q_idx[start:end]], reps[start:end])
+    if not fast:
+        # Fréchet only where Hausdorff (a lower bound) is within the threshold
+        close = dist <= threshold_m
+        dist[~close] = np.inf
+        dist[close] = _pairwise_route_distances(query[q_idx[close]], reps[close], threshold_m)
+
+    found = dist <= threshold_m
+    q_idx, r_idx, dist = q_idx[found], index["rep_routes"][rep_idx[found]], dist[found]
+
+    # Nearest route per query: sort by (query, distance), keep the first
+    order = np.lexsort((dist, q_idx))
+    q_idx, r_idx, dist = q_idx[order], r_idx[order], dist[order]
+    first = np.flatnonzero(np.r_[True, q_idx[1:] != q_idx[:-1]]) if len(q_idx) else np.array([], dtype=int)
+    best[q_idx[first]] = r_idx[first]
+    best_dist[q_idx[first]] = dist[first]
+    return best, best_dist
+
+def _score(dist, threshold_m):
+    """1 for the same path, falling to 0 at the threshold (and for new routes)."""
+    if threshold_m <= 0:
+        return np.where(np.isfinite(dist), 1.0, 0.0)
+    return np.clip(1 - dist / threshold_m, 0, 1)
+
+@instrumented("index.match", items=len)
+def match_tracks(index, tracks, threshold_m=None, fast=False):
+    """
+    Find the known route of every query track.
+
+    Args:
+        index: from build_route_index / load_route_index
+        tracks: {name: track dict from parse_gpx_track} (>= 2 points each)
+        threshold_m: distance above which a track is a new route
+                     (default: the index's threshold)
+        fast: rank by Hausdorff distance only instead of route_distances
+              (Fréchet, as clustering does). About 0.7 ms per track
+              against ~10 ms with Fréchet ranking, but a track between two
+              routes can get the neighbouring one; Fréchet ranking always
+              matches a clustered track to its own route
+
+    Returns:
+        DataFrame indexed by track name: RouteID (NEW_ROUTE if no route is
+        within the threshold), Distance_m to that route's nearest
+        representative (inf for new routes), Score (1 = same path, 0 = at
+        the threshold) and Medoid_File
+    """
+    threshold_m = index["threshold_m"] if threshold_m is None else threshold_m
+    names = list(tracks.keys())
+    query = _query_tracks(index, [tracks[name] for name in names])
+    best, dist = _match(index, query, threshold_m, fast)
+
+    found = best >= 0
+    route_ids = np.full(len(names), NEW_ROUTE, dtype=np.int64)
+    route_ids[found] = index["route_ids"][best[found]]
+    medoid_files = np.full(len(names), None, dtype=object)
+    medoid_files[found] = index["medoid_files"][best[found]]
+    return pd.DataFrame({
+        "RouteID": route_ids,
+        "Distance_m": dist,
+        "Score": _score(dist, threshold_m),
+        "Medoid_File": medoid_files,
+    }, index=pd.Index(names, name="Track"))
+
+def match_track(index, track, threshold_m=None, fast=False):
+    """
+    Find the known route of a single track dict, without building a
+    DataFrame.
+
+    Returns:
+        dict: {"RouteID", "Distance_m", "Score", "Medoid_File"}
+    """
+    threshold_m = index["threshold_m"] if threshold_m is None else threshold_m
+    best, dist = _match(index, _query_tracks(index, [track]), threshold_m, fast)
+    found = best[0] >= 0
+    return {
+        "RouteID": int(index["route_ids"][best[0]]) if found else NEW_ROUTE,
+        "Distance_m": float(dist[0]),
+        "Score": float(_score(dist, threshold_m)[0]),
+        "Medoid_File": str(index["medoid_files"][best[0]]) if found else None,
+    }
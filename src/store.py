@@ -0,0 +1,202 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.tracks import TRACK_FIELDS, TrackCollection
+
+# Strava's activities.csv repeats some headers ("Distance" in km and again
+# in meters, ...); pandas keeps the first as-is and suffixes the rest ".1".
+# Every column not listed here is numeric.
+ACTIVITY_DTYPES = {
+    "Activity ID": "int64",
+    "Activity Name": "string",
+    "Activity Type": "category",
+    "Activity Description": "string",
+    "Activity Gear": "string",
+    "Filename": "string",
+    "Media": "string",
+}
+ACTIVITY_DATE_FORMAT = "%b %d, %Y, %I:%M:%S %p"  # "Nov 7, 2022, 8:08:00 PM"
+
+def has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _tmp_path(path):
+    """Temporary name next to path, unique per process so concurrent writers never share it."""
+    return f"{path}.{os.getpid()}.tmp"
+
+def write_table(df, path, metadata=None):
+    """
+    Write a DataFrame as a Parquet file (via a temporary file, then an
+    atomic rename). metadata: optional {str: str} stored in the schema.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if metadata:
+        merged = dict(table.schema.metadata or {})
+        merged.update({k.encode(): str(v).encode() for k, v in metadata.items()})
+        table = table.replace_schema_metadata(merged)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = _tmp_path(path)
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+def read_table(path, columns=None):
+    """
+    Read a Parquet file, only the requested columns. Arrow buffers are
+    handed to pandas without an intermediate copy where the types allow.
+    """
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, columns=columns)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def read_table_metadata(path):
+    import pyarrow.parquet as pq
+
+    metadata = pq.read_schema(path).metadata or {}
+    return {k.decode(): v.decode() for k, v in metadata.items()}
+
+def _csv_dtypes(columns=None):
+    return {k: v for k, v in ACTIVITY_DTYPES.items() if k != "Activity ID" and (columns is None or k in columns)}
+
+def parse_activity_dates(dates):
+    """
+    Parse Activity Date strings with the fast fixed format, falling back to
+    per-value format inference (other locales, ISO 8601) for the rest.
+    Dates with a UTC offset are converted to naive UTC like Strava's own.
+    """
+    parsed = pd.to_datetime(dates, format=ACTIVITY_DATE_FORMAT, errors="coerce")
+    retry = parsed.isna() & dates.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(dates[retry], format="mixed", errors="coerce", utc=True).dt.tz_convert(None)
+        failed = parsed.isna() & dates.notna()
+        if failed.any():
+            print(f"⚠️ Could not parse {failed.sum()} activity dates "
+                  f"(e.g. {dates[failed].iloc[0]!r}); they are left empty")
+    return parsed
+
+def _convert_activity_columns(df):
+    """
+    Dtypes read_csv cannot apply by itself (dates, nullable booleans, IDs).
+    Rows without a numeric Activity ID are dropped with a warning.
+    """
+    if "Activity Date" in df.columns:
+        df["Activity Date"] = parse_activity_dates(df["Activity Date"])
+    if "Commute" in df.columns:
+        df["Commute"] = df["Commute"].astype("boolean")
+    if "Activity ID" in df.columns:
+        ids = pd.to_numeric(df["Activity ID"], errors="coerce")
+        blank = ids.isna()
+        if blank.any():
+            print(f"⚠️ Dropped {blank.sum()} activities without a valid Activity ID "
+                  f"(data rows {', '.join(str(i + 1) for i in df.index[blank][:5])}"
+                  f"{', ...' if blank.sum() > 5 else ''})")
+            df, ids = df[~blank].copy(), ids[~blank]
+        df["Activity ID"] = ids.astype(ACTIVITY_DTYPES["Activity ID"])
+    return df
+
+def read_activities_csv(csv_path):
+    """
+    Parse Strava's activities.csv once with explicit dtypes: dates become
+    datetime64, text columns string/category, everything else numeric.
+    """
+    return _convert_activity_columns(pd.read_csv(csv_path, dtype=_csv_dtypes()))
+
+def iter_activities_csv(csv_path, columns=None, chunk_rows=100_000):
+    """
+    read_activities_csv in chunks of chunk_rows rows, for CSVs too large
+    to hold at once. columns limits the columns that are parsed (for
+    Strava's repeated headers, the first one).
+    """
+    for chunk in pd.read_csv(csv_path, usecols=columns, dtype=_csv_dtypes(columns), chunksize=chunk_rows):
+        yield _convert_activity_columns(chunk)
+
+def load_activities(csv_path="data/activities.csv", columns=None, store_path="data/cache/activities.parquet"):
+    """
+    Load activities from the columnar store, (re)building it from the CSV
+    when the CSV has changed (same mtime/size key as the track cache).
+
+    Only the requested columns are read. Without pyarrow this falls back to
+    reading the CSV.
+    """
+    if not has_pyarrow():
+        df = read_activities_csv(csv_path)
+        return df[columns] if columns is not None else df
+
+    stat = os.stat(csv_path)
+    source_key = {"source_mtime_ns": str(stat.st_mtime_ns), "source_size": str(stat.st_size)}
+    stored_key = read_table_metadata(store_path) if os.path.exists(store_path) else {}
+
+    if any(stored_key.get(k) != v for k, v in source_key.items()):
+        df = read_activities_csv(csv_path)
+        write_table(df, store_path, metadata=source_key)
+        print(f"🗄️ Converted {csv_path} to {store_path}")
+        return df[columns] if columns is not None else df
+
+    return read_table(store_path, columns=columns)
+
+def tracks_to_frame(tracks):
+    """
+    Flatten {filename: track dict} into one long trackpoint DataFrame with
+    a categorical GPS_Filename column.
+    """
+    if isinstance(tracks, TrackCollection):
+        frame = pd.DataFrame({field: tracks.columns[field] for field in TRACK_FIELDS}, copy=False)
+        codes = np.repeat(np.arange(len(tracks), dtype=np.int32), tracks.lengths)
+        frame.insert(0, "GPS_Filename", pd.Categorical.from_codes(codes, categories=tracks.names))
+        return frame
+
+    filenames = list(tracks.keys())
+    lengths = [len(tracks[f]["lat"]) for f in filenames]
+    frame = pd.DataFrame({
+        field: np.concatenate([tracks[f][field] for f in filenames]) if filenames else np.array([])
+        for field in TRACK_FIELDS
+    })
+    frame.insert(0, "GPS_Filename", pd.Categorical(np.repeat(filenames, lengths), categories=filenames))
+    return frame
+
+def write_trackpoints(tracks, path):
+    """Store all trackpoints of {filename: track dict} as one Parquet file."""
+    write_table(tracks_to_frame(tracks), path)
+
+def read_trackpoints(path, columns=None):
+    """
+    Read trackpoints back as a TrackCollection (one view of the loaded
+    columns, no per-track copies); columns limits the point fields that
+    are loaded (GPS_Filename is always read).
+    """
+    fields = columns or list(TRACK_FIELDS)
+    frame = read_table(path, columns=["GPS_Filename"] + list(fields))
+    codes = frame["GPS_Filename"].cat.codes.to_numpy()
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(codes)]))
+    names = frame["GPS_Filename"].cat.categories
+    arrays = {field: frame[field].to_numpy() for field in fields}
+    if "time" in arrays:
+        arrays["time"] = arrays["time"].astype("datetime64[s]")  # Parquet stores ms
+    if len(codes) == 0:
+        return TrackCollection([], [0], arrays)
+    return TrackCollection([names[c] for c in codes[starts]], np.append(starts, ends[-1]), arrays)
+
+def save_output(df, csv_path):
+    """
+    Export a result table as CSV (for reading) and, when pyarrow is
+    available, next to it as Parquet with its dtypes intact. Both are
+    written to temporary files and renamed into place, so readers never
+    see a partial file.
+    """
+    tmp_path = _tmp_path(csv_path)
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, csv_path)
+    if has_pyarrow():
+        write_table(df, os.path.splitext(csv_path)[0] + ".parquet")
@@ -0,0 +1,308 @@
+"""
+Synthetic Strava exports for benchmarks: an activities.csv with Strava's
+columns plus one GPX file per activity.
+
+Activities repeat a set of base routes (loops, out-and-backs and
+point-to-point runs). Each run may go the other way or start a loop
+somewhere else, and has GPS noise, occasional spikes and pauses. The
+route every file was generated from is written to routes_truth.csv, so
+clustering quality can be scored too.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.load_gps import EARTH_RADIUS_M, _map_in_pool
+
+# Named benchmark scales: number of activities
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+# Bumped whenever generated exports change, so cached ones are not reused
+GENERATOR_VERSION = 2
+
+ROUTE_TYPES = ("loop", "out_and_back", "point_to_point")
+ROUTE_TYPE_P = (0.5, 0.3, 0.2)
+
+# Activities.csv header in Strava's order; the repeated names are real
+# (pandas reads the second copy as "Distance.1", ...)
+CSV_COLUMNS = [
+    "Activity ID", "Activity Date", "Activity Name", "Activity Type", "Activity Description",
+    "Elapsed Time", "Distance", "Max Heart Rate", "Relative Effort", "Commute",
+    "Activity Gear", "Filename", "Elapsed Time", "Moving Time", "Distance", "Max Speed",
+    "Average Speed", "Elevation Gain", "Elevation Loss", "Average Heart Rate", "Relative Effort",
+    "Commute", "Average Grade Adjusted Pace", "Media",
+]
+
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx creator="StravaGPX" version="1.1" xmlns="http://www.topografix.com/GPX/1/1" '
+    'xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">\n'
+    ' <metadata>\n  <time>{start}</time>\n </metadata>\n'
+    ' <trk>\n  <name>{name}</name>\n  <type>running</type>\n  <trkseg>\n'
+)
+GPX_FOOTER = "  </trkseg>\n </trk>\n</gpx>\n"
+
+def _smooth_path(rng, length_m, n=200):
+    """Open path of about length_m meters with a slowly turning heading."""
+    turn = np.convolve(rng.normal(0, 0.25, n), np.ones(15) / 15, mode="same")
+    heading = rng.uniform(0, 2 * np.pi) + np.cumsum(turn)
+    step = length_m / (n - 1)
+    xy = np.zeros((n, 2))
+    xy[1:, 0] = np.cumsum(step * np.cos(heading[1:]))
+    xy[1:, 1] = np.cumsum(step * np.sin(heading[1:]))
+    return xy
+
+def _loop_path(rng, length_m, n=200):
+    """Closed wobbly loop of about length_m meters (first point repeated last)."""
+    theta = np.linspace(0, 2 * np.pi, n)
+    radius = 1 + sum(rng.uniform(0, 0.15) * np.cos(k * theta + rng.uniform(0, 2 * np.pi)) for k in (2, 3, 5))
+    xy = np.column_stack([radius * np.cos(theta), radius * np.sin(theta)])
+    xy[-1] = xy[0]
+    perimeter = np.hypot(*np.diff(xy, axis=0).T).sum()
+    return xy * (length_m / perimeter)
+
+# Rolling hills shared by all routes: (amplitude m, wavelength m, direction, phase)
+TERRAIN = ((25, 6000, 0.3, 0.0), (12, 2500, 1.9, 1.0), (5, 900, 4.0, 2.5))
+
+def terrain_elevation(x, y):
+    """Elevation in meters at local coordinates, the same for every run."""
+    return 20 + sum(
+        amplitude * np.sin(2 * np.pi * (x * np.cos(direction) + y * np.sin(direction)) / wavelength + phase)
+        for amplitude, wavelength, direction, phase in TERRAIN
+    )
+
+def make_routes(n_routes, rng, area_m=10_000):
+    """
+    Base routes in local meters around the origin.
+
+    Returns:
+        list of dicts: {"type", "xy" (n, 2) polyline in meters}
+    """
+    routes = []
+    for route_type in rng.choice(ROUTE_TYPES, size=n_routes, p=ROUTE_TYPE_P):
+        length = rng.uniform(3_000, 15_000)
+        if route_type == "loop":
+            xy = _loop_path(rng, length)
+        elif route_type == "out_and_back":
+            half = _smooth_path(rng, length / 2)
+            xy = np.vstack([half, half[-2::-1]])
+        else:
+            xy = _smooth_path(rng, length)
+        xy = xy - xy.mean(axis=0) + rng.uniform(-area_m / 2, area_m / 2, size=2)
+        routes.append({"type": str(route_type), "xy": xy})
+    return routes
+
+# GPS position errors drift slowly rather than jumping every second
+NOISE_CORRELATION_S = 60.0
+
+def gps_noise(rng, n, noise_m=3.0, interval_s=1, correlation_s=NOISE_CORRELATION_S):
+    """
+    Position error of n fixes interval_s apart: an AR(1) (Ornstein–Uhlenbeck)
+    walk with standard deviation noise_m that decorrelates over
+    correlation_s. Independent errors of the same size would add about
+    noise_m of zigzag to every step and roughly double a 1 Hz track's
+    length; these only add a few percent.
+    """
+    from scipy.signal import lfilter
+
+    phi = np.exp(-interval_s / correlation_s)
+    shocks = rng.normal(0, noise_m, n) * np.sqrt(1 - phi ** 2)
+    if n:
+        shocks[0] /= np.sqrt(1 - phi ** 2)  # start from the stationary distribution
+    return lfilter([1.0], [1.0, -phi], shocks)
+
+def simulate_run(route, rng, interval_s=1, noise_m=3.0, spike_rate=0.001, pause_rate=0.3):
+    """
+    One recorded run of a route: positions every interval_s seconds at a
+    varying pace, with correlated GPS noise (gps_noise), occasional spikes
+    and maybe a pause.
+
+    Returns:
+        dict with the recorded "x", "y" (local meters), "ele", "hr", "t"
+        (seconds from start), plus "reversed" and the true "moving_s",
+        "distance_m", "gain" and "loss" the activity summary reports
+    """
+    xy = route["xy"]
+    reverse = route["type"] != "out_and_back" and rng.random() < 0.4
+    if reverse:
+        xy = xy[::-1]
+    if route["type"] == "loop":
+        shift = rng.integers(len(xy) - 1)
+        xy = np.vstack([np.roll(xy[:-1], -shift, axis=0), xy[shift:shift + 1]])
+
+    seg = np.hypot(*np.diff(xy, axis=0).T)
+    along = np.concatenate(([0.0], np.cumsum(seg)))
+
+    # Pace drifts around the athlete's pace for this run
+    base_speed = rng.normal(3.0, 0.3)
+    n_est = int(along[-1] / (base_speed * interval_s) * 1.5) + 10
+    drift = np.convolve(rng.normal(0, 3.0, n_est + 119), np.ones(120) / 120, mode="valid")
+    speed = np.clip(base_speed + drift, 1.5, 6.0)
+    s = np.concatenate(([0.0], np.cumsum(speed * interval_s)))
+    s = s[s <= along[-1]]
+    moving_s = (len(s) - 1) * interval_s
+
+    # Stationary stretch (traffic light, shoelace) somewhere along the way
+    if rng.random() < pause_rate and len(s) > 10:
+        at = rng.integers(1, len(s) - 1)
+        s = np.concatenate([s[:at], np.full(int(rng.integers(30, 120) // interval_s), s[at]), s[at:]])
+
+    true_x = np.interp(s, along, xy[:, 0])
+    true_y = np.interp(s, along, xy[:, 1])
+    true_ele = terrain_elevation(true_x, true_y)
+    climb = np.diff(true_ele)
+
+    x = true_x + gps_noise(rng, len(s), noise_m, interval_s)
+    y = true_y + gps_noise(rng, len(s), noise_m, interval_s)
+    spikes = rng.random(len(s)) < spike_rate
+    x[spikes] += rng.choice([-1, 1], spikes.sum()) * rng.uniform(50, 200, spikes.sum())
+
+    ele = true_ele + rng.normal(0, 0.5, len(s))
+    point_speed = np.diff(s, prepend=0.0) / interval_s
+    hr = 135 + 20 * (point_speed - 2.5) + np.cumsum(rng.normal(0, 0.3, len(s)))
+
+    return {
+        "x": x, "y": y, "ele": ele, "hr": np.clip(hr, 90, 200).round(),
+        "t": np.arange(len(s)) * interval_s, "reversed": reverse, "moving_s": moving_s,
+        "distance_m": float(s[-1]), "gain": float(climb[climb > 0].sum()), "loss": float(-climb[climb < 0].sum()),
+    }
+
+def to_lat_lon(x, y, origin):
+    """Local meters east/north of origin → lat/lon (equirectangular)."""
+    lat0, lon0 = origin
+    lat = lat0 + np.degrees(y / EARTH_RADIUS_M)
+    lon = lon0 + np.degrees(x / (EARTH_RADIUS_M * np.cos(np.radians(lat0))))
+    return lat, lon
+
+def format_gpx(lat, lon, ele, hr, times, name):
+    """GPX 1.1 text in Strava's layout (hr=None leaves out heart rate)."""
+    stamps = np.datetime_as_string(times, unit="s")
+    if hr is None:
+        points = [
+            f'   <trkpt lat="{a:.7f}" lon="{o:.7f}">\n    <ele>{e:.1f}</ele>\n    <time>{t}Z</time>\n   </trkpt>\n'
+            for a, o, e, t in zip(lat.tolist(), lon.tolist(), ele.tolist(), stamps)
+        ]
+    else:
+        points = [
+            f'   <trkpt lat="{a:.7f}" lon="{o:.7f}">\n    <ele>{e:.1f}</ele>\n    <time>{t}Z</time>\n'
+            f'    <extensions>\n     <gpxtpx:TrackPointExtension>\n      <gpxtpx:hr>{h:.0f}</gpxtpx:hr>\n'
+            f'     </gpxtpx:TrackPointExtension>\n    </extensions>\n   </trkpt>\n'
+            for a, o, e, t, h in zip(lat.tolist(), lon.tolist(), ele.tolist(), stamps, hr.tolist())
+        ]
+    return GPX_HEADER.format(start=stamps[0] + "Z", name=name) + "".join(points) + GPX_FOOTER
+
+def _write_activity(job):
+    """Simulate one activity, write its GPX file and return its CSV values."""
+    route, seed, path, start, origin, interval_s, with_hr = job
+    rng = np.random.default_rng(seed)
+    run = simulate_run(route, rng, interval_s=interval_s)
+    lat, lon = to_lat_lon(run["x"], run["y"], origin)
+    times = start + run["t"].astype("timedelta64[s]")
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(format_gpx(lat, lon, run["ele"], run["hr"] if with_hr else None, times, "Morning Run"))
+
+    return {
+        "elapsed": int(run["t"][-1]), "moving": int(run["moving_s"]), "distance_m": run["distance_m"],
+        "gain": run["gain"], "loss": run["loss"],
+        "max_hr": float(run["hr"].max()) if with_hr else np.nan,
+        "avg_hr": float(run["hr"].mean()) if with_hr else np.nan,
+        "n_points": len(lat), "reversed": run["reversed"],
+    }
+
+def generate_export(out_dir, n_activities=1_000, n_routes=None, seed=0, origin=(42.34, -71.10),
+                    interval_s=1, workers=1):
+    """
+    Write a synthetic Strava export:
+        out_dir/activities.csv       Strava-shaped activity rows
+        out_dir/activities/<id>.gpx  one track per GPS activity
+        out_dir/routes_truth.csv     filename → base route it follows
+
+    Args:
+        out_dir: folder to write to
+        n_activities: rows in activities.csv (~95% runs and rides with a
+                      GPX file, the rest indoor workouts without one)
+        n_routes: base routes; default n_activities // 8 (at least 3)
+        seed: random seed, the export is reproducible
+        origin: (lat, lon) the routes are placed around
+        interval_s: seconds between recorded points
+        workers: processes writing GPX files
+
+    Returns:
+        dict: csv_path, gps_folder, truth_path, n_activities, n_routes, n_points
+    """
+    rng = np.random.default_rng(seed)
+    n_routes = n_routes or max(3, n_activities // 8)
+    routes = make_routes(n_routes, rng)
+
+    gps_folder = os.path.join(out_dir, "activities")
+    os.makedirs(gps_folder, exist_ok=True)
+
+    ids = 8_000_000_000 + np.sort(rng.choice(10 * n_activities, size=n_activities, replace=False))
+    activity_type = rng.choice(["Run", "Ride", "Workout"], size=n_activities, p=(0.9, 0.05, 0.05))
+    has_gps = activity_type != "Workout"
+    # A few favourite routes get most of the runs
+    popularity = 1 / np.arange(1, n_routes + 1) ** 0.8
+    route_of = rng.choice(n_routes, size=n_activities, p=popularity / popularity.sum())
+    starts = (np.datetime64("2022-01-01T06:00:00")
+              + np.sort(rng.integers(0, 2 * 365 * 86_400, n_activities)).astype("timedelta64[s]"))
+    with_hr = rng.random(n_activities) < 0.8
+    seeds = rng.integers(0, 2 ** 32, n_activities)
+
+    gps_rows = np.flatnonzero(has_gps)
+    filenames = [f"{ids[i]}.gpx" for i in gps_rows]
+    jobs = [
+        (routes[route_of[i]], int(seeds[i]), os.path.join(gps_folder, name), starts[i], origin,
+         interval_s, bool(with_hr[i]))
+        for i, name in zip(gps_rows, filenames)
+    ]
+    written = _map_in_pool(_write_activity, jobs, workers)
+
+    def per_activity(key, indoor):
+        values = np.full(n_activities, indoor, dtype=float)
+        values[gps_rows] = [w[key] for w in written]
+        return values
+
+    distance_m = per_activity("distance_m", 0.0)
+    elapsed = per_activity("elapsed", 0.0)
+    moving = per_activity("moving", 0.0)
+    indoor = ~has_gps
+    elapsed[indoor] = moving[indoor] = rng.integers(600, 3600, indoor.sum())
+    speed = np.where(moving > 0, distance_m / np.maximum(moving, 1), 0.0)
+    max_hr = per_activity("max_hr", np.nan)
+    relative_effort = np.round(moving / 60 * rng.uniform(0.8, 1.6, n_activities))
+
+    dates = pd.Series(starts).dt.strftime("%b %d, %Y, %I:%M:%S %p")
+    names = np.where(activity_type == "Run", "Morning Run",
+                     np.where(activity_type == "Ride", "Morning Ride", "Workout"))
+    filename_column = np.full(n_activities, "", dtype=object)
+    filename_column[gps_rows] = [f"activities/{name}" for name in filenames]
+
+    columns = [
+        ids, dates, names, activity_type, np.full(n_activities, ""),
+        elapsed.astype(int), np.round(distance_m / 1000, 2), max_hr, relative_effort, np.zeros(n_activities, bool),
+        np.full(n_activities, ""), filename_column, elapsed, moving, np.round(distance_m, 1),
+        np.round(speed * 1.3, 3), np.round(speed, 3), np.round(per_activity("gain", np.nan), 1),
+        np.round(per_activity("loss", np.nan), 1), np.round(per_activity("avg_hr", np.nan), 1),
+        relative_effort, np.zeros(n_activities, bool), np.full(n_activities, np.nan), np.full(n_activities, ""),
+    ]
+    csv_path = os.path.join(out_dir, "activities.csv")
+    pd.DataFrame(dict(enumerate(columns))).to_csv(csv_path, header=CSV_COLUMNS, index=False)
+
+    truth_path = os.path.join(out_dir, "routes_truth.csv")
+    pd.DataFrame({
+        "filename": filenames,
+        "route": route_of[gps_rows],
+        "route_type": [routes[route_of[i]]["type"] for i in gps_rows],
+        "reversed": [w["reversed"] for w in written],
+        "activity_type": activity_type[gps_rows],
+    }).to_csv(truth_path, index=False)
+
+    n_points = sum(w["n_points"] for w in written)
+    print(f"🧪 Generated {n_activities} activities ({len(filenames)} GPX files, {n_points} points) "
+          f"on {n_routes} routes in {out_dir}")
+    return {
+        "csv_path": csv_path, "gps_folder": gps_folder, "truth_path": truth_path,
+        "n_activities": n_activities, "n_routes": n_routes, "n_points": n_points,
+    }
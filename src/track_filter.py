@@ -0,0 +1,225 @@
+"""
+GPS noise filtering and track simplification, vectorized over a whole
+TrackCollection (every point of every track at once, no per-track loops).
+
+1. Duplicate timestamps: a point with the same time as the point before
+   it is dropped.
+2. Speed spikes: a point that is reached and left faster than
+   max_speed_mps, while going straight past it is not, is a GPS jump.
+3. Stationary points: a point still within stationary_radius_m of where
+   the track was stationary_window_s before and after is standing still.
+4. Simplification: Ramer–Douglas–Peucker to a tolerance in meters.
+
+Steps 1-2 give the cleaned points the per-trackpoint metrics use. All
+four give the route shapes that are resampled and clustered; metrics
+need every timestamp, so they never see simplified tracks. Every track
+keeps its first and last point.
+"""
+import numpy as np
+import pandas as pd
+
+from src.instrument import instrumented
+from src.load_gps import EARTH_RADIUS_M, haversine_m
+from src.track_metrics import _window_start
+from src.tracks import TrackCollection
+
+# Faster than any runner (and a rare sustained speed for a rider), but far
+# below the jump of a GPS spike at 1 Hz
+MAX_SPEED_MPS = 15.0
+
+# Moving less than this within the window either side is standing still
+STATIONARY_RADIUS_M = 5.0
+STATIONARY_WINDOW_S = 10
+
+# Largest distance in meters a simplified track may deviate from the original
+SIMPLIFY_TOLERANCE_M = 5.0
+
+REPORT_COLUMNS = ["GPS_Filename", "Points", "Duplicates_Removed", "Spikes_Removed", "Stationary_Removed",
+                  "Simplified_Removed", "Shape_Points"]
+
+def _layout(tracks):
+    """Track index of every point, plus each point's first/last-of-track flags."""
+    track_idx = np.repeat(np.arange(len(tracks)), tracks.lengths)
+    first = np.zeros(tracks.n_points, dtype=bool)
+    last = np.zeros(tracks.n_points, dtype=bool)
+    nonempty = tracks.lengths > 0
+    first[tracks.offsets[:-1][nonempty]] = True
+    last[tracks.offsets[1:][nonempty] - 1] = True
+    return track_idx, first, last
+
+def _seconds(tracks):
+    """Point times as float seconds, NaN where missing."""
+    time = tracks.columns["time"]
+    seconds = time.astype("datetime64[s]").astype(np.int64).astype(float)
+    seconds[np.isnat(time)] = np.nan
+    return seconds
+
+def duplicate_points(tracks):
+    """Mask of points whose timestamp equals the previous point's."""
+    time = tracks.columns["time"]
+    _, first, _ = _layout(tracks)
+    duplicate = np.zeros(tracks.n_points, dtype=bool)
+    duplicate[1:] = (time[1:] == time[:-1]) & ~np.isnat(time[1:])
+    return duplicate & ~first
+
+def spike_points(tracks, max_speed_mps=MAX_SPEED_MPS):
+    """
+    Mask of single-point GPS spikes: interior points entered and left
+    faster than max_speed_mps while the speed from the point before to
+    the point after stays below it.
+    """
+    lat, lon = tracks.columns["lat"], tracks.columns["lon"]
+    seconds = _seconds(tracks)
+    _, first, last = _layout(tracks)
+    spike = np.zeros(tracks.n_points, dtype=bool)
+    if tracks.n_points < 3:
+        return spike
+
+    dist = haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:])     # segment i -> i + 1
+    skip = haversine_m(lat[:-2], lon[:-2], lat[2:], lon[2:])     # i - 1 -> i + 1, for i = 1..n-2
+    dt = np.diff(seconds)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed_in, speed_out = dist[:-1] / dt[:-1], dist[1:] / dt[1:]
+        speed_skip = skip / (dt[:-1] + dt[1:])
+    spike[1:-1] = (speed_in > max_speed_mps) & (speed_out > max_speed_mps) & (speed_skip <= max_speed_mps)
+    return spike & ~first & ~last
+
+def stationary_points(tracks, radius_m=STATIONARY_RADIUS_M, window_s=STATIONARY_WINDOW_S):
+    """
+    Mask of points recorded while standing still: within radius_m of the
+    first point up to window_s earlier and of the last point up to
+    window_s later. Tracks without times are left alone.
+    """
+    lat, lon = tracks.columns["lat"], tracks.columns["lon"]
+    track_idx, first, last = _layout(tracks)
+    seconds = _seconds(tracks)
+    stationary = np.zeros(tracks.n_points, dtype=bool)
+
+    # Windows are searched on a per-track time key; points without a time
+    # would break its ordering, so they are left out
+    timed = np.flatnonzero(np.isfinite(seconds))
+    if len(timed) == 0:
+        return stationary
+    nonempty = tracks.lengths > 0
+    track_start = np.full(len(tracks), np.nan)
+    track_start[nonempty] = np.fmin.reduceat(seconds, tracks.offsets[:-1][nonempty])
+    elapsed = seconds[timed] - track_start[track_idx[timed]]
+    span = elapsed.max() + window_s + 1
+    back = _window_start(elapsed, track_idx[timed], window_s, span)
+    key = track_idx[timed] * span + elapsed
+    ahead = np.searchsorted(key, key + window_s, side="right") - 1
+
+    i, b, a = timed, timed[back], timed[ahead]
+    still = (haversine_m(lat[i], lon[i], lat[b], lon[b]) < radius_m) & \
+            (haversine_m(lat[i], lon[i], lat[a], lon[a]) < radius_m)
+    stationary[i] = still
+    return stationary & ~first & ~last
+
+def _local_xy(tracks, track_idx):
+    """Points in meters (equirectangular) around each track's first point."""
+    lat, lon = tracks.columns["lat"], tracks.columns["lon"]
+    starts = tracks.offsets[:-1][track_idx]
+    lat0, lon0 = lat[starts], lon[starts]
+    x = np.radians(lon - lon0) * np.cos(np.radians(lat0)) * EARTH_RADIUS_M
+    y = np.radians(lat - lat0) * EARTH_RADIUS_M
+    return x, y
+
+def simplify_points(tracks, tolerance_m=SIMPLIFY_TOLERANCE_M):
+    """
+    Mask of the points Ramer–Douglas–Peucker keeps at tolerance_m.
+
+    RDP runs on all tracks together: every round takes all open segments
+    of all tracks, finds each one's farthest interior point with one
+    reduceat, and splits the segments where it is beyond the tolerance.
+    There are as many rounds as the deepest split, not one per track.
+    """
+    track_idx, first, last = _layout(tracks)
+    keep = first | last
+    if tracks.n_points == 0:
+        return keep
+    x, y = _local_xy(tracks, track_idx)
+
+    nonempty = tracks.lengths > 0
+    seg_start = tracks.offsets[:-1][nonempty]
+    seg_end = tracks.offsets[1:][nonempty] - 1
+    while True:
+        open_ = seg_end - seg_start > 1
+        seg_start, seg_end = seg_start[open_], seg_end[open_]
+        if len(seg_start) == 0:
+            break
+
+        # Interior points of every segment, in one flat array
+        counts = seg_end - seg_start - 1
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        seg_of = np.repeat(np.arange(len(seg_start)), counts)
+        points = seg_start[seg_of] + 1 + np.arange(bounds[-1]) - bounds[seg_of]
+
+        # Distance of each point to its segment's chord (clamped to the ends)
+        ax, ay = x[seg_start][seg_of], y[seg_start][seg_of]
+        dx, dy = x[seg_end][seg_of] - ax, y[seg_end][seg_of] - ay
+        px, py = x[points] - ax, y[points] - ay
+        length_sq = dx * dx + dy * dy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.clip(np.where(length_sq > 0, (px * dx + py * dy) / length_sq, 0.0), 0, 1)
+        dist = np.hypot(px - t * dx, py - t * dy)
+
+        farthest = np.maximum.reduceat(dist, bounds[:-1])
+        # First point reaching its segment's maximum
+        is_max = np.flatnonzero(dist == farthest[seg_of])
+        first_max = is_max[np.r_[True, seg_of[is_max][1:] != seg_of[is_max][:-1]]]
+        split = farthest > tolerance_m
+        pivot = points[first_max][split]
+        keep[pivot] = True
+
+        seg_start, seg_end = (np.concatenate((seg_start[split], pivot)),
+                              np.concatenate((pivot, seg_end[split])))
+    return keep
+
+@instrumented("gps.filter", items=lambda result: len(result[2]))
+def filter_tracks(tracks, max_speed_mps=MAX_SPEED_MPS, stationary_radius_m=STATIONARY_RADIUS_M,
+                  simplify_tolerance_m=SIMPLIFY_TOLERANCE_M):
+    """
+    Remove duplicate timestamps and speed spikes, then drop stationary
+    points and simplify for the route shapes.
+
+    Args:
+        tracks: TrackCollection or {filename: track dict}
+        max_speed_mps: speed spike threshold (None skips spike removal)
+        stationary_radius_m: standing-still radius (None or 0 keeps
+                             stationary points)
+        simplify_tolerance_m: RDP tolerance in meters (None or 0 skips
+                              simplification)
+
+    Returns:
+        (cleaned, shapes, report): cleaned TrackCollection for the
+        per-trackpoint metrics, simplified TrackCollection for resampling
+        and clustering, and a DataFrame with the points removed per track
+        by each step (REPORT_COLUMNS)
+    """
+    tracks = TrackCollection.from_tracks(tracks)
+    report = {"GPS_Filename": tracks.names, "Points": tracks.lengths}
+
+    def step(collection, name, removed):
+        report[name] = np.bincount(np.repeat(np.arange(len(collection)), collection.lengths)[removed],
+                                   minlength=len(collection))
+        return collection.compress(~removed) if removed.any() else collection
+
+    cleaned = step(tracks, "Duplicates_Removed", duplicate_points(tracks))
+    spikes = (spike_points(cleaned, max_speed_mps) if max_speed_mps
+              else np.zeros(cleaned.n_points, dtype=bool))
+    cleaned = step(cleaned, "Spikes_Removed", spikes)
+
+    stationary = (stationary_points(cleaned, stationary_radius_m) if stationary_radius_m
+                  else np.zeros(cleaned.n_points, dtype=bool))
+    shapes = step(cleaned, "Stationary_Removed", stationary)
+    simplified = (~simplify_points(shapes, simplify_tolerance_m) if simplify_tolerance_m
+                  else np.zeros(shapes.n_points, dtype=bool))
+    shapes = step(shapes, "Simplified_Removed", simplified)
+    report["Shape_Points"] = shapes.lengths
+
+    report = pd.DataFrame(report, columns=REPORT_COLUMNS)
+    total, kept = report["Points"].sum(), report["Shape_Points"].sum()
+    print(f"🧹 Removed {report['Duplicates_Removed'].sum()} duplicate, {report['Spikes_Removed'].sum()} spike "
+          f"and {report['Stationary_Removed'].sum()} stationary points; "
+          f"shapes keep {kept} of {total} points ({total / max(kept, 1):.0f}x fewer)")
+    return cleaned, shapes, report
@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+
+from src.instrument import instrumented
+from src.load_gps import haversine_m
+from src.tracks import TRACK_FIELDS, TrackCollection
+
+METERS_PER_MILE = 1609.344
+
+# A segment counts as moving at >= 0.5 m/s; gaps longer than this are pauses
+MOVING_SPEED_MPS = 0.5
+MAX_SEGMENT_SECONDS = 30
+
+# Rolling windows for within-run pace and for smoothing grade
+PACE_WINDOW_S = 30
+GRADE_WINDOW_M = 30
+
+# Upper bounds of HR zones 1-4 as a fraction of max HR (zone 5 is above)
+HR_ZONE_BOUNDS = (0.6, 0.7, 0.8, 0.9)
+DEFAULT_MAX_HR = 190
+
+METRIC_COLUMNS = ["GPS_Filename", "Track_Distance_m", "Moving_Time_s", "Track_Pace_min_per_mile",
+                  "GAP_min_per_mile", "Pace_CV"] + [f"HR_Z{z}_s" for z in range(1, 6)]
+SPLIT_COLUMNS = ["GPS_Filename", "Split", "Split_Distance_m", "Split_Time_s", "Split_Pace_min_per_mile"]
+
+def _concat_tracks(tracks):
+    """
+    Concatenate {filename: track dict} into flat point arrays plus the
+    track index of every point, so all tracks are processed together.
+    A TrackCollection already is that layout and is used without copying.
+    """
+    if isinstance(tracks, TrackCollection):
+        nonempty = tracks.lengths > 0
+        filenames = [f for f, keep in zip(tracks.names, nonempty) if keep]
+        lengths = tracks.lengths[nonempty]
+        track_idx = np.repeat(np.arange(len(filenames)), lengths)
+        return filenames, lengths, track_idx, tracks.columns
+
+    filenames = [f for f in tracks if len(tracks[f]["lat"]) > 0]
+    lengths = np.array([len(tracks[f]["lat"]) for f in filenames], dtype=np.int64)
+    columns = {
+        field: np.concatenate([tracks[f][field] for f in filenames])
+        for field in TRACK_FIELDS
+    }
+    track_idx = np.repeat(np.arange(len(filenames)), lengths)
+    return filenames, lengths, track_idx, columns
+
+def _per_track_cumsum(values, starts):
+    """Cumulative sum of point values that restarts at every track."""
+    total = np.cumsum(values)
+    return total - np.repeat(total[starts] - values[starts], np.diff(np.append(starts, len(values))))
+
+def _window_start(key, track_idx, width, span):
+    """
+    Index of the first point within `width` behind each point in `key`
+    (a per-track non-decreasing series), never crossing into the previous
+    track. `span` must exceed any key value so tracks don't overlap.
+    """
+    global_key = track_idx * span + key
+    return np.searchsorted(global_key, global_key - width, side="left")
+
+def _fill_elevation(ele, key, track_idx):
+    """
+    Linearly interpolate missing elevation over `key` (a distance that
+    increases across all tracks), only between two recorded points of the
+    same track. Points before the first or after the last recorded point
+    of their track stay NaN.
+    """
+    valid = np.isfinite(ele)
+    if valid.all() or not valid.any():
+        return ele
+    pos = np.arange(len(ele))
+    prev_valid = np.maximum.accumulate(np.where(valid, pos, -1))
+    next_valid = np.minimum.accumulate(np.where(valid, pos, len(ele))[::-1])[::-1]
+    inside = ~valid & (prev_valid >= 0) & (next_valid < len(ele))
+    inside[inside] &= (track_idx[prev_valid[inside]] == track_idx[inside]) \
+        & (track_idx[next_valid[inside]] == track_idx[inside])
+    filled = ele.copy()
+    filled[inside] = np.interp(key[inside], key[valid], ele[valid])
+    return filled
+
+def minetti_cost_factor(grade):
+    """
+    Energy cost of running at a grade relative to flat ground, from
+    Minetti et al. (2002): C(g) = 155.4g^5 - 30.4g^4 - 43.3g^3 + 46.3g^2
+    + 19.5g + 3.6 J/kg/m.
+    """
+    g = np.clip(grade, -0.45, 0.45)
+    cost = ((((155.4 * g - 30.4) * g - 43.3) * g + 46.3) * g + 19.5) * g + 3.6
+    return cost / 3.6
+
+@instrumented("stats.track_metrics", items=lambda result: len(result[0]))
+def compute_track_metrics(tracks, max_hr=DEFAULT_MAX_HR):
+    """
+    Per-activity metrics from the GPX point streams, computed for all
+    tracks at once with array operations (no per-point Python loops).
+
+    Args:
+        tracks: {filename: track dict from parse_gpx_track}
+        max_hr: max heart rate used for the HR zones
+
+    Returns:
+        (metrics, splits):
+        metrics - DataFrame, one row per GPS filename: Track_Distance_m,
+                  Moving_Time_s, Track_Pace_min_per_mile, GAP_min_per_mile,
+                  Pace_CV (within-run variability of the rolling pace) and
+                  HR_Z1_s .. HR_Z5_s (seconds in each HR zone)
+        splits  - DataFrame, one row per mile of every activity:
+                  GPS_Filename, Split, Split_Distance_m, Split_Time_s,
+                  Split_Pace_min_per_mile
+    """
+    if not any(len(track["lat"]) for track in tracks.values()):
+        return pd.DataFrame(columns=METRIC_COLUMNS), pd.DataFrame(columns=SPLIT_COLUMNS)
+
+    filenames, lengths, track_idx, cols = _concat_tracks(tracks)
+    n_tracks = len(filenames)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+
+    # Segment i runs from point i-1 to point i; the first point of each
+    # track has no segment (distance and time 0).
+    first_point = np.zeros(len(track_idx), dtype=bool)
+    first_point[starts] = True
+
+    lat, lon = cols["lat"], cols["lon"]
+    seg_dist = np.zeros(len(lat))
+    seg_dist[1:] = haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    seg_dist[first_point] = 0.0
+
+    seconds = cols["time"].astype("datetime64[s]").astype(np.int64).astype(float)
+    seconds[np.isnat(cols["time"])] = np.nan
+    seg_time = np.zeros(len(lat))
+    seg_time[1:] = np.diff(seconds)
+    seg_time[first_point | ~np.isfinite(seg_time) | (seg_time < 0)] = 0.0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(seg_time > 0, seg_dist / seg_time, 0.0)
+    moving = (speed >= MOVING_SPEED_MPS) & (seg_time <= MAX_SEGMENT_SECONDS)
+    moving_time = np.where(moving, seg_time, 0.0)
+    moving_dist = np.where(moving, seg_dist, 0.0)
+
+    cum_dist = _per_track_cumsum(seg_dist, starts)
+    cum_time = _per_track_cumsum(moving_time, starts)
+
+    total_dist = np.bincount(track_idx, seg_dist, minlength=n_tracks)
+    total_moving_time = np.bincount(track_idx, moving_time, minlength=n_tracks)
+    total_moving_dist = np.bincount(track_idx, moving_dist, minlength=n_tracks)
+
+    # Rolling pace over the last PACE_WINDOW_S seconds of moving time
+    span = max(cum_time.max(initial=0), cum_dist.max(initial=0)) + PACE_WINDOW_S + GRADE_WINDOW_M + 1
+    back = _window_start(cum_time, track_idx, PACE_WINDOW_S, span)
+    window_time = cum_time - cum_time[back]
+    window_dist = cum_dist - cum_dist[back]
+    valid_pace = moving & (window_time >= PACE_WINDOW_S / 2) & (window_dist > 10)
+    pace = np.where(valid_pace, window_time / np.where(window_dist > 0, window_dist, 1), 0.0)
+
+    n_pace = np.bincount(track_idx, valid_pace, minlength=n_tracks)
+    sum_pace = np.bincount(track_idx, pace, minlength=n_tracks)
+    sum_pace_sq = np.bincount(track_idx, pace ** 2, minlength=n_tracks)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_pace = sum_pace / n_pace
+        std_pace = np.sqrt(np.maximum(sum_pace_sq / n_pace - mean_pace ** 2, 0))
+        pace_cv = np.where(n_pace > 1, std_pace / mean_pace, np.nan)
+
+    # Grade over the last GRADE_WINDOW_M meters -> grade-adjusted distance.
+    # Elevation gaps are bridged within a track; points with no elevation
+    # on one side (or none at all) count as flat.
+    ele = _fill_elevation(cols["ele"].astype(float), track_idx * span + cum_dist, track_idx)
+    back = _window_start(cum_dist, track_idx, GRADE_WINDOW_M, span)
+    rise_dist = cum_dist - cum_dist[back]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        grade = np.where(rise_dist > 5, (ele - ele[back]) / rise_dist, 0.0)
+    grade[~np.isfinite(grade)] = 0.0
+    adjusted_dist = np.bincount(track_idx, moving_dist * minetti_cost_factor(grade), minlength=n_tracks)
+
+    # Time in HR zones (all recorded time, not only moving)
+    hr = cols["hr"].astype(float)
+    has_hr = np.isfinite(hr) & (seg_time <= MAX_SEGMENT_SECONDS)
+    zone = np.searchsorted(HR_ZONE_BOUNDS, np.where(has_hr, hr, 0) / max_hr, side="right")
+    zone_time = np.bincount(
+        track_idx[has_hr] * 5 + zone[has_hr], seg_time[has_hr], minlength=n_tracks * 5
+    ).reshape(n_tracks, 5)
+
+    to_min_per_mile = METERS_PER_MILE / 60
+    with np.errstate(divide="ignore", invalid="ignore"):
+        track_pace = np.where(total_moving_dist > 0, total_moving_time / total_moving_dist, np.nan)
+        gap = np.where(adjusted_dist > 0, total_moving_time / adjusted_dist, np.nan)
+    metrics = pd.DataFrame({
+        "GPS_Filename": filenames,
+        "Track_Distance_m": total_dist,
+        "Moving_Time_s": total_moving_time,
+        "Track_Pace_min_per_mile": track_pace * to_min_per_mile,
+        "GAP_min_per_mile": gap * to_min_per_mile,
+        "Pace_CV": pace_cv,
+    })
+    for z in range(5):
+        metrics[f"HR_Z{z + 1}_s"] = zone_time[:, z]
+
+    # Per-mile splits: moving time of the segments ending inside each mile
+    mile = (cum_dist // METERS_PER_MILE).astype(np.int64)
+    max_mile = int(mile.max(initial=0)) + 1
+    split_key = track_idx * max_mile + mile
+    split_time = np.bincount(split_key, moving_time, minlength=n_tracks * max_mile)
+    split_dist = np.bincount(split_key, seg_dist, minlength=n_tracks * max_mile)
+    has_split = np.zeros(n_tracks * max_mile, dtype=bool)
+    has_split[split_key] = True
+    keys = np.flatnonzero(has_split)
+    splits = pd.DataFrame({
+        "GPS_Filename": np.asarray(filenames, dtype=object)[keys // max_mile],
+        "Split": keys % max_mile + 1,
+        "Split_Distance_m": split_dist[keys],
+        "Split_Time_s": split_time[keys],
+    })
+    with np.errstate(divide="ignore", invalid="ignore"):
+        splits["Split_Pace_min_per_mile"] = np.where(
+            splits["Split_Distance_m"] > 0, splits["Split_Time_s"] / splits["Split_Distance_m"], np.nan
+        ) * to_min_per_mile
+
+    return metrics, splits
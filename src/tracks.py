@@ -0,0 +1,201 @@
+"""
+TrackCollection: every trackpoint of many tracks in one set of contiguous
+arrays plus an offsets array, instead of a dict of per-track arrays.
+
+Track i's points are rows offsets[i]:offsets[i + 1] of each column, so a
+track is a zero-copy view. A collection behaves like the read-only
+{filename: track dict} mapping the pipeline has always passed around, so
+collection[name]["lat"] still works everywhere.
+"""
+import json
+import os
+import shutil
+from collections.abc import Mapping
+
+import numpy as np
+
+TRACK_FIELDS = ("lat", "lon", "ele", "time", "hr")
+
+# Column dtypes: coordinates stay float64 (float32 would cost ~0.5 m),
+# time is datetime64[s] (int64 storage)
+TRACK_DTYPES = {
+    "lat": np.float64,
+    "lon": np.float64,
+    "ele": np.float32,
+    "time": "datetime64[s]",
+    "hr": np.float32,
+}
+
+class TrackCollection(Mapping):
+    """
+    Tracks stored column-wise in contiguous arrays.
+
+    Attributes:
+        names: list of track names (GPX filenames), in storage order
+        offsets: int64 array of len(names) + 1 row boundaries
+        columns: {field: array} with one row per trackpoint
+        path: folder the arrays are memory-mapped from, or None
+    """
+
+    def __init__(self, names, offsets, columns, path=None):
+        self.names = list(names)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.columns = columns
+        self.path = path
+        self._positions = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def from_tracks(cls, tracks):
+        """Pack {name: track dict} (or another collection) into one collection."""
+        if isinstance(tracks, TrackCollection):
+            return tracks
+        names = list(tracks.keys())
+        lengths = [len(tracks[name]["lat"]) for name in names]
+        offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+        columns = {}
+        for field in TRACK_FIELDS:
+            column = np.empty(offsets[-1], dtype=TRACK_DTYPES[field])
+            for name, start, end in zip(names, offsets[:-1], offsets[1:]):
+                column[start:end] = tracks[name][field]
+            columns[field] = column
+        return cls(names, offsets, columns)
+
+    # Mapping interface: collection[name] -> {field: view}
+    def __getitem__(self, name):
+        return self.track(self._positions[name])
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def track(self, i):
+        """Track at position i as {field: zero-copy view}."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return {field: column[start:end] for field, column in self.columns.items()}
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def n_points(self):
+        return int(self.offsets[-1])
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values()) + self.offsets.nbytes
+
+    def positions(self, names):
+        """Storage positions of names (KeyError for unknown names)."""
+        return np.array([self._positions[name] for name in names], dtype=np.int64)
+
+    def slice(self, start, stop):
+        """Tracks start..stop-1 as a new collection sharing this one's arrays."""
+        lo, hi = self.offsets[start], self.offsets[stop]
+        return TrackCollection(
+            self.names[start:stop],
+            self.offsets[start:stop + 1] - lo,
+            {field: column[lo:hi] for field, column in self.columns.items()},
+        )
+
+    def subset(self, names):
+        """
+        The named tracks, in that order, copied into a new contiguous
+        collection (one gather per column).
+        """
+        positions = self.positions(names)
+        starts, ends = self.offsets[positions], self.offsets[positions + 1]
+        lengths = ends - starts
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        # Row index of every point: its track's start plus its rank within the track
+        rows = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return TrackCollection(
+            [self.names[i] for i in positions], offsets,
+            {field: column[rows] for field, column in self.columns.items()},
+        )
+
+    def compress(self, keep):
+        """
+        A new collection with only the points where the boolean mask keep
+        (one entry per point) is True; every track is kept, even if empty.
+        """
+        track_idx = np.repeat(np.arange(len(self)), self.lengths)
+        lengths = np.bincount(track_idx[keep], minlength=len(self))
+        return TrackCollection(
+            self.names, np.concatenate(([0], np.cumsum(lengths))),
+            {field: column[keep] for field, column in self.columns.items()},
+        )
+
+    def group_by(self, names, labels):
+        """
+        Split tracks by label (e.g. cluster ID): one gather into label order,
+        then a zero-copy slice per label.
+
+        Args:
+            names: track names
+            labels: label of each name
+
+        Returns:
+            dict: {label: TrackCollection}
+        """
+        labels = np.asarray(labels)
+        order = np.argsort(labels, kind="stable")
+        grouped = self.subset([names[i] for i in order])
+        unique, starts = np.unique(labels[order], return_index=True)
+        stops = np.append(starts[1:], len(order))
+        return {label: grouped.slice(start, stop) for label, start, stop in zip(unique.tolist(), starts, stops)}
+
+    def save(self, path):
+        """
+        Write the collection to a folder of .npy files (one per column),
+        which load() can memory-map. Written to a temporary folder first,
+        then moved into place.
+        """
+        tmp_path = path.rstrip("/\\") + ".tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, "offsets.npy"), self.offsets)
+        for field, column in self.columns.items():
+            np.save(os.path.join(tmp_path, f"{field}.npy"), column)
+        with open(os.path.join(tmp_path, "names.json"), "w", encoding="utf-8") as f:
+            json.dump({"names": self.names, "fields": list(self.columns)}, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=True, fields=None):
+        """
+        Open a collection written by save(). With mmap the columns are
+        memory-mapped read-only, so only the pages that are touched are
+        read, and the collection pickles as just its path.
+        """
+        with open(os.path.join(path, "names.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        columns = {
+            field: np.load(os.path.join(path, f"{field}.npy"), mmap_mode=mode)
+            for field in (fields or meta["fields"])
+        }
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+        return cls(meta["names"], offsets, columns, path=path if mmap else None)
+
+    def __getstate__(self):
+        # Memory-mapped collections travel to worker processes as their path
+        if self.path is not None:
+            return {"path": self.path, "fields": list(self.columns)}
+        return {"names": self.names, "offsets": self.offsets, "columns": self.columns}
+
+    def __setstate__(self, state):
+        if "path" in state:
+            loaded = TrackCollection.load(state["path"], mmap=True, fields=state["fields"])
+            state = {"names": loaded.names, "offsets": loaded.offsets, "columns": loaded.columns,
+                     "path": loaded.path}
+        self.__init__(state["names"], state["offsets"], state["columns"], state.get("path"))
+
+    def __repr__(self):
+        return f"TrackCollection({len(self)} tracks, {self.n_points} points, {self.nbytes / 2 ** 20:.1f} MB)"
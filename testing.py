@@ -7,8 +7,13 @@ import os
 import pandas as pd
 from pathlib import Path
 
-# Load your CSV
-df = pd.read_csv("data/activities.csv")  # Adjust path if needed
+from src.dedup import validate_export
+from src.join import build_route_key_index, match_routes
+from src.load_data import load_strava
+from src.load_gps import load_tracks_from_folder
+
+# Load your CSV (through the columnar store)
+df = load_strava("data/activities.csv")  # Adjust path if needed
 
 print("=" * 70)
 print("STRAVA GPS MATCHING DIAGNOSTIC")
@@ -33,49 +38,38 @@ print("\n" + "=" * 70)
 print("TESTING MATCH STRATEGIES")
 print("=" * 70)
 
+# Strategies 1-3 use the same hash lookups as the pipeline's join
+# (src/join.py): one index over all GPX filenames, one lookup per key.
+route_map = dict.fromkeys(gpx_files, 0)
+key_index = build_route_key_index(route_map)
+
 # Strategy 1: Exact match (e.g., 8083971283.gpx)
 print("\n[Strategy 1] Exact Activity ID match")
-matches_exact = 0
-for aid in activity_ids:
-    if f"{aid}.gpx" in gpx_files or f"{aid}.GPX" in gpx_files:
-        matches_exact += 1
-        print(f"  ✓ Found: {aid}.gpx")
-print(f"  Total matches: {matches_exact}/{len(activity_ids)}")
+matched = match_routes(pd.Series(activity_ids), route_map, key_index)
+exact = matched["RouteMatch"].isin(["exact", "gpx_extension"])
+for gpx in matched.loc[exact, "GPS_Filename"]:
+    print(f"  ✓ Found: {gpx}")
+print(f"  Total matches: {int(exact.sum())}/{len(activity_ids)}")
 
-# Strategy 2: Activity ID as substring
+# Strategy 2: Activity ID found in the filename (stem / digits)
 print("\n[Strategy 2] Activity ID as substring in filename")
-matches_substring = 0
-sample_matches = []
-for aid in activity_ids:
-    for gpx in gpx_files:
-        if aid in gpx:
-            matches_substring += 1
-            if len(sample_matches) < 5:
-                sample_matches.append((aid, gpx))
-            break
-if sample_matches:
-    for aid, gpx in sample_matches:
-        print(f"  ✓ {aid} → {gpx}")
-print(f"  Total matches: {matches_substring}/{len(activity_ids)}")
+found = matched["GPS_Filename"].notna()
+for aid, gpx in list(zip(pd.Series(activity_ids)[found], matched.loc[found, "GPS_Filename"]))[:5]:
+    print(f"  ✓ {aid} → {gpx}")
+print(f"  Total matches: {int(found.sum())}/{len(activity_ids)}")
 
 # Strategy 3: Check if GPX filenames match any column in CSV
 print("\n[Strategy 3] Checking all CSV columns for GPX filename matches")
 for col in df.columns:
     if col not in ["Activity ID"]:
-        matches = 0
-        sample = None
-        df_sample = df[col].head(20).astype(str)
-        for val in df_sample:
-            for gpx in gpx_files:
-                if val in gpx or gpx.replace(".gpx", "") in val:
-                    matches += 1
-                    if sample is None:
-                        sample = (val, gpx)
-                    break
-        if matches > 0:
-            print(f"  ✓ Column '{col}': {matches} matches")
-            if sample:
-                print(f"    Example: {sample[0]} → {sample[1]}")
+        values = df[col].head(20).dropna()
+        if values.empty:
+            continue
+        matched = match_routes(values.astype(str), route_map, key_index)
+        hits = matched["GPS_Filename"].dropna()
+        if len(hits) > 0:
+            print(f"  ✓ Column '{col}': {len(hits)} matches")
+            print(f"    Example: {values[hits.index[0]]} → {hits.iloc[0]}")
 
 # Strategy 4: Match by Activity Name + Date + Distance
 print("\n[Strategy 4] Fuzzy matching by Date + Distance")
@@ -95,6 +89,18 @@ if "Activity Date" in df.columns and "Distance" in df.columns:
                 break
     print(f"  Total matches by date: {matches}/10")
 
+# Duplicate uploads, GPX files with no CSV row and files without a track
+print("\n" + "=" * 70)
+print("EXPORT VALIDATION")
+print("=" * 70)
+tracks = load_tracks_from_folder(gpx_folder, cache_dir="data/cache/tracks")
+report, keep = validate_export(df, gpx_folder, tracks, index_path="data/cache/gps_files.parquet")
+for issue, rows in report.groupby("Issue"):
+    print(f"\n  {issue}: {len(rows)} files")
+    for _, row in rows.head(5).iterrows():
+        print(f"    {row['GPS_Filename']}" + (f" (same run as {row['Duplicate_Of']})"
+                                               if pd.notna(row["Duplicate_Of"]) else ""))
+
 print("\n" + "=" * 70)
 print("RECOMMENDATION")
 print("=" * 70)
@@ -0,0 +1,35 @@
+"""
+Small tracks for the tests, built in local meters and converted to the
+track dicts parse_gpx_track returns.
+"""
+import numpy as np
+
+from src.load_gps import EARTH_RADIUS_M
+
+ORIGIN = (45.0, -70.0)
+START = np.datetime64("2023-05-01T07:00:00", "s")
+
+def meters_to_latlon(x, y, origin=ORIGIN):
+    """Local (x east, y north) meters to lat/lon degrees (equirectangular)."""
+    lat = origin[0] + np.degrees(np.asarray(y, dtype=float) / EARTH_RADIUS_M)
+    lon = origin[1] + np.degrees(np.asarray(x, dtype=float) / (EARTH_RADIUS_M * np.cos(np.radians(origin[0]))))
+    return lat, lon
+
+def track_from_xy(x, y, start=START, step_s=1, times=None):
+    """Track dict (lat, lon, ele, time, hr) from local meters, one point every step_s seconds."""
+    lat, lon = meters_to_latlon(x, y)
+    n = len(lat)
+    if times is None:
+        times = start + np.arange(n) * step_s
+    return {
+        "lat": lat,
+        "lon": lon,
+        "ele": np.zeros(n, dtype=np.float32),
+        "time": np.asarray(times, dtype="datetime64[s]"),
+        "hr": np.full(n, np.nan, dtype=np.float32),
+    }
+
+def line_xy(length_m, spacing_m=3.0, offset=(0.0, 0.0), angle=0.0):
+    """Straight path of length_m starting at offset, heading angle (radians from east)."""
+    s = np.arange(0.0, length_m + spacing_m / 2, spacing_m)
+    return offset[0] + s * np.cos(angle), offset[1] + s * np.sin(angle)
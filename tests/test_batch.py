@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+from src.batch import LOCK_NAME, acquire_lock, release_lock, run_athletes
+from src.synthetic import generate_export
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HOLD_LOCK = """
+import sys
+from src.batch import acquire_lock
+print(acquire_lock(sys.argv[1]), flush=True)
+sys.stdin.read()
+"""
+
+def test_lock_left_by_a_dead_process_is_taken_over(tmp_path):
+    folder = str(tmp_path)
+    with open(os.path.join(folder, LOCK_NAME), "w") as f:
+        f.write("999999")
+    assert acquire_lock(folder)
+    with open(os.path.join(folder, LOCK_NAME)) as f:
+        assert f.read() == str(os.getpid())
+    assert not acquire_lock(folder)
+    release_lock(folder)
+    assert acquire_lock(folder)
+    release_lock(folder)
+
+def test_lock_held_by_a_live_process_is_refused_until_it_dies(tmp_path):
+    folder = str(tmp_path)
+    holder = subprocess.Popen([sys.executable, "-c", HOLD_LOCK, folder], cwd=ROOT, text=True,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        assert holder.stdout.readline().strip() == "True"
+        assert not acquire_lock(folder)
+    finally:
+        # Killed, not shut down: the OS lock has to go with the process
+        holder.kill()
+        holder.communicate()
+    assert acquire_lock(folder)
+    release_lock(folder)
+
+def test_failed_athletes_are_retried_and_locked_ones_are_not(tmp_path):
+    exports, runs = tmp_path / "exports", tmp_path / "runs"
+    generate_export(str(exports / "good"), n_activities=16, seed=1)
+    (exports / "broken").mkdir()
+    (exports / "broken" / "activities.csv").write_text("")
+    generate_export(str(exports / "busy"), n_activities=16, seed=2)
+    assert acquire_lock(str(runs / "busy"))
+    try:
+        summary = run_athletes(str(exports), output_dir=str(runs), workers=2, retries=2,
+                               geocode_offline=True, gazetteer_path=None)
+    finally:
+        release_lock(str(runs / "busy"))
+
+    summary = summary.set_index("Athlete")
+    assert summary.loc["good", "Status"] == "ok" and summary.loc["good", "Attempts"] == 1
+    assert summary.loc["broken", "Status"] == "failed" and summary.loc["broken", "Attempts"] == 3
+    assert summary.loc["busy", "Status"] == "locked" and summary.loc["busy", "Attempts"] == 1
+    log = (runs / "broken" / "run.log").read_text()
+    assert all(f"attempt {n} =====" in log for n in (1, 2, 3))
+    assert pd.read_csv(runs / "batch_summary.csv")["Athlete"].tolist() == ["broken", "busy", "good"]
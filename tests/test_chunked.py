@@ -0,0 +1,102 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import src.chunked
+from src.chunked import BATCH_BUDGET_SHARE, GPX_MEMORY_FACTOR, plan_batches, run_chunked
+from src.synthetic import generate_export
+
+MB = 2 ** 20
+# File size that uses the whole batch share of a 1 MB budget
+LIMIT = MB * BATCH_BUDGET_SHARE / GPX_MEMORY_FACTOR
+
+@pytest.mark.parametrize("fractions, expected", [
+    ([0.9, 3.0, 0.1], [(0, 1), (1, 2), (2, 3)]),
+    ([0.99] * 4, [(0, 1), (1, 2), (2, 3), (3, 4)]),
+    ([0.3, 0.3, 0.3, 0.3, 0.5], [(0, 3), (3, 5)]),
+    ([2.0, 2.0], [(0, 1), (1, 2)]),
+    ([0.0, 0.0], [(0, 2)]),
+    ([], []),
+])
+def test_plan_batches(fractions, expected):
+    sizes = [int(f * LIMIT) for f in fractions]
+    batches = plan_batches(sizes, memory_budget_mb=1)
+    assert batches == expected
+    for start, stop in batches:
+        assert stop - start == 1 or sum(sizes[start:stop]) <= LIMIT
+
+def _outputs(output_dir):
+    return {name: pd.read_csv(output_dir / name) for name in ("route_stats_gps.csv", "cleaned_strava_with_gps.csv")}
+
+def test_interrupted_run_resumes_after_the_last_finished_batch(tmp_path, monkeypatch, capsys):
+    export = generate_export(str(tmp_path / "export"), n_activities=24, seed=4)
+    options = dict(csv_path=export["csv_path"], gps_folder=export["gps_folder"], memory_budget_mb=0.3)
+
+    run_chunked(output_dir=str(tmp_path / "clean"), work_dir=str(tmp_path / "clean_work"), **options)
+    expected = _outputs(tmp_path / "clean")
+    assert "Batch 3/" in capsys.readouterr().out
+
+    process_batch, calls = src.chunked._process_batch, []
+
+    def fail_on_third_batch(*args):
+        calls.append(len(args[2]))
+        if len(calls) == 3:
+            raise RuntimeError("interrupted")
+        return process_batch(*args)
+
+    monkeypatch.setattr(src.chunked, "_process_batch", fail_on_third_batch)
+    with pytest.raises(RuntimeError):
+        run_chunked(output_dir=str(tmp_path / "out"), work_dir=str(tmp_path / "work"), **options)
+    monkeypatch.setattr(src.chunked, "_process_batch", process_batch)
+    capsys.readouterr()
+
+    run_chunked(output_dir=str(tmp_path / "out"), work_dir=str(tmp_path / "work"), **options)
+    assert "Resuming after batch 2 of" in capsys.readouterr().out
+    for name, df in _outputs(tmp_path / "out").items():
+        pd.testing.assert_frame_equal(df, expected[name])
+
+    # Other settings change the fingerprint: everything is redone
+    run_chunked(output_dir=str(tmp_path / "out"), work_dir=str(tmp_path / "work"), eps=150.0, **options)
+    assert "Resuming" not in capsys.readouterr().out
+
+def test_resume_skips_leading_batches_without_tracks(tmp_path, monkeypatch, capsys):
+    export = generate_export(str(tmp_path / "export"), n_activities=24, seed=6)
+    # Sorts first and is over the 0.3 MB batch limit: a batch of its own that yields no track
+    with open(os.path.join(export["gps_folder"], "000_broken.gpx"), "w", encoding="utf-8") as f:
+        f.write("<gpx>" + "x" * int(LIMIT * 0.3 + 1024) + "\n")
+    options = dict(csv_path=export["csv_path"], gps_folder=export["gps_folder"], memory_budget_mb=0.3)
+
+    run_chunked(output_dir=str(tmp_path / "clean"), work_dir=str(tmp_path / "clean_work"), **options)
+    expected = _outputs(tmp_path / "clean")
+
+    process_batch, calls = src.chunked._process_batch, []
+
+    def fail_on_second_batch(*args):
+        calls.append(list(args[2]))
+        if len(calls) == 2:
+            raise RuntimeError("interrupted")
+        return process_batch(*args)
+
+    monkeypatch.setattr(src.chunked, "_process_batch", fail_on_second_batch)
+    with pytest.raises(RuntimeError):
+        run_chunked(output_dir=str(tmp_path / "out"), work_dir=str(tmp_path / "work"), **options)
+    assert calls[0] == ["000_broken.gpx"]
+    with open(tmp_path / "work" / "progress.json", encoding="utf-8") as f:
+        assert json.load(f)["batches_done"] == 1
+    assert not (tmp_path / "work" / "route_index.npz").exists()
+    capsys.readouterr()
+
+    calls.clear()
+
+    def record_batches(*args):
+        calls.append(list(args[2]))
+        return process_batch(*args)
+
+    monkeypatch.setattr(src.chunked, "_process_batch", record_batches)
+    run_chunked(output_dir=str(tmp_path / "out"), work_dir=str(tmp_path / "work"), **options)
+    assert "Resuming after batch 1 of" in capsys.readouterr().out
+    assert all("000_broken.gpx" not in batch for batch in calls)
+    for name, df in _outputs(tmp_path / "out").items():
+        pd.testing.assert_frame_equal(df, expected[name])
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from helpers import line_xy, track_from_xy
+from src.clustering import (_dbscan_labels, _tracks_from_vectors, cluster_routes_by_similarity, fit_route_frame,
+                            frechet_distances, route_components, route_distance_graph, route_distances,
+                            to_local_meters)
+from src.load_gps import vectorize_tracks
+
+def naive_frechet(a, b):
+    """Discrete Fréchet distance by the textbook row-by-row DP."""
+    n, m = len(a), len(b)
+    ca = np.zeros((n, m))
+    for i in range(n):
+        for j in range(m):
+            cost = np.linalg.norm(a[i] - b[j])
+            if i == 0 and j == 0:
+                ca[i, j] = cost
+            elif i == 0:
+                ca[i, j] = max(ca[i, j - 1], cost)
+            elif j == 0:
+                ca[i, j] = max(ca[i - 1, j], cost)
+            else:
+                ca[i, j] = max(min(ca[i - 1, j], ca[i, j - 1], ca[i - 1, j - 1]), cost)
+    return ca[-1, -1]
+
+def random_walks(rng, batch, n, scale=50.0):
+    return np.cumsum(rng.normal(0, scale, size=(batch, n, 2)), axis=1)
+
+@pytest.mark.parametrize("n, m", [(1, 1), (1, 6), (6, 1), (2, 2), (7, 7), (12, 5), (5, 12)])
+def test_frechet_matches_naive_dp(n, m):
+    rng = np.random.default_rng(n * 100 + m)
+    a, b = random_walks(rng, 20, n), random_walks(rng, 20, m)
+    expected = [naive_frechet(x, y) for x, y in zip(a, b)]
+    np.testing.assert_allclose(frechet_distances(a, b), expected)
+
+def test_frechet_early_abandoning_is_exact_below_threshold():
+    rng = np.random.default_rng(7)
+    a, b = random_walks(rng, 200, 15), random_walks(rng, 200, 15)
+    exact = np.array([naive_frechet(x, y) for x, y in zip(a, b)])
+    for max_distance in np.quantile(exact, [0.1, 0.5, 0.9]):
+        result = frechet_distances(a, b, max_distance)
+        within = exact <= max_distance
+        np.testing.assert_allclose(result[within], exact[within])
+        assert np.isinf(result[~within]).all()
+
+def test_frechet_per_pair_thresholds():
+    rng = np.random.default_rng(8)
+    a, b = random_walks(rng, 100, 12), random_walks(rng, 100, 12)
+    exact = frechet_distances(a, b)
+    limits = rng.uniform(0.5, 1.5, len(a)) * exact
+    result = frechet_distances(a, b, limits)
+    within = exact <= limits
+    np.testing.assert_allclose(result[within], exact[within])
+    assert within.any() and np.isinf(result[~within]).all()
+
+def test_frechet_abandons_pairs_that_start_far_apart():
+    a = np.zeros((1, 10, 2))
+    b = np.full((1, 10, 2), 1000.0)
+    assert np.isinf(frechet_distances(a, b, max_distance=10.0)[0])
+
+def test_route_distances_ignore_direction_and_loop_start():
+    angle = np.linspace(0, 2 * np.pi, 60)
+    loop = np.column_stack((500 * np.cos(angle), 500 * np.sin(angle)))[None]
+    rolled = np.roll(loop[:, :-1], 17, axis=1)
+    rolled = np.concatenate((rolled, rolled[:, :1]), axis=1)
+    assert route_distances(loop, loop[:, ::-1])[0] == pytest.approx(0.0)
+    assert route_distances(loop, rolled)[0] < 60.0
+    assert frechet_distances(loop, rolled)[0] > 500.0
+
+def _vectors(offsets, length_m=2000):
+    tracks = {f"t{k}.gpx": track_from_xy(*line_xy(length_m, offset=offset)) for k, offset in enumerate(offsets)}
+    _, vectors = vectorize_tracks(tracks, n_points=50, method="distance")
+    return vectors
+
+def test_distance_graph_matches_brute_force():
+    offsets = [(0, 0), (0, 120), (30, 260), (0, 900), (2500, 0), (0, 0), (-50, 40)]
+    vectors = _vectors(offsets)
+    frame = fit_route_frame(vectors)
+    graph = route_distance_graph(vectors, frame, 300.0, batch_size=4).toarray()
+
+    local = to_local_meters(_tracks_from_vectors(vectors), frame["origin"])
+    n = len(local)
+    i, j = np.meshgrid(np.arange(n), np.arange(n), indexing="ij")
+    brute = route_distances(local[i.ravel()], local[j.ravel()]).reshape(n, n)
+    brute[brute > 300.0] = 0.0
+    np.fill_diagonal(brute, 0.0)
+    np.testing.assert_allclose(graph, brute, atol=1e-6)
+
+def test_distance_graph_keeps_explicit_zeros():
+    # Tracks 0 and 1 are identical: their distance is 0 but they are neighbours
+    vectors = _vectors([(0, 0), (0, 0), (0, 5000)])
+    frame = fit_route_frame(vectors)
+    graph = route_distance_graph(vectors, frame, 200.0).tocoo()
+    stored = set(zip(graph.row.tolist(), graph.col.tolist()))
+    assert {(0, 1), (1, 0), (0, 0), (1, 1), (2, 2)} <= stored
+    assert (0, 2) not in stored
+    assert graph.toarray()[0, 1] == 0.0
+
+    labels = cluster_routes_by_similarity(vectors, frame, [50.0, 200.0])
+    for eps in (50.0, 200.0):
+        assert labels[eps][0] == labels[eps][1] != labels[eps][2]
+
+def test_distance_graph_rows():
+    vectors = _vectors([(0, 0), (0, 100), (0, 5000)])
+    frame = fit_route_frame(vectors)
+    full = route_distance_graph(vectors, frame, 200.0).toarray()
+    rows = route_distance_graph(vectors, frame, 200.0, rows=[2, 0]).toarray()
+    np.testing.assert_allclose(rows, full[[2, 0]])
+    assert route_distance_graph(vectors, frame, 200.0, rows=[]).shape == (0, 3)
+
+@pytest.mark.parametrize("seed", range(4))
+def test_route_components_equal_dbscan_on_full_graph(seed):
+    rng = np.random.default_rng(seed)
+    # Chains of parallel lines a varying gap apart, some of them reversed
+    offsets = [(float(x), float(y)) for x, y in rng.uniform(0, 1500, size=(30, 2)).round(-1)]
+    tracks = {}
+    for k, offset in enumerate(offsets):
+        x, y = line_xy(1500, offset=offset, angle=float(rng.choice([0.0, np.pi, np.pi / 2])))
+        tracks[f"t{k}.gpx"] = track_from_xy(x, y)
+    _, vectors = vectorize_tracks(tracks, n_points=30, method="distance")
+    frame = fit_route_frame(vectors)
+    eps_values = [100.0, 250.0, 400.0]
+
+    expected = _dbscan_labels(route_distance_graph(vectors, frame, eps_values[-1]), eps_values, 1)
+    labels = route_components(vectors, frame, eps_values, batch_size=3)
+    for eps in eps_values:
+        np.testing.assert_array_equal(labels[eps], expected[eps])
+    assert len(np.unique(labels[100.0])) > len(np.unique(labels[400.0])) > 1
@@ -0,0 +1,156 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from helpers import START, line_xy, track_from_xy
+from src.dedup import (NEAR_DUPLICATE_DISTANCE_M, NEAR_DUPLICATE_OVERLAP, PROBE_FRACTIONS, _positions_at,
+                       _time_order, _time_spans, duplicate_groups, near_duplicate_pairs, validate_export)
+from src.load_gps import haversine_m
+from src.tracks import TrackCollection
+
+def naive_near_duplicates(tracks):
+    """Every pair, compared point by point."""
+    names = list(tracks)
+    seconds = {name: tracks[name]["time"].astype("datetime64[s]").astype(np.int64).astype(float) for name in names}
+
+    def position(name, when):
+        before = np.flatnonzero(seconds[name] <= when)
+        k = before[-1] if len(before) else 0
+        return tracks[name]["lat"][k], tracks[name]["lon"][k]
+
+    pairs = set()
+    for i, a in enumerate(names):
+        for j in range(i + 1, len(names)):
+            b = names[j]
+            if not len(seconds[a]) or not len(seconds[b]):
+                continue
+            start = max(seconds[a][0], seconds[b][0])
+            shared = min(seconds[a][-1], seconds[b][-1]) - start
+            shorter = min(seconds[a][-1] - seconds[a][0], seconds[b][-1] - seconds[b][0])
+            if shared <= 0 or shared < NEAR_DUPLICATE_OVERLAP * shorter:
+                continue
+            if all(haversine_m(*position(a, start + f * shared), *position(b, start + f * shared))
+                   <= NEAR_DUPLICATE_DISTANCE_M for f in PROBE_FRACTIONS):
+                pairs.add((i, j))
+    return pairs
+
+def _random_tracks(rng, n_runs):
+    """Runs recorded by one to three devices, with start time and position jitter."""
+    tracks = {}
+    for run in range(n_runs):
+        start = START + int(rng.integers(0, 6 * 3600))
+        length = float(rng.integers(600, 3000))
+        offset = rng.normal(0, 2000, 2)
+        for device in range(int(rng.integers(1, 4))):
+            jitter = int(rng.integers(0, 90)) if device else 0
+            x, y = line_xy(length * rng.uniform(0.8, 1.0), spacing_m=float(rng.uniform(2, 5)),
+                           offset=offset + rng.normal(0, 40, 2))
+            tracks[f"r{run}_{device}.gpx"] = track_from_xy(x, y, start=start + jitter, step_s=int(rng.integers(1, 3)))
+    return tracks
+
+def test_near_duplicate_pairs_match_brute_force():
+    rng = np.random.default_rng(5)
+    tracks = _random_tracks(rng, 60)
+    a, b = near_duplicate_pairs(TrackCollection.from_tracks(tracks))
+    found = {(min(i, j), max(i, j)) for i, j in zip(a.tolist(), b.tolist())}
+    expected = naive_near_duplicates(tracks)
+    assert found == expected
+    assert len(expected) >= 5
+
+def test_recordings_at_other_times_are_not_near_duplicates():
+    x, y = line_xy(3000)
+    tracks = {"morning.gpx": track_from_xy(x, y), "evening.gpx": track_from_xy(x, y, start=START + 12 * 3600),
+              "watch.gpx": track_from_xy(x + 5, y, step_s=1), "empty.gpx": track_from_xy([], [])}
+    a, b = near_duplicate_pairs(TrackCollection.from_tracks(tracks))
+    assert sorted(zip(a.tolist(), b.tolist())) in ([(0, 2)], [(2, 0)])
+
+def test_positions_at_with_clock_jumps():
+    rng = np.random.default_rng(4)
+    tracks = {}
+    for k in range(6):
+        x, y = line_xy(float(rng.integers(50, 400)), offset=(1000.0 * k, 0.0))
+        times = START + rng.integers(0, 600, len(x))  # out of order, with repeats
+        tracks[f"t{k}.gpx"] = track_from_xy(x, y, times=times)
+    tracks["empty.gpx"] = track_from_xy([], [])
+    collection = TrackCollection.from_tracks(tracks)
+    seconds, _, _ = _time_spans(collection)
+    time_order = _time_order(collection, seconds)
+
+    track = np.repeat(np.arange(6), 40)
+    when = seconds.min() + rng.uniform(-60, 660, len(track))
+    found = _positions_at(collection, time_order, track, when)
+    for t, w, i in zip(track, when, found):
+        lo, hi = collection.offsets[t], collection.offsets[t + 1]
+        times = seconds[lo:hi]
+        # Latest point at or before `when`, else the earliest point
+        expected = times[times <= w].max() if (times <= w).any() else times.min()
+        assert lo <= i < hi and seconds[i] == expected
+
+def naive_groups(n, pairs, rank):
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for a, b in zip(*pairs):
+        parent[find(a)] = find(b)
+    keeper = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        members = [j for j in range(n) if find(j) == find(i)]
+        keeper[i] = min(members, key=lambda j: rank[j])
+    return keeper
+
+def test_duplicate_groups_match_union_find():
+    rng = np.random.default_rng(2)
+    n = 40
+    pairs = (rng.integers(0, n, 25), rng.integers(0, n, 25))
+    rank = rng.permutation(n)
+    np.testing.assert_array_equal(duplicate_groups(n, pairs, rank), naive_groups(n, pairs, rank))
+    no_pairs = (np.empty(0, dtype=int), np.empty(0, dtype=int))
+    np.testing.assert_array_equal(duplicate_groups(3, no_pairs, np.arange(3)), np.arange(3))
+
+GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>
+{points}
+</trkseg></trk></gpx>
+"""
+
+def _write_gpx(path, track):
+    points = "\n".join(
+        f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><time>{str(t)}Z</time></trkpt>'
+        for lat, lon, t in zip(track["lat"], track["lon"], track["time"]))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(GPX.format(points=points))
+
+def test_validate_export_flags_duplicates_and_orphans(tmp_path):
+    from src.load_gps import load_tracks_from_folder
+
+    folder = tmp_path / "activities"
+    folder.mkdir()
+    x, y = line_xy(1500)
+    _write_gpx(folder / "1.gpx", track_from_xy(x, y))
+    _write_gpx(folder / "2.gpx", track_from_xy(x, y))                               # same bytes
+    _write_gpx(folder / "3.gpx", track_from_xy(x + 4, y))                           # same run, other device
+    _write_gpx(folder / "4.gpx", track_from_xy(x, y, start=START + 86400))          # next day, not in the CSV
+    with open(folder / "5.gpx", "w", encoding="utf-8") as f:
+        f.write(GPX.format(points=""))                                              # no points
+    activities = pd.DataFrame({"Activity ID": [1, 3, 5], "Filename": ["activities/1.gpx", None, None]})
+
+    tracks = load_tracks_from_folder(str(folder))
+    index_path = str(tmp_path / "cache" / "gps_files.parquet")
+    report, keep = validate_export(activities, str(folder), tracks, index_path=index_path)
+    issues = {(row.GPS_Filename, row.Issue): row.Duplicate_Of for row in report.itertuples()}
+    assert issues[("2.gpx", "duplicate")] == "1.gpx"
+    assert issues[("3.gpx", "near_duplicate")] == "1.gpx"
+    assert ("4.gpx", "orphan") in issues and ("2.gpx", "orphan") in issues
+    assert "1.gpx" in keep and "4.gpx" in keep
+    assert "2.gpx" not in keep and "3.gpx" not in keep
+    assert os.path.exists(index_path) or os.path.exists(os.path.splitext(index_path)[0] + ".csv")
+
+    # A second run reuses the index and finds the same
+    again, keep_again = validate_export(activities, str(folder), tracks, index_path=index_path)
+    pd.testing.assert_frame_equal(again, report)
+    assert list(keep_again) == list(keep)
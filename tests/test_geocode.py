@@ -0,0 +1,84 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+
+import numpy as np
+import pandas as pd
+
+from src.geocode import (UNKNOWN_LOCATION, SharedRateLimiter, StubGeocoder, cache_key, format_address,
+                         get_location_names, load_gazetteer, nearest_gazetteer_names)
+from src.load_gps import haversine_m
+
+CENTROIDS = {0: (45.00012, -70.00031), 1: (45.00049, -70.00001), 2: (46.5, -71.25)}
+
+def test_names_come_from_the_geocoder_once_then_from_the_cache(tmp_path):
+    cache_path = str(tmp_path / "geocode_cache.json")
+    geocoder = StubGeocoder({(45.0, -70.0): "12 Main St, Riverside, Portland, Maine"}, default="1 Elm St, Hill, Bangor")
+    names = get_location_names(CENTROIDS, cache_path=cache_path, geocoder=geocoder, workers=2, min_delay=0)
+    assert names == {0: "Riverside, Portland", 1: "Riverside, Portland", 2: "Hill, Bangor"}
+    # Centroids 0 and 1 round to the same location: one lookup for both
+    assert geocoder.calls == 2
+
+    again = StubGeocoder(default=None)
+    assert get_location_names(CENTROIDS, cache_path=cache_path, geocoder=again, min_delay=0) == names
+    assert again.calls == 0
+
+def test_unknown_answers_are_not_cached(tmp_path):
+    cache_path = str(tmp_path / "geocode_cache.json")
+    geocoder = StubGeocoder(default=None)
+    assert set(get_location_names(CENTROIDS, cache_path=cache_path, geocoder=geocoder, min_delay=0).values()) \
+        == {UNKNOWN_LOCATION}
+    get_location_names(CENTROIDS, cache_path=cache_path, geocoder=geocoder, min_delay=0)
+    assert geocoder.calls == 4
+
+def test_failed_lookups_are_reported_not_raised():
+    class Failing(StubGeocoder):
+        def reverse(self, query, **kwargs):
+            raise TimeoutError("no network")
+
+    names = get_location_names(CENTROIDS, geocoder=Failing(), min_delay=0)
+    assert set(names.values()) == {UNKNOWN_LOCATION}
+
+def _call_times(rate_limiter, n=3):
+    times = []
+    for _ in range(n):
+        rate_limiter.wait()
+        times.append(time.time())
+    return times
+
+def test_shared_rate_limiter_spaces_calls_across_processes():
+    with Manager() as manager:
+        rate_limiter = SharedRateLimiter(0.1, manager)
+        with ProcessPoolExecutor(max_workers=3) as pool:
+            times = sorted(t for result in pool.map(_call_times, [rate_limiter] * 3) for t in result)
+    assert np.diff(times).min() > 0.09
+
+def test_offline_gazetteer(tmp_path):
+    gazetteer_path = tmp_path / "places.csv"
+    gazetteer_path.write_text("name,lat,lon\nRiverside,45.001,-70.0\nHill,46.49,-71.25\n", encoding="utf-8")
+    geocoder = StubGeocoder()
+    names = get_location_names(CENTROIDS, geocoder=geocoder, offline=True, gazetteer_path=str(gazetteer_path))
+    assert names == {0: "Riverside", 1: "Riverside", 2: "Hill"}
+    assert geocoder.calls == 0
+
+def test_nearest_gazetteer_names_match_brute_force(tmp_path):
+    rng = np.random.default_rng(9)
+    places = np.column_stack((rng.uniform(44, 46, 300), rng.uniform(-71, -69, 300)))
+    names = [f"place {k}" for k in range(len(places))]
+    coords = np.column_stack((rng.uniform(43.9, 46.1, 200), rng.uniform(-71.1, -68.9, 200)))
+    result = nearest_gazetteer_names(coords, (names, places), max_distance_m=5000)
+    for (lat, lon), name in zip(coords, result):
+        dist = haversine_m(lat, lon, places[:, 0], places[:, 1])
+        assert name == (names[dist.argmin()] if dist.min() <= 5000 else UNKNOWN_LOCATION)
+    assert UNKNOWN_LOCATION in result and len(set(result)) > 10
+    # A loaded gazetteer brings its own BallTree
+    pd.DataFrame({"name": names, "lat": places[:, 0], "lon": places[:, 1]}).to_csv(tmp_path / "g.csv", index=False)
+    gazetteer = load_gazetteer(str(tmp_path / "g.csv"))
+    assert gazetteer[2] is not None
+    assert nearest_gazetteer_names(coords, gazetteer, max_distance_m=5000) == result
+    assert nearest_gazetteer_names([], (names, places)) == []
+
+def test_format_address_and_cache_key():
+    assert format_address("12 Main St, Riverside, Portland, Maine") == "Riverside, Portland"
+    assert format_address("Somewhere") == "Somewhere"
+    assert cache_key(45.00049, -70.00001) == "45.000,-70.000"
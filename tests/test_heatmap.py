@@ -0,0 +1,128 @@
+import math
+
+import numpy as np
+import pytest
+
+from helpers import START, line_xy, track_from_xy
+from src.heatmap import (TILE_SIZE, add_tracks, empty_heatmap, load_heatmap, lonlat_to_pixels, pixels_to_lonlat,
+                         rasterize_tracks, save_heatmap, track_keys)
+from src.load_gps import haversine_m
+from src.track_filter import MAX_SPEED_MPS
+from src.track_metrics import MAX_SEGMENT_SECONDS, METERS_PER_MILE, MOVING_SPEED_MPS
+
+ZOOM = 17
+
+def naive_rasterize(tracks, zoom):
+    """Per-track, per-segment loop over the same sampling rule."""
+    width = TILE_SIZE * 2 ** zoom
+    visits, points, pace_sum, pace_count = {}, {}, {}, {}
+
+    def add(x, y, pace, seen):
+        cell = min(max(int(y), 0), width - 1) * width + min(max(int(x), 0), width - 1)
+        points[cell] = points.get(cell, 0) + 1
+        if cell not in seen:
+            seen.add(cell)
+            visits[cell] = visits.get(cell, 0) + 1
+        if not math.isnan(pace):
+            pace_sum[cell] = pace_sum.get(cell, 0.0) + pace
+            pace_count[cell] = pace_count.get(cell, 0) + 1
+
+    for track in tracks.values():
+        x, y = lonlat_to_pixels(track["lat"], track["lon"], zoom)
+        seconds = track["time"].astype("datetime64[s]").astype(np.int64).astype(float)
+        seen = set()
+        for k in range(len(x)):
+            if k == 0:
+                add(x[0], y[0], math.nan, seen)
+                continue
+            dist = haversine_m(track["lat"][k - 1], track["lon"][k - 1], track["lat"][k], track["lon"][k])
+            dt = seconds[k] - seconds[k - 1]
+            speed = dist / dt if dt > 0 else math.nan
+            moving = 0 < dt <= MAX_SEGMENT_SECONDS and speed >= MOVING_SPEED_MPS
+            pace = METERS_PER_MILE / speed / 60.0 if moving else math.nan
+            dx, dy = x[k] - x[k - 1], y[k] - y[k - 1]
+            steps = max(math.ceil(max(abs(dx), abs(dy))), 1) if moving and speed <= MAX_SPEED_MPS else 1
+            for s in range(1, steps + 1):
+                add(x[k - 1] + s / steps * dx, y[k - 1] + s / steps * dy, pace, seen)
+    return visits, points, pace_sum, pace_count
+
+def _tracks():
+    rng = np.random.default_rng(4)
+    tracks = {}
+    for k in range(6):
+        x, y = line_xy(800, spacing_m=float(rng.uniform(2, 12)), offset=rng.normal(0, 30, 2),
+                       angle=float(rng.uniform(0, np.pi)))
+        times = START + np.cumsum(rng.integers(1, 5, len(x)))
+        times[len(x) // 2:] += 120  # a pause longer than MAX_SEGMENT_SECONDS
+        tracks[f"t{k}.gpx"] = track_from_xy(x, y, times=times)
+    x, y = line_xy(300)
+    tracks["standing.gpx"] = track_from_xy(np.zeros(30), np.zeros(30))
+    tracks["one_point.gpx"] = track_from_xy(x[:1], y[:1])
+    return tracks
+
+def test_rasterize_matches_naive_loop():
+    tracks = _tracks()
+    heatmap = rasterize_tracks(tracks, ZOOM)
+    visits, points, pace_sum, pace_count = naive_rasterize(tracks, ZOOM)
+    cells = np.array(sorted(points))
+    np.testing.assert_array_equal(heatmap["cells"], cells)
+    np.testing.assert_array_equal(heatmap["visits"], [visits[c] for c in cells])
+    np.testing.assert_array_equal(heatmap["points"], [points[c] for c in cells])
+    np.testing.assert_array_equal(heatmap["pace_count"], [pace_count.get(c, 0) for c in cells])
+    np.testing.assert_allclose(heatmap["pace_sum"], [pace_sum.get(c, 0.0) for c in cells])
+    assert heatmap["visits"].max() > 1
+
+def test_moving_segments_are_drawn_without_gaps():
+    x, y = line_xy(500, spacing_m=25.0)
+    heatmap = rasterize_tracks({"a.gpx": track_from_xy(x, y, step_s=5)}, ZOOM)
+    width = TILE_SIZE * 2 ** ZOOM
+    px = np.sort(heatmap["cells"] % width)
+    assert np.diff(px).max() <= 1
+
+def test_incremental_add_equals_full_build(tmp_path):
+    tracks = _tracks()
+    names = list(tracks)
+    full = rasterize_tracks(tracks, ZOOM)
+    first, _ = add_tracks(empty_heatmap(ZOOM), {name: tracks[name] for name in names[:3]})
+    path = str(tmp_path / "heatmap.npz")
+    save_heatmap(path, first)
+    merged, tiles = add_tracks(load_heatmap(path), tracks)
+    for key in ("cells", "visits", "points", "pace_count"):
+        np.testing.assert_array_equal(merged[key], full[key])
+    np.testing.assert_allclose(merged["pace_sum"], full["pace_sum"])
+    assert sorted(merged["tracks"].tolist()) == sorted(names)
+    assert tiles
+
+    same, tiles = add_tracks(merged, tracks)
+    assert same is merged and tiles == []
+
+@pytest.mark.parametrize("lat, lon", [(45.0, -70.0), (-33.9, 151.2), (0.0, 0.0)])
+def test_pixel_round_trip(lat, lon):
+    x, y = lonlat_to_pixels(np.array([lat]), np.array([lon]), ZOOM)
+    back_lat, back_lon = pixels_to_lonlat(x, y, ZOOM)
+    np.testing.assert_allclose([back_lat[0], back_lon[0]], [lat, lon], atol=1e-9)
+
+def test_removed_or_changed_tracks_rebuild_the_heatmap():
+    tracks = _tracks()
+    names = list(tracks)
+    keys = [f"{name}|1|100" for name in names]
+    heatmap, _ = add_tracks(empty_heatmap(ZOOM, {"zoom": ZOOM}), tracks, keys)
+
+    # One activity dropped (deleted or a duplicate): rebuilt without it
+    remaining = {name: tracks[name] for name in names[1:]}
+    rebuilt, tiles = add_tracks(heatmap, remaining, keys[1:])
+    assert tiles is None
+    np.testing.assert_array_equal(rebuilt["visits"], rasterize_tracks(remaining, ZOOM)["visits"])
+    assert rebuilt["tracks"].tolist() == keys[1:] and rebuilt["settings"] == {"zoom": ZOOM}
+
+    # One file edited: same name, new key
+    edited = dict(tracks, **{names[0]: tracks[names[1]]})
+    rebuilt, tiles = add_tracks(heatmap, edited, [f"{names[0]}|2|90"] + keys[1:])
+    assert tiles is None
+    np.testing.assert_array_equal(rebuilt["points"], rasterize_tracks(edited, ZOOM)["points"])
+
+def test_track_keys(tmp_path):
+    (tmp_path / "a.gpx").write_text("<gpx/>", encoding="utf-8")
+    key, missing = track_keys(str(tmp_path), ["a.gpx", "gone.gpx"])
+    assert key.startswith("a.gpx|") and key.endswith("|6")
+    assert missing == "gone.gpx"
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.sparse import csr_matrix
+
+from src.incremental import (assign_from_graph, assign_to_clusters, changed_routes, load_state, save_state,
+                             stale_tracks, update_route_stats)
+
+def full_dbscan(points, eps):
+    from sklearn.cluster import DBSCAN
+
+    return DBSCAN(eps=eps, min_samples=1).fit(points).labels_
+
+def same_partition(a, b):
+    """Labels a and b group the items the same way (cluster IDs may differ)."""
+    pairs = pd.DataFrame({"a": a, "b": b}).drop_duplicates()
+    return not pairs["a"].duplicated().any() and not pairs["b"].duplicated().any()
+
+@pytest.mark.parametrize("seed", range(8))
+def test_incremental_assignment_equals_full_dbscan(seed):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, 100, size=(120, 2))
+    eps = 6.0
+    n_known = int(rng.integers(30, 110))
+    known_labels = full_dbscan(points[:n_known], eps)
+
+    labels, new_labels = assign_to_clusters(points[n_known:], points[:n_known], known_labels, eps)
+    incremental = np.concatenate([labels, new_labels])
+    assert same_partition(incremental, full_dbscan(points, eps))
+    # Unmerged known clusters keep their IDs; merged ones take the lowest
+    for cluster in np.unique(known_labels):
+        assert np.all(labels[known_labels == cluster] <= cluster)
+
+def test_new_track_bridging_two_routes_merges_them(capsys):
+    known_labels = np.array([0, 0, 1, 2])
+    # New track 0 is near known tracks 1 (route 0) and 2 (route 1); new
+    # track 1 is near new track 0 only (zero distance, still an edge);
+    # new track 2 is alone
+    graph = csr_matrix((np.array([10.0, 20.0, 0.0, 0.0]), (np.array([0, 0, 0, 1]), np.array([1, 2, 5, 4]))),
+                       shape=(3, 7))
+    labels, new_labels = assign_from_graph(graph, known_labels, 4)
+    assert labels.tolist() == [0, 0, 0, 2]
+    assert new_labels.tolist() == [0, 0, 3]
+    assert "merged 1 routes" in capsys.readouterr().out
+
+def test_no_new_tracks():
+    labels, new_labels = assign_from_graph(csr_matrix((0, 3)), np.array([0, 1, 1]), 3)
+    assert labels.tolist() == [0, 1, 1] and len(new_labels) == 0
+
+def test_first_tracks_without_known_clusters():
+    graph = csr_matrix((np.ones(2), (np.array([0, 1]), np.array([1, 0]))), shape=(3, 3))
+    labels, new_labels = assign_from_graph(graph, np.array([], dtype=int), 0)
+    assert len(labels) == 0 and new_labels.tolist() == [0, 0, 1]
+
+def _activities(routes):
+    return pd.DataFrame({"Activity ID": list(routes), "RouteID": list(routes.values()),
+                         "Average Speed": 3.0, "Average Grade Adjusted Pace": 3.0, "Elevation Gain": 10.0,
+                         "Relative Effort": 20.0, "Distance": 5.0})
+
+def test_changed_routes():
+    previous = {1: 0, 2: 0, 3: 1, 4: 2}
+    current = {1: 0, 2: 3, 4: 2, 5: 2}
+    # 2 moved from 0 to 3, 3 is gone from route 1, 5 is new on route 2
+    assert changed_routes(previous, current) == {0, 1, 2, 3}
+    assert changed_routes(previous, previous) == set()
+
+def test_stats_drop_routes_without_activities():
+    from src.route_analysis import compute_route_stats
+
+    previous = {1: 0, 2: 0, 3: 1, 4: 2}
+    route_stats = compute_route_stats(_activities(previous))
+    current = {1: 0, 2: 0, 4: 2, 5: 2}  # activity 3 was deleted
+    df = _activities(current)
+    updated = update_route_stats(route_stats, df, changed_routes(previous, current))
+    pd.testing.assert_frame_equal(updated, compute_route_stats(df))
+    assert update_route_stats(route_stats, _activities({1: 0, 2: 0}), []).RouteID.tolist() == [0]
+
+def test_state_round_trip(tmp_path):
+    frame = {"origin": np.zeros(2), "shape_mean": np.zeros(4), "components": np.eye(4)}
+    stats = pd.DataFrame({"RouteID": [0, 1], "Distance_count": [2, 1]})
+    save_state(str(tmp_path), ["a.gpx", "b.gpx"], np.zeros((2, 4)), [0, 1], 200.0, frame, stats,
+               {11: 0, 12: 1}, settings={"route_metric": "frechet"}, keys=["a.gpx|1|10", "b.gpx|2|20"])
+    state = load_state(str(tmp_path))
+    assert state["ids"] == ["a.gpx", "b.gpx"] and state["eps"] == 200.0
+    assert state["keys"] == ["a.gpx|1|10", "b.gpx|2|20"]
+    assert state["stats_routes"] == {11: 0, 12: 1}
+    assert state["settings"] == {"route_metric": "frechet"}
+    pd.testing.assert_frame_equal(state["route_stats"], stats)
+
+def test_stale_tracks_take_their_whole_route_along():
+    state = {"ids": ["a", "b", "c", "d", "e"], "labels": np.array([0, 0, 1, -1, 2]),
+             "keys": ["a1", "b1", "c1", "d1", "e1"]}
+    changed, stale = stale_tracks(state, {"a": "a2", "b": "b1", "c": "c1", "d": "d2", "e": "e1"})
+    assert changed == {"a", "d"}
+    assert stale.tolist() == [True, True, False, True, False]
+    assert not stale_tracks(state, dict(zip(state["ids"], state["keys"])))[1].any()
+
+def test_edited_gpx_file_is_clustered_again(tmp_path, capsys):
+    import os
+    import shutil
+
+    from src.pipeline import Pipeline
+    from src.synthetic import generate_export
+
+    export = generate_export(str(tmp_path / "export"), n_activities=40, seed=5)
+    options = dict(csv_path=export["csv_path"], gps_folder=export["gps_folder"], output_dir=str(tmp_path / "out"),
+                   cache_dir=str(tmp_path / "cache"), geocode_offline=True, gazetteer_path=None,
+                   drop_duplicates=False)
+    Pipeline(**options).run("stats")
+
+    # Re-export one run under its old name with another route's track
+    truth = pd.read_csv(export["truth_path"])
+    edited = truth.loc[truth["route"] == truth["route"].iloc[0], "filename"].iloc[0]
+    other = truth.loc[truth["route"] != truth["route"].iloc[0], "filename"].iloc[0]
+    path = os.path.join(export["gps_folder"], edited)
+    shutil.copyfile(os.path.join(export["gps_folder"], other), path)
+    mtime = os.stat(path).st_mtime_ns + 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+    capsys.readouterr()
+
+    incremental = Pipeline(**options)
+    incremental.run("stats")
+    assert "1 GPS files changed since the saved state" in capsys.readouterr().out
+    full = Pipeline(**options, full_recluster=True)
+    full.run("cluster")
+
+    route_map = incremental.results["cluster"]["route_map"]
+    assert route_map[edited] == route_map[other]
+    ids = sorted(route_map)
+    assert same_partition([route_map[i] for i in ids], [full.results["cluster"]["route_map"][i] for i in ids])
+
+def test_changing_eps_invalidates_the_saved_state(tmp_path):
+    import json
+
+    from src.pipeline import Pipeline
+
+    settings = Pipeline(cluster_eps=(200, 300)).settings
+    # Saved as JSON: a reloaded state has to compare equal to the live one
+    assert json.loads(json.dumps(settings)) == settings
+    assert Pipeline(cluster_eps=(150, 300)).settings != settings
+    assert Pipeline().settings == settings
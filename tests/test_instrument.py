@@ -0,0 +1,74 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+from src import instrument
+
+@pytest.fixture(autouse=True)
+def disabled_afterwards():
+    yield
+    instrument.disable()
+
+@instrument.instrumented("test.work", items=len)
+def work(n):
+    time.sleep(0.005)
+    return list(range(n))
+
+def test_disabled_mode_records_nothing(tmp_path):
+    assert not instrument.is_enabled()
+    with instrument.span("ignored", items=5) as s:
+        s.items = 7
+    assert work(3) == [0, 1, 2]
+    assert instrument.records() == [] and instrument.disable() == []
+    assert instrument.summary_table().splitlines()[1:] == []
+
+    instrument.enable(log_path=str(tmp_path / "timings.jsonl"))
+    instrument.disable()
+    with instrument.span("after"):
+        work(1)
+    assert instrument.records() == []
+    assert (tmp_path / "timings.jsonl").read_text() == ""
+
+def test_nested_spans_record_parents_totals_and_items(tmp_path):
+    log_path = tmp_path / "timings.jsonl"
+    instrument.enable(log_path=str(log_path), trace_memory=True)
+    with instrument.span("outer") as outer:
+        with instrument.span("inner", items=2) as inner:
+            block = np.ones(2 ** 20)  # 8 MB
+            inner.items += 1
+        work(4)
+        work(6)
+        outer.items = 10
+        del block
+    with pytest.raises(ValueError):
+        with instrument.span("failing"):
+            raise ValueError("boom")
+    records = instrument.disable()
+
+    by_name = {}
+    for record in records:
+        by_name.setdefault(record["name"], []).append(record)
+    assert [r["name"] for r in records] == ["inner", "test.work", "test.work", "outer", "failing"]
+    (outer,), (inner,), (failing,) = by_name["outer"], by_name["inner"], by_name["failing"]
+    assert outer["parent"] is None and outer["depth"] == 0
+    assert inner["parent"] == "outer" and inner["depth"] == 1
+    assert all(r["parent"] == "outer" and r["depth"] == 1 for r in by_name["test.work"])
+    assert [r["items"] for r in by_name["test.work"]] == [4, 6]
+    assert inner["items"] == 3 and outer["items"] == 10
+    assert failing["error"] == "ValueError" and outer["error"] is None
+    # A parent spans its children: time and peak memory
+    assert outer["wall_s"] >= inner["wall_s"] + sum(r["wall_s"] for r in by_name["test.work"]) - 1e-3
+    assert inner["peak_alloc_mb"] >= 7.9 and outer["peak_alloc_mb"] >= inner["peak_alloc_mb"]
+
+    logged = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert logged == records
+
+    table = instrument.summary_table(records).splitlines()
+    rows = {line.split()[0]: line.split() for line in table[1:]}
+    assert rows["test.work"][1] == "2" and rows["test.work"][-1] == "10"
+    assert rows["outer"][1] == "1" and rows["outer"][-1] == "10"
+    assert any(line.startswith("  inner") for line in table)
+    # Slowest first: outer holds everything else that ran inside it
+    assert table[1].split()[0] == "outer"
@@ -0,0 +1,70 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from src.join import build_route_key_index, join_routes, match_routes
+
+ROUTE_MAP = {
+    "activities/8083971283.gpx": 0,
+    "activities/9100000001.gpx.gz": 1,
+    "run_7000000002.gpx": 2,
+    "12345.gpx": 3,
+    "morning.gpx": 4,
+    "activities/12345.gpx": 5,
+}
+
+def naive_match(key, route_map):
+    """Per-row fallback chain: the first strategy with a hit wins, first file in order."""
+    if key is None or (isinstance(key, float) and np.isnan(key)):
+        return None, None
+    if isinstance(key, float) and key.is_integer():
+        key = int(key)
+    key = str(key).strip()
+    basename = lambda s: re.sub(r"^.*[\\/]", "", s)
+    stem = lambda s: re.sub(r"\..*$", "", basename(s))
+
+    def activity_id(s):
+        runs = re.findall(r"\d+", stem(s))
+        return max(runs, key=len) if runs else None
+
+    strategies = [
+        ("exact", lambda f: f == key),
+        ("gpx_extension", lambda f: f == key + ".gpx"),
+        ("basename", lambda f: basename(f) == basename(key)),
+        ("stem", lambda f: stem(f) == stem(key)),
+        ("activity_id", lambda f: activity_id(key) is not None and activity_id(f) == activity_id(key)),
+    ]
+    for name, hit in strategies:
+        for filename in route_map:
+            if hit(filename):
+                return filename, name
+    return None, None
+
+KEYS = ["activities/8083971283.gpx", "12345", 9100000001, 9100000001.0, "7000000002", "morning.gpx",
+        "other/morning.gpx", "  morning.gpx ", "nothing", None, np.nan, "export_8083971283.fit.gz"]
+
+def test_match_routes_matches_naive_fallback_chain():
+    result = match_routes(pd.Series(KEYS, dtype=object), ROUTE_MAP)
+    for row, key in enumerate(KEYS):
+        filename, strategy = naive_match(key, ROUTE_MAP)
+        got = result.iloc[row]
+        if filename is None:
+            assert pd.isna(got["GPS_Filename"]) and pd.isna(got["RouteMatch"]) and np.isnan(got["GPS_RouteID"]), key
+        else:
+            assert (got["GPS_Filename"], got["RouteMatch"], got["GPS_RouteID"]) == \
+                (filename, strategy, float(ROUTE_MAP[filename])), key
+
+def test_numeric_ids_with_missing_values():
+    keys = pd.Series([8083971283, np.nan, 12345], dtype=float)
+    result = match_routes(keys, ROUTE_MAP, build_route_key_index(ROUTE_MAP))
+    assert result["GPS_Filename"].tolist()[::2] == ["activities/8083971283.gpx", "12345.gpx"]
+    assert pd.isna(result["GPS_Filename"].iloc[1])
+
+def test_join_falls_back_to_filename_column():
+    df = pd.DataFrame({"Activity ID": [8083971283, 555, np.nan],
+                       "Filename": ["x.gpx", "activities/morning.gpx", "run_7000000002.gpx"]})
+    joined = join_routes(df, ROUTE_MAP)
+    assert joined["GPS_RouteID"].tolist() == [0.0, 4.0, 2.0]
+    assert joined["RouteMatch"].tolist() == ["Activity ID:stem", "Filename:basename", "Filename:exact"]
+    assert list(joined.columns[:2]) == ["Activity ID", "Filename"]
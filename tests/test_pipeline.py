@@ -0,0 +1,63 @@
+import pytest
+
+from src import instrument
+from src.pipeline import DEPENDENCIES, Pipeline
+from src.synthetic import generate_export
+
+@pytest.fixture(autouse=True)
+def disabled_afterwards():
+    yield
+    instrument.disable()
+
+@pytest.fixture(scope="module")
+def export(tmp_path_factory):
+    return generate_export(str(tmp_path_factory.mktemp("export")), n_activities=32, seed=7)
+
+def _pipeline(export, tmp_path):
+    return Pipeline(csv_path=export["csv_path"], gps_folder=export["gps_folder"], output_dir=str(tmp_path / "out"),
+                    cache_dir=str(tmp_path / "cache"), geocode_offline=True, gazetteer_path=None)
+
+def _stages_run(records):
+    return [r["name"][len("stage."):] for r in records if r["name"].startswith("stage.")]
+
+def _upstream(stage):
+    stages = {stage}
+    for dependency in DEPENDENCIES[stage]:
+        stages |= _upstream(dependency)
+    return stages
+
+def test_a_stage_runs_its_dependencies_once(export, tmp_path):
+    pipeline = _pipeline(export, tmp_path)
+    instrument.enable()
+    pipeline.run("join")
+    assert set(pipeline.results) == _upstream("join")
+    assert "index" not in pipeline.results and "stats" not in pipeline.results
+
+    stats = pipeline.run("stats")
+    ran = _stages_run(instrument.disable())
+    # Every stage ran exactly once, after the stages it depends on
+    assert sorted(ran) == sorted(_upstream("stats"))
+    for stage in ran:
+        assert all(ran.index(dependency) < ran.index(stage) for dependency in DEPENDENCIES[stage])
+    assert stats is not None and len(stats["route_stats"]) > 0
+
+def test_cached_results_are_reused_until_invalidated(export, tmp_path):
+    pipeline = _pipeline(export, tmp_path)
+    stats = pipeline.run("stats")
+    loaded, vectorized = pipeline.results["load"], pipeline.results["vectorize"]
+
+    instrument.enable()
+    assert pipeline.run("stats") is stats
+    assert pipeline.run("cluster") is pipeline.results["cluster"]
+    assert _stages_run(instrument.disable()) == []
+
+    pipeline.invalidate("cluster")
+    assert not {"cluster", "index", "label", "join", "stats", "plot", "export"} & set(pipeline.results)
+    instrument.enable()
+    pipeline.run("stats")
+    assert sorted(_stages_run(instrument.disable())) == ["cluster", "join", "stats"]
+    assert pipeline.results["load"] is loaded and pipeline.results["vectorize"] is vectorized
+
+def test_unknown_stage():
+    with pytest.raises(ValueError, match="Unknown stage"):
+        Pipeline().run("nonsense")
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from src.plots import render_all_plots
+from src.route_analysis import compute_route_stats
+
+def _activities(rng, n=30):
+    return pd.DataFrame({
+        "Activity ID": np.arange(n),
+        "RouteID": rng.choice([0, 1, 2], size=n),
+        "Activity Date": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.uniform(0, 180, n), unit="D"),
+        "Average Speed": rng.uniform(2.5, 4.5, n),
+        "Average Grade Adjusted Pace": rng.uniform(2.5, 4.5, n),
+        "Elevation Gain": rng.uniform(0, 120, n),
+        "Relative Effort": rng.uniform(10, 90, n),
+        "Distance": rng.uniform(3, 10, n),
+        "GPS_Filename": [f"{i}.gpx" for i in range(n)],
+    })
+
+def test_render_all_plots_writes_every_chart(tmp_path):
+    activities = _activities(np.random.default_rng(0))
+    splits = pd.DataFrame({
+        "GPS_Filename": np.repeat(activities["GPS_Filename"], 3).to_numpy(),
+        "Split": np.tile([1, 2, 3], len(activities)),
+        "Split_Pace_min_per_mile": np.random.default_rng(1).uniform(6.5, 9.5, 3 * len(activities)),
+    })
+    paths = render_all_plots(compute_route_stats(activities), activities, splits, route_names={0: "Riverside"},
+                             output_dir=str(tmp_path), formats=("png", "svg"))
+
+    expected = {tmp_path / f"{stem}.{fmt}" for stem in ("Fastest", "Hardest", "consistent") for fmt in ("png", "svg")}
+    expected |= {tmp_path / "routes" / f"route_{r}.{fmt}" for r in range(3) for fmt in ("png", "svg")}
+    assert {tmp_path / p for p in paths} == expected
+    for path in expected:
+        assert path.stat().st_size > 0
+        if path.suffix == ".png":
+            assert path.read_bytes()[:8] == b"\x89PNG\r\n\x1a\n"
+
+def test_nothing_to_plot(tmp_path):
+    assert render_all_plots(pd.DataFrame(), output_dir=str(tmp_path / "graphs")) == []
+    assert not (tmp_path / "graphs").exists()
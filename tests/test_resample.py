@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from helpers import meters_to_latlon, track_from_xy
+from src.load_gps import haversine_m, resample_track, resample_track_by_distance, vectorize_tracks
+
+def naive_resample_by_distance(coords, n_points):
+    """Walk the track segment by segment to each target distance."""
+    steps = [haversine_m(*coords[k], *coords[k + 1]) for k in range(len(coords) - 1)]
+    total = sum(steps)
+    result = []
+    for target in np.linspace(0, total, n_points):
+        walked = 0.0
+        for k, step in enumerate(steps):
+            if step > 0 and walked + step >= target:
+                t = (target - walked) / step
+                result.append(coords[k] + t * (coords[k + 1] - coords[k]))
+                break
+            walked += step
+        else:
+            result.append(coords[-1])
+    return np.array(result)
+
+def _coords(x, y):
+    return np.column_stack(meters_to_latlon(x, y))
+
+def test_matches_naive_walk():
+    rng = np.random.default_rng(3)
+    coords = _coords(np.cumsum(rng.uniform(0, 40, 80)), np.cumsum(rng.normal(0, 20, 80)))
+    np.testing.assert_allclose(resample_track_by_distance(coords, 37), naive_resample_by_distance(coords, 37),
+                               atol=1e-9)
+
+def test_points_are_evenly_spaced_and_keep_the_ends():
+    x = np.concatenate((np.arange(0, 500, 2.0), np.arange(500, 1500, 25.0)))
+    coords = _coords(x, np.zeros_like(x))
+    resampled = resample_track_by_distance(coords, 11)
+    spacing = haversine_m(resampled[:-1, 0], resampled[:-1, 1], resampled[1:, 0], resampled[1:, 1])
+    np.testing.assert_allclose(spacing, spacing.mean(), rtol=1e-6)
+    np.testing.assert_allclose(resampled[[0, -1]], coords[[0, -1]])
+
+def test_pauses_and_recording_rate_do_not_change_the_result():
+    x = np.arange(0, 1000, 10.0)
+    coords = _coords(x, np.sqrt(x))
+    paused = np.concatenate((coords[:40], np.repeat(coords[40:41], 30, axis=0), coords[40:]))
+    dense = _coords(np.arange(0, 990.5, 1.0), np.sqrt(np.arange(0, 990.5, 1.0)))
+    expected = resample_track_by_distance(coords, 20)
+    np.testing.assert_allclose(resample_track_by_distance(paused, 20), expected, atol=1e-12)
+    # The dense track follows the same curve more closely: within a meter or so
+    np.testing.assert_allclose(resample_track_by_distance(dense, 20), expected, atol=2e-5)
+    # Index resampling, in contrast, stalls during the pause
+    assert not np.allclose(resample_track(paused, 20), resample_track(coords, 20))
+
+def test_degenerate_tracks():
+    still = _coords(np.zeros(5), np.zeros(5))
+    assert resample_track_by_distance(still, 4).shape == (4, 2)
+    assert len(resample_track_by_distance(still[:1], 4)) == 1
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_vectorize_tracks_interleaves_lat_lon(workers):
+    tracks = {"a.gpx": track_from_xy(np.arange(0, 300, 3.0), np.zeros(100)),
+              "short.gpx": track_from_xy(np.zeros(1), np.zeros(1)),
+              "b.gpx": track_from_xy(np.zeros(100), np.arange(0, 300, 3.0))}
+    ids, vectors = vectorize_tracks(tracks, n_points=10, workers=workers, method="distance")
+    assert ids == ["a.gpx", "b.gpx"]
+    coords = np.column_stack((tracks["b.gpx"]["lat"], tracks["b.gpx"]["lon"]))
+    np.testing.assert_allclose(vectors[1].reshape(10, 2), resample_track_by_distance(coords, 10))
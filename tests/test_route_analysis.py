@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.route_analysis import compute_route_form, compute_route_periods, pace_min_per_mile
+
+AS_OF = pd.Timestamp("2023-06-30 18:00:00")
+
+def _activities(rng, n=300):
+    dates = AS_OF - pd.to_timedelta(rng.uniform(-20, 500, n), unit="D").round("s")
+    df = pd.DataFrame({
+        "RouteID": rng.choice([0, 1, 2, 3], size=n, p=(0.5, 0.3, 0.15, 0.05)),
+        "Activity Date": dates,
+        "Average Speed": rng.uniform(2.5, 4.5, n),
+        "GAP_min_per_mile": rng.uniform(6.5, 10.0, n),
+    })
+    df.loc[rng.random(n) < 0.1, "GAP_min_per_mile"] = np.nan
+    # Runs exactly on the window bounds: as_of - 28 days is out, one second later is in
+    edges = pd.DataFrame({
+        "RouteID": [0, 0, 0, 4],
+        "Activity Date": [AS_OF - pd.Timedelta(days=28), AS_OF - pd.Timedelta(days=28) + pd.Timedelta(seconds=1),
+                          AS_OF, AS_OF - pd.Timedelta(days=3)],
+        "Average Speed": [3.0, 3.5, 4.0, 3.2],
+        "GAP_min_per_mile": [8.0, 7.5, 7.0, 8.2],
+    })
+    return pd.concat([df, edges], ignore_index=True)
+
+def naive_form(df, as_of, weeks=(4, 12, 52)):
+    """Plain date filters per route and window."""
+    df = df.assign(Pace_min_per_mile=pace_min_per_mile(df["Average Speed"]))
+    rows = {}
+    for route, runs in df.groupby("RouteID"):
+        runs = runs[runs["Activity Date"] <= as_of]
+        row = {"Last_Run": runs["Activity Date"].max() if len(runs) else pd.NaT}
+        for label, width in [(f"{w}w", pd.Timedelta(weeks=w)) for w in weeks] + [("all", None)]:
+            window = runs if width is None else runs[runs["Activity Date"] > as_of - width]
+            for metric in ("Pace_min_per_mile", "GAP_min_per_mile"):
+                present = window.dropna(subset=[metric])
+                y = present[metric].to_numpy()
+                x = ((present["Activity Date"] - as_of) / pd.Timedelta(days=1)).to_numpy()
+                trend = np.nan
+                if len(y) >= 2 and np.ptp(x) > 0:
+                    trend = np.polyfit(x, y, 1)[0] * 7
+                row[f"{metric}_{label}_count"] = len(y)
+                row[f"{metric}_{label}_mean"] = y.mean() if len(y) else np.nan
+                row[f"{metric}_{label}_std"] = y.std(ddof=1) if len(y) >= 2 else np.nan
+                row[f"{metric}_{label}_best"] = y.min() if len(y) else np.nan
+                row[f"{metric}_{label}_trend"] = trend
+        rows[route] = row
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+@pytest.mark.parametrize("as_of", [None, AS_OF, AS_OF - pd.Timedelta(days=200), pd.Timestamp("2020-01-01"),
+                                   pd.Timestamp("2030-01-01")])
+def test_route_form_matches_date_filters(as_of):
+    df = _activities(np.random.default_rng(1))
+    form = compute_route_form(df, as_of=as_of)
+    expected = naive_form(df, df["Activity Date"].max() if as_of is None else as_of)
+
+    assert form.index.tolist() == expected.index.tolist()
+    assert (form["Last_Run"].isna() == expected["Last_Run"].isna()).all()
+    known = expected["Last_Run"].notna()
+    assert (pd.to_datetime(form.loc[known, "Last_Run"]) == expected.loc[known, "Last_Run"]).all()
+    for column in expected.columns.drop("Last_Run"):
+        # Rounded to 2 (trend: 3) decimals in compute_route_form
+        tolerance = 1.1e-3 if column.endswith("_trend") else 1.1e-2
+        np.testing.assert_allclose(form[column].astype(float), expected[column].astype(float),
+                                   atol=tolerance, rtol=0, err_msg=column)
+
+def test_route_form_window_bounds_and_single_run_routes():
+    df = _activities(np.random.default_rng(2))
+    form = compute_route_form(df, as_of=AS_OF)
+    in_4w = df[(df["RouteID"] == 0) & (df["Activity Date"] > AS_OF - pd.Timedelta(days=28))
+               & (df["Activity Date"] <= AS_OF)]
+    assert form.loc[0, "Pace_min_per_mile_4w_count"] == len(in_4w)
+    # Route 4 has one run: a count and mean, but no spread or trend
+    assert form.loc[4, "GAP_min_per_mile_all_count"] == 1
+    assert form.loc[4, "GAP_min_per_mile_all_mean"] == 8.2
+    assert np.isnan(form.loc[4, "GAP_min_per_mile_all_std"]) and np.isnan(form.loc[4, "GAP_min_per_mile_all_trend"])
+
+    before = compute_route_form(df, as_of="2000-01-01")
+    assert before["Last_Run"].isna().all() and (before["Pace_min_per_mile_all_count"] == 0).all()
+
+SEASON_OF_MONTH = {12: "Winter", 1: "Winter", 2: "Winter", 3: "Spring", 4: "Spring", 5: "Spring",
+                   6: "Summer", 7: "Summer", 8: "Summer", 9: "Autumn", 10: "Autumn", 11: "Autumn"}
+
+@pytest.mark.parametrize("period", ["season", "block"])
+def test_route_periods_match_a_loop(period):
+    df = _activities(np.random.default_rng(3))
+    periods = compute_route_periods(df, period, block_weeks=4)
+
+    first_monday = df["Activity Date"].min().normalize()
+    first_monday -= pd.Timedelta(days=first_monday.weekday())
+    expected = {}
+    for _, run in df.iterrows():
+        date = run["Activity Date"]
+        if period == "season":
+            label = f"{date.year + (date.month == 12)} {SEASON_OF_MONTH[date.month]}"
+        else:
+            label = (first_monday + (date - first_monday) // pd.Timedelta(weeks=4) * pd.Timedelta(weeks=4))
+            label = label.strftime("%Y-%m-%d")
+        expected.setdefault((run["RouteID"], label), []).append(run)
+
+    assert len(periods) == len(expected)
+    for _, row in periods.iterrows():
+        runs = pd.DataFrame(expected[(row["RouteID"], row["Period"])])
+        assert row["Period_Type"] == period
+        assert row["Period_Start"] == runs["Activity Date"].min().normalize()
+        for metric, values in (("Pace_min_per_mile", pace_min_per_mile(runs["Average Speed"])),
+                               ("GAP_min_per_mile", runs["GAP_min_per_mile"].astype(float))):
+            values = values.dropna()
+            assert row[f"{metric}_count"] == len(values)
+            if len(values):
+                assert row[f"{metric}_mean"] == pytest.approx(values.mean(), abs=0.0051)
+                assert row[f"{metric}_median"] == pytest.approx(values.median(), abs=0.0051)
+                assert row[f"{metric}_best"] == pytest.approx(values.min(), abs=0.0051)
+    # Sorted by route, then by period start
+    assert periods.equals(periods.sort_values(["RouteID", "Period_Start"], kind="stable", ignore_index=True))
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from helpers import line_xy, track_from_xy
+from src.clustering import cluster_routes_by_similarity, fit_route_frame
+from src.load_gps import vectorize_tracks
+from src.route_index import (NEW_ROUTE, build_route_index, load_route_index, match_track, match_tracks,
+                             save_route_index)
+
+EPS = 200.0
+
+def _tracks():
+    """
+    Route A is a chain of parallel runs 150 m apart: neighbours are within
+    eps, but the outer runs are 450 m apart, farther than eps from the
+    middle of the chain. Route B runs parallel 350 m beyond A's last run,
+    route C is an L-shaped run elsewhere, and D a lone run.
+    """
+    tracks = {}
+    for k, north in enumerate((0, 150, 300, 450)):
+        tracks[f"a{k}.gpx"] = track_from_xy(*line_xy(2000, offset=(0, north)))
+    for k, north in enumerate((800, 850)):
+        tracks[f"b{k}.gpx"] = track_from_xy(*line_xy(2000, offset=(0, north)))
+    x, y = line_xy(1000, offset=(5000, 0), angle=np.pi / 2)
+    for k, shift in enumerate((0, 20, -20)):
+        xs = np.concatenate((x + shift, 5000 + shift + np.arange(3, 1000, 3.0)))
+        ys = np.concatenate((y, np.full(len(xs) - len(x), y[-1])))
+        tracks[f"c{k}.gpx"] = track_from_xy(xs, ys)
+    tracks["d0.gpx"] = track_from_xy(*line_xy(1500, offset=(-4000, -4000), angle=1.0))
+    return tracks
+
+@pytest.fixture(scope="module")
+def clustered():
+    tracks = _tracks()
+    ids, vectors = vectorize_tracks(tracks, n_points=100, method="distance")
+    frame = fit_route_frame(vectors)
+    labels = cluster_routes_by_similarity(vectors, frame, [EPS], min_samples=1)[EPS]
+    index = build_route_index(ids, vectors, labels, frame, EPS, resample="distance")
+    return tracks, ids, labels, index
+
+def test_chain_is_one_cluster(clustered):
+    _, ids, labels, _ = clustered
+    by_name = dict(zip(ids, labels))
+    assert len({by_name[f"a{k}.gpx"] for k in range(4)}) == 1
+    assert by_name["b0.gpx"] == by_name["b1.gpx"] != by_name["a0.gpx"]
+    assert len(set(labels)) == 4
+
+def test_every_clustered_track_matches_its_own_route(clustered):
+    tracks, ids, labels, index = clustered
+    matches = match_tracks(index, tracks)
+    assert matches.loc[ids, "RouteID"].tolist() == list(labels)
+    assert (matches["Distance_m"] <= EPS * 0.5).all()
+
+def test_chain_needs_more_than_one_representative(clustered):
+    _, ids, labels, index = clustered
+    route_a = dict(zip(ids, labels))["a0.gpx"]
+    position = np.flatnonzero(index["route_ids"] == route_a)[0]
+    assert (index["rep_routes"] == position).sum() >= 2
+
+def test_far_track_is_a_new_route(clustered):
+    _, _, _, index = clustered
+    far = track_from_xy(*line_xy(2000, offset=(-20000, 20000)))
+    match = match_track(index, far)
+    assert match["RouteID"] == NEW_ROUTE
+    assert match["Score"] == 0.0
+    assert match["Medoid_File"] is None
+
+def test_reversed_track_matches(clustered):
+    tracks, ids, labels, index = clustered
+    track = {field: values[::-1] for field, values in tracks["b0.gpx"].items()}
+    assert match_track(index, track)["RouteID"] == dict(zip(ids, labels))["b0.gpx"]
+
+def test_save_and_load_round_trip(clustered, tmp_path):
+    tracks, _, _, index = clustered
+    path = str(tmp_path / "route_index.npz")
+    save_route_index(path, index)
+    loaded = load_route_index(path)
+    assert loaded["threshold_m"] == index["threshold_m"]
+    assert match_tracks(loaded, tracks).equals(match_tracks(index, tracks))
+
+def test_old_index_layout_is_rebuilt(tmp_path):
+    path = str(tmp_path / "old.npz")
+    np.savez(path, settings='{"threshold_m": 200, "resample": "distance", "n_points": 100}',
+             medoids=np.zeros((1, 100, 2)))
+    assert load_route_index(path) is None
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from src.store import iter_activities_csv, parse_activity_dates, read_activities_csv
+
+CSV = """Activity ID,Activity Date,Activity Name,Activity Type,Distance,Commute
+101,"Nov 7, 2022, 8:08:00 PM",Evening Run,Run,5.1,false
+102,2022-11-08T07:30:00Z,Morning Run,Run,8.0,false
+,"Nov 9, 2022, 6:00:00 AM",Lost ID,Run,3.0,false
+104,not a date,Odd Run,Run,4.2,true
+abc,"Nov 10, 2022, 6:00:00 AM",Bad ID,Run,3.0,false
+106,"2022-11-11 18:00:00+02:00",Away Run,Run,6.0,false
+"""
+
+def test_dates_fall_back_to_mixed_formats(capsys):
+    dates = pd.Series(["Nov 7, 2022, 8:08:00 PM", "2022-11-08T07:30:00Z", "garbage", None])
+    parsed = parse_activity_dates(dates)
+    assert parsed.iloc[:2].tolist() == [pd.Timestamp("2022-11-07 20:08"), pd.Timestamp("2022-11-08 07:30")]
+    assert parsed.iloc[2:].isna().all()
+    assert "Could not parse 1 activity dates" in capsys.readouterr().out
+
+def test_csv_drops_rows_without_an_id(tmp_path, capsys):
+    path = tmp_path / "activities.csv"
+    path.write_text(CSV, encoding="utf-8")
+    df = read_activities_csv(str(path))
+    assert df["Activity ID"].tolist() == [101, 102, 104, 106]
+    assert df["Activity ID"].dtype == np.int64
+    assert df["Activity Date"].tolist()[:2] == [pd.Timestamp("2022-11-07 20:08"), pd.Timestamp("2022-11-08 07:30")]
+    assert pd.isna(df["Activity Date"].iloc[2])
+    # UTC offsets are converted to naive UTC
+    assert df["Activity Date"].iloc[3] == pd.Timestamp("2022-11-11 16:00")
+    assert "Dropped 2 activities without a valid Activity ID (data rows 3, 5)" in capsys.readouterr().out
+
+    chunks = list(iter_activities_csv(str(path), columns=["Activity ID", "Activity Date"], chunk_rows=2))
+    assert pd.concat(chunks)["Activity ID"].tolist() == [101, 102, 104, 106]
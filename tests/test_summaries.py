@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from helpers import line_xy, track_from_xy
+from src.load_gps import SUMMARY_COLUMNS, route_summaries, track_summaries
+from src.tracks import TrackCollection
+
+def _tracks(rng):
+    """Random walks of varied length; some tracks are empty, first and last among them."""
+    tracks = {}
+    for k, length in enumerate([0, 50, 1, 0, 0, 300, 2, 80, 0]):
+        if length:
+            x, y = np.cumsum(rng.normal(0, 5, (2, length)), axis=1) + rng.uniform(0, 2000, (2, 1))
+        else:
+            x, y = np.array([]), np.array([])
+        tracks[f"t{k}.gpx"] = track_from_xy(x, y)
+    return tracks
+
+def naive_route_summaries(tracks, names, labels):
+    rows = {}
+    for label in sorted(set(labels) - {-1}):
+        members = [tracks[n] for n, lab in zip(names, labels) if lab == label and n in tracks
+                   and len(tracks[n]["lat"])]
+        if not members:
+            continue
+        lat = np.concatenate([t["lat"] for t in members])
+        lon = np.concatenate([t["lon"] for t in members])
+        rows[label] = {
+            "n_tracks": len(members), "n_points": len(lat),
+            "centroid_lat": lat.mean(), "centroid_lon": lon.mean(),
+            "min_lat": lat.min(), "min_lon": lon.min(), "max_lat": lat.max(), "max_lon": lon.max(),
+            "start_lat": np.mean([t["lat"][0] for t in members]),
+            "start_lon": np.mean([t["lon"][0] for t in members]),
+            "finish_lat": np.mean([t["lat"][-1] for t in members]),
+            "finish_lon": np.mean([t["lon"][-1] for t in members]),
+        }
+    return pd.DataFrame.from_dict(rows, orient="index", columns=SUMMARY_COLUMNS).rename_axis("RouteID")
+
+@pytest.mark.parametrize("as_collection", [False, True])
+def test_route_summaries_match_a_per_track_loop(as_collection):
+    tracks = _tracks(np.random.default_rng(0))
+    data = TrackCollection.from_tracks(tracks) if as_collection else tracks
+    names = ["t7.gpx", "t0.gpx", "t1.gpx", "missing.gpx", "t2.gpx", "t3.gpx", "t5.gpx", "t6.gpx", "t8.gpx",
+             "t4.gpx"]
+    # Route 3 only has empty tracks, route 9 a missing one; t6 is noise
+    labels = [0, 0, 1, 9, 0, 3, 1, 2, -1, 3]
+
+    summary = route_summaries(data, names, labels)
+    expected = naive_route_summaries(tracks, names, labels)
+    assert summary.index.tolist() == expected.index.tolist() == [0, 1]
+    pd.testing.assert_frame_equal(summary, expected, check_dtype=False, rtol=1e-12)
+
+@pytest.mark.parametrize("as_collection", [False, True])
+def test_track_summaries_of_empty_and_missing_tracks(as_collection):
+    tracks = _tracks(np.random.default_rng(1))
+    data = TrackCollection.from_tracks(tracks) if as_collection else tracks
+    names = list(tracks) + ["missing.gpx"]
+    summaries = track_summaries(data, names)
+    for i, name in enumerate(names):
+        track = tracks.get(name)
+        if track is None or len(track["lat"]) == 0:
+            assert summaries["n_points"][i] == 0 and np.isnan(summaries["min_lat"][i])
+            continue
+        assert summaries["n_points"][i] == len(track["lat"])
+        assert summaries["sum_lon"][i] == pytest.approx(track["lon"].sum(), rel=1e-12)
+        assert summaries["max_lat"][i] == track["lat"].max() and summaries["min_lon"][i] == track["lon"].min()
+        assert summaries["start_lat"][i] == track["lat"][0] and summaries["finish_lon"][i] == track["lon"][-1]
+
+def test_no_routes():
+    x, y = line_xy(100)
+    summary = route_summaries({"a.gpx": track_from_xy(x, y)}, ["a.gpx"], [-1])
+    assert summary.empty and list(summary.columns) == SUMMARY_COLUMNS
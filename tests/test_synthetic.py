@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from src.load_gps import haversine_m, load_tracks_from_folder
+from src.synthetic import gps_noise, generate_export
+from src.track_filter import filter_tracks
+
+def test_gps_noise_keeps_its_size_but_not_its_zigzag():
+    rng = np.random.default_rng(0)
+    noise = np.stack([gps_noise(rng, 2000, noise_m=3.0) for _ in range(50)])
+    assert abs(noise.std() - 3.0) < 0.3
+    # Steps between fixes a second apart are far smaller than the error itself
+    assert np.abs(np.diff(noise, axis=1)).mean() < 1.0
+
+def test_track_length_matches_the_csv_distance(tmp_path):
+    export = generate_export(str(tmp_path), n_activities=24, seed=3)
+    activities = pd.read_csv(export["csv_path"])
+    # Spikes are removed first, as the pipeline does
+    tracks, _, _ = filter_tracks(load_tracks_from_folder(export["gps_folder"]), stationary_radius_m=None)
+
+    lat, lon = tracks.columns["lat"], tracks.columns["lon"]
+    track_idx = np.repeat(np.arange(len(tracks)), tracks.lengths)
+    same_track = track_idx[1:] == track_idx[:-1]
+    steps = haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:])[same_track]
+    length = np.bincount(track_idx[1:][same_track], steps, minlength=len(tracks))
+
+    distance = (activities.assign(GPS_Filename=activities["Filename"].str.replace("activities/", ""))
+                .set_index("GPS_Filename").loc[tracks.names, "Distance.1"].to_numpy())
+    ratio = length / distance
+    assert np.all((ratio > 0.98) & (ratio < 1.06)), ratio
@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+
+from src.load_gps import _cache_path, load_tracks_from_folder
+from src.synthetic import generate_export
+from src.tracks import TRACK_FIELDS
+
+def test_corrupt_cache_entries_are_parsed_again(tmp_path, capsys):
+    export = generate_export(str(tmp_path / "export"), n_activities=10, seed=4)
+    folder, cache_dir = export["gps_folder"], str(tmp_path / "cache")
+    parsed = load_tracks_from_folder(folder, cache_dir=cache_dir)
+    names = list(parsed)
+    assert len(names) >= 3
+
+    truncated, garbage, empty = (_cache_path(cache_dir, name) for name in names[:3])
+    with open(truncated, "r+b") as f:
+        f.truncate(os.path.getsize(truncated) // 2)
+    with open(garbage, "wb") as f:
+        f.write(b"PK\x03\x04 not a zip archive")
+    open(empty, "wb").close()
+    capsys.readouterr()
+
+    reloaded = load_tracks_from_folder(folder, cache_dir=cache_dir)
+    assert f"Reused {len(names) - 3} cached tracks, parsed 3 files" in capsys.readouterr().out
+    assert list(reloaded) == names
+    for name in names:
+        for field in TRACK_FIELDS:
+            np.testing.assert_array_equal(reloaded[name][field], parsed[name][field])
+
+    # The entries were rewritten
+    load_tracks_from_folder(folder, cache_dir=cache_dir)
+    assert f"Reused {len(names)} cached tracks, parsed 0 files" in capsys.readouterr().out
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from helpers import track_from_xy
+from src.load_gps import EARTH_RADIUS_M
+from src.track_filter import filter_tracks, simplify_points, spike_points, stationary_points
+from src.tracks import TrackCollection
+
+def naive_rdp(x, y, tolerance):
+    """Recursive Ramer–Douglas–Peucker; the first farthest point splits."""
+    keep = np.zeros(len(x), dtype=bool)
+    keep[[0, -1]] = True
+
+    def split(i, j):
+        if j - i < 2:
+            return
+        dx, dy = x[j] - x[i], y[j] - y[i]
+        best, best_k = -1.0, None
+        for k in range(i + 1, j):
+            px, py = x[k] - x[i], y[k] - y[i]
+            length_sq = dx * dx + dy * dy
+            t = min(max((px * dx + py * dy) / length_sq, 0.0), 1.0) if length_sq > 0 else 0.0
+            d = np.hypot(px - t * dx, py - t * dy)
+            if d > best:
+                best, best_k = d, k
+        if best > tolerance:
+            keep[best_k] = True
+            split(i, best_k)
+            split(best_k, j)
+
+    split(0, len(x) - 1)
+    return keep
+
+def _local(track):
+    lat, lon = track["lat"], track["lon"]
+    x = np.radians(lon - lon[0]) * np.cos(np.radians(lat[0])) * EARTH_RADIUS_M
+    y = np.radians(lat - lat[0]) * EARTH_RADIUS_M
+    return x, y
+
+@pytest.mark.parametrize("tolerance", [1.0, 5.0, 25.0])
+def test_simplify_matches_recursive_rdp(tolerance):
+    rng = np.random.default_rng(11)
+    tracks = {}
+    for k, n in enumerate((1, 2, 3, 50, 400, 0, 120)):
+        x = np.cumsum(rng.uniform(0, 10, n))
+        y = np.cumsum(rng.normal(0, 6, n))
+        tracks[f"t{k}.gpx"] = track_from_xy(x, y)
+    # A closed loop: first and last point coincide
+    angle = np.linspace(0, 2 * np.pi, 90)
+    tracks["loop.gpx"] = track_from_xy(300 * np.cos(angle), 300 * np.sin(angle))
+
+    collection = TrackCollection.from_tracks(tracks)
+    keep = simplify_points(collection, tolerance)
+    for i, name in enumerate(collection.names):
+        start, end = collection.offsets[i], collection.offsets[i + 1]
+        if end == start:
+            continue
+        expected = naive_rdp(*_local(tracks[name]), tolerance)
+        np.testing.assert_array_equal(keep[start:end], expected, err_msg=name)
+
+def test_spike_is_removed_but_fast_straight_running_is_not():
+    x = np.arange(0, 60, 3.0)
+    y = np.zeros_like(x)
+    y[10] = 200.0
+    collection = TrackCollection.from_tracks({"spike.gpx": track_from_xy(x, y),
+                                              "fast.gpx": track_from_xy(np.arange(0, 400, 20.0), np.zeros(20))})
+    spikes = spike_points(collection)
+    assert np.flatnonzero(spikes).tolist() == [10]
+
+def test_stationary_points_inside_a_pause():
+    x = np.concatenate((np.arange(0, 90, 3.0), np.full(60, 90.0), np.arange(93, 180, 3.0)))
+    collection = TrackCollection.from_tracks({"pause.gpx": track_from_xy(x, np.zeros_like(x))})
+    still = np.flatnonzero(stationary_points(collection, radius_m=5.0, window_s=10))
+    assert still.min() >= 28 and still.max() <= 90
+    assert len(still) >= 40
+
+def test_filter_report_counts_each_step():
+    x = np.arange(0, 300, 3.0)
+    track = track_from_xy(x, np.zeros_like(x))
+    track["time"][5] = track["time"][4]
+    _, shapes, report = filter_tracks({"a.gpx": track})
+    row = report.iloc[0]
+    assert row["Points"] == 100
+    assert row["Duplicates_Removed"] == 1
+    # A straight line simplifies to its two ends
+    assert row["Shape_Points"] == 2 == shapes.lengths[0]
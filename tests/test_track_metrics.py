@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from helpers import START, line_xy, track_from_xy
+from src.load_gps import haversine_m
+from src.track_metrics import (GRADE_WINDOW_M, HR_ZONE_BOUNDS, MAX_SEGMENT_SECONDS, METERS_PER_MILE,
+                               MOVING_SPEED_MPS, PACE_WINDOW_S, compute_track_metrics, minetti_cost_factor)
+
+def naive_track_metrics(track, max_hr=190):
+    """The same definitions as compute_track_metrics, one track, point by point."""
+    lat, lon = track["lat"], track["lon"]
+    n = len(lat)
+    seconds = track["time"].astype("datetime64[s]").astype(np.int64).astype(float)
+    seg_dist, seg_time = np.zeros(n), np.zeros(n)
+    for i in range(1, n):
+        seg_dist[i] = haversine_m(lat[i - 1], lon[i - 1], lat[i], lon[i])
+        dt = seconds[i] - seconds[i - 1]
+        seg_time[i] = dt if np.isfinite(dt) and dt >= 0 else 0.0
+    moving = [seg_time[i] > 0 and seg_dist[i] / seg_time[i] >= MOVING_SPEED_MPS
+              and seg_time[i] <= MAX_SEGMENT_SECONDS for i in range(n)]
+    moving_time = np.array([seg_time[i] if moving[i] else 0.0 for i in range(n)])
+    moving_dist = np.array([seg_dist[i] if moving[i] else 0.0 for i in range(n)])
+    cum_dist, cum_time = np.cumsum(seg_dist), np.cumsum(moving_time)
+
+    paces = []
+    for i in range(n):
+        b = next(j for j in range(n) if cum_time[j] >= cum_time[i] - PACE_WINDOW_S)
+        window_time, window_dist = cum_time[i] - cum_time[b], cum_dist[i] - cum_dist[b]
+        if moving[i] and window_time >= PACE_WINDOW_S / 2 and window_dist > 10:
+            paces.append(window_time / window_dist)
+    pace_cv = np.std(paces) / np.mean(paces) if len(paces) > 1 else np.nan
+
+    ele = np.array(track["ele"], dtype=float)
+    recorded = [i for i in range(n) if np.isfinite(ele[i])]
+    for i in range(n):
+        before = [j for j in recorded if j < i]
+        after = [j for j in recorded if j > i]
+        if not np.isfinite(ele[i]) and before and after:
+            a, b = before[-1], after[0]
+            t = (cum_dist[i] - cum_dist[a]) / (cum_dist[b] - cum_dist[a]) if cum_dist[b] > cum_dist[a] else 0.0
+            ele[i] = ele[a] + t * (ele[b] - ele[a])
+    adjusted = 0.0
+    for i in range(n):
+        b = next(j for j in range(n) if cum_dist[j] >= cum_dist[i] - GRADE_WINDOW_M)
+        rise = cum_dist[i] - cum_dist[b]
+        grade = (ele[i] - ele[b]) / rise if rise > 5 and np.isfinite(ele[i] - ele[b]) else 0.0
+        adjusted += moving_dist[i] * minetti_cost_factor(grade)
+
+    zones = np.zeros(5)
+    for i in range(n):
+        if np.isfinite(track["hr"][i]) and seg_time[i] <= MAX_SEGMENT_SECONDS:
+            zones[sum(float(track["hr"][i]) / max_hr >= bound for bound in HR_ZONE_BOUNDS)] += seg_time[i]
+
+    splits = {}
+    for i in range(n):
+        mile = int(cum_dist[i] // METERS_PER_MILE) + 1
+        dist, time = splits.get(mile, (0.0, 0.0))
+        splits[mile] = (dist + seg_dist[i], time + moving_time[i])
+
+    to_min_per_mile = METERS_PER_MILE / 60
+    metrics = {
+        "Track_Distance_m": seg_dist.sum(),
+        "Moving_Time_s": moving_time.sum(),
+        "Track_Pace_min_per_mile": moving_time.sum() / moving_dist.sum() * to_min_per_mile,
+        "GAP_min_per_mile": moving_time.sum() / adjusted * to_min_per_mile,
+        "Pace_CV": pace_cv,
+        **{f"HR_Z{z + 1}_s": zones[z] for z in range(5)},
+    }
+    split_rows = [(mile, dist, time) for mile, (dist, time) in sorted(splits.items())]
+    return metrics, split_rows
+
+def _tracks(rng):
+    """Hand-built runs: hilly, partly missing elevation, partly missing HR, with a pause."""
+    tracks = {}
+    x, y = line_xy(3500, spacing_m=3.0)
+    n = len(x)
+    hilly = track_from_xy(x, y, step_s=1)
+    hilly["ele"] = (20 * np.sin(np.arange(n) / 150)).astype(np.float32)
+    hilly["hr"] = rng.uniform(100, 185, n).astype(np.float32)
+    tracks["hilly.gpx"] = hilly
+
+    gaps = track_from_xy(x, y, step_s=1)
+    gaps["ele"] = (100 + 0.05 * np.arange(n)).astype(np.float32)
+    gaps["ele"][:40] = np.nan
+    gaps["ele"][300:700] = np.nan
+    gaps["ele"][-25:] = np.nan
+    tracks["gaps.gpx"] = gaps
+
+    x, y = line_xy(2000, spacing_m=2.5, angle=1.0)
+    steps = np.ones(len(x)) + rng.uniform(-0.3, 0.3, len(x))
+    steps[400] = 120  # a pause
+    paused = track_from_xy(x, y, times=START + np.cumsum(steps).astype("timedelta64[s]"))
+    paused["hr"] = rng.uniform(90, 195, len(x)).astype(np.float32)
+    paused["hr"][rng.random(len(x)) < 0.3] = np.nan
+    tracks["paused.gpx"] = paused
+    return tracks
+
+def test_metrics_match_a_per_track_loop():
+    tracks = _tracks(np.random.default_rng(0))
+    metrics, splits = compute_track_metrics(tracks)
+    metrics = metrics.set_index("GPS_Filename")
+    for name, track in tracks.items():
+        expected, expected_splits = naive_track_metrics(track)
+        for column, value in expected.items():
+            assert metrics.loc[name, column] == pytest.approx(value, rel=1e-9, abs=1e-6, nan_ok=True), (name, column)
+        got = splits[splits["GPS_Filename"] == name]
+        np.testing.assert_array_equal(got["Split"], [row[0] for row in expected_splits])
+        np.testing.assert_allclose(got["Split_Distance_m"], [row[1] for row in expected_splits])
+        np.testing.assert_allclose(got["Split_Time_s"], [row[2] for row in expected_splits])
+
+def test_missing_elevation_is_not_read_as_sea_level():
+    x, y = line_xy(2000, spacing_m=3.0)
+    flat = track_from_xy(x, y)
+    flat["ele"] = np.full(len(x), 250.0, dtype=np.float32)
+    flat["ele"][::7] = np.nan
+    flat["ele"][:30] = np.nan
+    metrics, _ = compute_track_metrics({"flat.gpx": flat})
+    row = metrics.iloc[0]
+    assert row["GAP_min_per_mile"] == pytest.approx(row["Track_Pace_min_per_mile"])
+
+def test_uphill_gap_is_faster_than_pace_and_hr_time_adds_up():
+    x, y = line_xy(1500, spacing_m=3.0)
+    climb = track_from_xy(x, y)
+    climb["ele"] = (0.05 * x).astype(np.float32)
+    climb["hr"] = np.full(len(x), 150.0, dtype=np.float32)
+    row = compute_track_metrics({"climb.gpx": climb})[0].iloc[0]
+    assert row["GAP_min_per_mile"] < row["Track_Pace_min_per_mile"]
+    # 150 / 190 = 0.79 is zone 3
+    assert row["HR_Z3_s"] == pytest.approx(len(x) - 1)
+    assert row[[f"HR_Z{z}_s" for z in (1, 2, 4, 5)]].sum() == 0
+
+def test_no_points():
+    metrics, splits = compute_track_metrics({"empty.gpx": track_from_xy(np.array([]), np.array([]))})
+    assert metrics.empty and splits.empty
+    assert isinstance(metrics, pd.DataFrame)
@@ -0,0 +1,105 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from helpers import line_xy, track_from_xy
+from src.tracks import TRACK_FIELDS, TrackCollection
+
+def _tracks():
+    """Tracks of different lengths, with an empty one in the middle and one at the end."""
+    tracks = {}
+    for k, length in enumerate([300, 0, 60, 3, 0]):
+        x, y = line_xy(length, spacing_m=3.0, offset=(100.0 * k, 0.0)) if length else (np.array([]), np.array([]))
+        track = track_from_xy(x, y)
+        track["ele"] = np.arange(len(x), dtype=np.float32) + k
+        track["hr"] = np.full(len(x), 120 + k, dtype=np.float32)
+        tracks[f"t{k}.gpx"] = track
+    return tracks
+
+def assert_same_tracks(collection, tracks):
+    assert list(collection) == list(tracks)
+    assert collection.offsets[0] == 0 and collection.offsets[-1] == collection.n_points
+    assert np.all(np.diff(collection.offsets) >= 0)
+    for name, track in tracks.items():
+        for field in TRACK_FIELDS:
+            np.testing.assert_array_equal(collection[name][field], track[field])
+
+def test_from_tracks_and_views():
+    tracks = _tracks()
+    collection = TrackCollection.from_tracks(tracks)
+    assert_same_tracks(collection, tracks)
+    assert collection.lengths.tolist() == [len(t["lat"]) for t in tracks.values()]
+    # Tracks are views into the shared columns
+    assert np.shares_memory(collection["t0.gpx"]["lat"], collection.columns["lat"])
+    assert TrackCollection.from_tracks(collection) is collection
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_round_trip(tmp_path, mmap):
+    tracks = _tracks()
+    TrackCollection.from_tracks(tracks).save(str(tmp_path / "tracks"))
+    loaded = TrackCollection.load(str(tmp_path / "tracks"), mmap=mmap)
+    assert_same_tracks(loaded, tracks)
+    assert isinstance(loaded.columns["lat"], np.memmap) == mmap
+    assert (loaded.path is not None) == mmap
+    assert loaded.columns["time"].dtype == np.dtype("datetime64[s]")
+
+    # Saving again over an existing folder replaces it
+    TrackCollection.from_tracks({"t0.gpx": tracks["t0.gpx"]}).save(str(tmp_path / "tracks"))
+    assert list(TrackCollection.load(str(tmp_path / "tracks"))) == ["t0.gpx"]
+
+def test_pickle_round_trip(tmp_path):
+    tracks = _tracks()
+    in_memory = TrackCollection.from_tracks(tracks)
+    assert_same_tracks(pickle.loads(pickle.dumps(in_memory)), tracks)
+
+    in_memory.save(str(tmp_path / "tracks"))
+    mapped = TrackCollection.load(str(tmp_path / "tracks"), fields=["lat", "lon"])
+    payload = pickle.dumps(mapped)
+    # A memory-mapped collection travels as its path, not its points
+    assert len(payload) < 1000
+    restored = pickle.loads(payload)
+    assert restored.path == mapped.path and list(restored.columns) == ["lat", "lon"]
+    np.testing.assert_array_equal(restored.columns["lat"], in_memory.columns["lat"])
+
+def test_subset_keeps_offsets_consistent():
+    tracks = _tracks()
+    collection = TrackCollection.from_tracks(tracks)
+    names = ["t3.gpx", "t1.gpx", "t0.gpx", "t4.gpx"]
+    subset = collection.subset(names)
+    assert_same_tracks(subset, {name: tracks[name] for name in names})
+    assert not np.shares_memory(subset.columns["lat"], collection.columns["lat"])
+    assert subset.n_points == len(subset.columns["lat"])
+
+    empty = collection.subset([])
+    assert len(empty) == 0 and empty.offsets.tolist() == [0] and empty.n_points == 0
+    with pytest.raises(KeyError):
+        collection.subset(["missing.gpx"])
+
+def test_compress_keeps_every_track():
+    tracks = _tracks()
+    collection = TrackCollection.from_tracks(tracks)
+    keep = collection.columns["ele"] % 2 == 0
+    compressed = collection.compress(keep)
+    expected = {}
+    for name, track in tracks.items():
+        mask = track["ele"] % 2 == 0
+        expected[name] = {field: track[field][mask] for field in TRACK_FIELDS}
+    assert_same_tracks(compressed, expected)
+
+    none = collection.compress(np.zeros(collection.n_points, dtype=bool))
+    assert list(none) == list(tracks) and none.offsets.tolist() == [0] * (len(tracks) + 1)
+
+def test_group_by_and_slice():
+    tracks = _tracks()
+    collection = TrackCollection.from_tracks(tracks)
+    names = list(tracks)
+    labels = [1, 0, 1, 2, 0]
+    groups = collection.group_by(names, labels)
+    assert sorted(groups) == [0, 1, 2]
+    for label, group in groups.items():
+        members = [name for name, lab in zip(names, labels) if lab == label]
+        assert_same_tracks(group, {name: tracks[name] for name in members})
+
+    sliced = collection.slice(1, 4)
+    assert_same_tracks(sliced, {name: tracks[name] for name in names[1:4]})